@@ -27,12 +27,27 @@ else:
 	print("certifi not available; connection will use system CA bundle")
 
 
+from app.utils.metrics import MongoCommandMetrics
+
 client_kwargs = {
 	"serverSelectionTimeoutMS": 20000,
 	"socketTimeoutMS": 20000,
+	# per-collection command latency for /metrics
+	"event_listeners": [MongoCommandMetrics()],
 }
 if ca_bundle:
 	client_kwargs.update({"tls": True, "tlsCAFile": ca_bundle})
 
 client = AsyncIOMotorClient(MONGO_URL, **client_kwargs)
 db = client[DB_NAME]
+
+# Render workers run outside the API event loop, so they use a blocking
+# pymongo client created lazily (once per process, after any fork).
+_sync_client = None
+
+def get_sync_db():
+	global _sync_client
+	if _sync_client is None:
+		from pymongo import MongoClient
+		_sync_client = MongoClient(MONGO_URL, **client_kwargs)
+	return _sync_client[DB_NAME]
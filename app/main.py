@@ -1,12 +1,26 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import auth, company, customer, admin, media, template, video_task, task, category, public, public_templates, voise_over
+from app.routes import auth, company, customer, admin, media, template, video_task, task, category, public, public_templates, voise_over, bulk_task, metrics
 from app.db.connection import db
 from app.utils.auth import hash_password
+from app.db.connection import get_sync_db
+from app.services.output_store import (
+    OUTPUT_EVICT_INTERVAL_SECONDS,
+    adopt_untracked_outputs,
+    ensure_output_indexes,
+    evict_outputs,
+)
+from app.services.tts_cache import ensure_tts_cache_indexes, evict_tts_cache
+from app.services.tts_executor import tts_executor
+from app.services.workspace import sweep_stale_workspaces
+from app.worker.queue import start_local_queue
+from fastapi.concurrency import run_in_threadpool
 import asyncio
 from fastapi.staticfiles import StaticFiles
 import os
 
+TTS_WARMUP_ON_STARTUP = os.getenv("TTS_WARMUP_ON_STARTUP", "0").lower() in ("1", "true", "yes")
+
 
 # ✅ Create app instance only once
 app = FastAPI(title="AutoVid Backend")
@@ -45,10 +59,12 @@ app.include_router(media.router)
 app.include_router(template.router)
 app.include_router(video_task.router)
 app.include_router(task.router)
+app.include_router(bulk_task.router)
 app.include_router(category.router)
 app.include_router(public.router)
 app.include_router(public_templates.router)
 app.include_router(voise_over.router)
+app.include_router(metrics.router)
 
 # ✅ Simple health check route
 @app.get("/")
@@ -70,9 +86,46 @@ async def create_super_admin():
     else:
         print("ℹ️ SuperAdmin already exists.")
 
+# ✅ Generated outputs: adopt what is already on disk, then evict by TTL,
+# per-company quota and global budget on an interval; the TTS cache keeps
+# to its own budget
+async def output_eviction_loop():
+    try:
+        await run_in_threadpool(ensure_output_indexes, get_sync_db())
+        await run_in_threadpool(ensure_tts_cache_indexes, get_sync_db())
+        adopted = await run_in_threadpool(adopt_untracked_outputs)
+        print(f"🧹 Output store tracking {adopted} existing files")
+    except Exception as e:
+        print(f"⚠️ Output store adoption failed: {e}")
+    while True:
+        try:
+            stats = await run_in_threadpool(evict_outputs)
+            stats["tts_cache_evicted"] = await run_in_threadpool(evict_tts_cache)
+            if stats["freed_bytes"] or stats["tts_cache_evicted"]:
+                print(f"🧹 Output eviction: {stats}")
+        except Exception as e:
+            print(f"⚠️ Output eviction failed: {e}")
+        await asyncio.sleep(OUTPUT_EVICT_INTERVAL_SECONDS)
+
 # ✅ Run at startup
 # main.py
 @app.on_event("startup")
 async def startup_event():
     await create_super_admin()
+    # scratch workspaces of renders killed mid-way
+    await run_in_threadpool(sweep_stale_workspaces)
+    # embedded/memory render queues recover unfinished tasks on start; broker
+    # backends re-queue tasks whose worker died (expired lease)
+    await run_in_threadpool(start_local_queue)
+    asyncio.create_task(output_eviction_loop())
+    # opt-in: load the TTS model in the background instead of on the first
+    # voiceover (torch itself is only imported by then)
+    if TTS_WARMUP_ON_STARTUP:
+        asyncio.create_task(voise_over.warmup())
     print("🚀 Application startup complete.")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # TTS pool processes would otherwise outlive a reload
+    await run_in_threadpool(tts_executor.shutdown)
@@ -6,7 +6,9 @@ class BulkTask(BaseModel):
     id: str
     template_id: str
     company_id: str
+    customer_category: Optional[str] = None
     total_customers: int
     completed_count: int = 0
+    failed_count: int = 0
     status: str  
     created_at: datetime
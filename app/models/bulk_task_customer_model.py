@@ -6,4 +6,6 @@ class BulkTaskCustomer(BaseModel):
     id: str
     bulk_task_id: str
     customer_id: str
-    video_task_id: str
+    video_task_id: Optional[str] = None
+    counted: bool = False
+    status: Optional[str] = None
@@ -7,6 +7,7 @@ class VideoTask(BaseModel):
     company_id: str
     customer_id: str
     template_id: str
+    bulk_task_id: Optional[str] = None
     status: str    
     progress: int = 0       
     output_video_url: Optional[str] = None
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from app.db.connection import db
 from app.utils.auth import require_roles
 from bson import ObjectId
+from app.services.output_store import evict_outputs, output_usage
+from app.services.tts_cache import tts_cache_usage
 
 router = APIRouter(prefix="/admin", tags=["Admin Management"])
 
@@ -45,3 +48,17 @@ async def update_admin_status(admin_id: str, data: dict, user=Depends(require_ro
         raise HTTPException(status_code=404, detail="Admin not found or no change made")
     
     return {"message": f"Admin status updated to '{new_status}'"}
+
+
+# 🟣 4. Generated output storage: usage against budget and quotas (SuperAdmin only)
+@router.get("/storage/usage")
+async def storage_usage(user=Depends(require_roles("superadmin"))):
+    usage = await run_in_threadpool(output_usage)
+    usage["tts_cache"] = await run_in_threadpool(tts_cache_usage)
+    return usage
+
+
+# 🟣 5. Run an eviction pass now instead of waiting for the next interval
+@router.post("/storage/evict")
+async def storage_evict(user=Depends(require_roles("superadmin"))):
+    return await run_in_threadpool(evict_outputs)
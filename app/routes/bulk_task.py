@@ -0,0 +1,108 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional
+from bson import ObjectId
+
+from app.db.connection import db, get_sync_db
+from app.utils.auth import require_roles
+from app.worker.bulk_jobs import (
+    bulk_task_progress,
+    create_bulk_task,
+    dispatch_next_batch,
+    resume_bulk_task,
+)
+from app.worker.queue import enqueue_render
+
+router = APIRouter(prefix="/bulk-tasks", tags=["Bulk Tasks"])
+
+
+async def _get_company(user):
+    company = await db.companies.find_one({"user_id": str(user["_id"])})
+    if not company:
+        raise HTTPException(400, "Company not found")
+    return company
+
+
+async def _get_bulk_task(bulk_task_id: str, company):
+    bulk = await db.bulk_tasks.find_one({
+        "_id": ObjectId(bulk_task_id),
+        "company_id": str(company["_id"])
+    })
+    if not bulk:
+        raise HTTPException(404, "Bulk task not found")
+    return bulk
+
+
+def _start(company_id, template_id, customer_ids, customer_category):
+    database = get_sync_db()
+    bulk_task_id = create_bulk_task(database, company_id, template_id, customer_ids, customer_category)
+    dispatch_next_batch(database, bulk_task_id, enqueue_render)
+    return bulk_task_id
+
+
+@router.post("/")
+async def create_campaign(
+    template_id: str,
+    customer_category: Optional[str] = None,
+    user=Depends(require_roles("company"))
+):
+    """Renders one template for every customer of the company (or of one customer_category)."""
+    company = await _get_company(user)
+    company_id = str(company["_id"])
+
+    template = await db.templates.find_one({
+        "_id": ObjectId(template_id),
+        "company_id": company_id
+    })
+    if not template:
+        raise HTTPException(404, "Template not found")
+
+    query = {"linked_company_id": company_id}
+    if customer_category:
+        query["customer_category"] = customer_category
+    customer_ids = [str(c["_id"]) async for c in db.customers.find(query, {"_id": 1})]
+    if not customer_ids:
+        raise HTTPException(404, "No customers match this campaign")
+
+    bulk_task_id = await run_in_threadpool(
+        _start, company_id, template_id, customer_ids, customer_category
+    )
+    return {
+        "message": "Bulk rendering queued",
+        "bulk_task_id": bulk_task_id,
+        "total_customers": len(customer_ids),
+    }
+
+
+@router.get("/")
+async def list_campaigns(user=Depends(require_roles("company"))):
+    company = await _get_company(user)
+    campaigns = []
+    async for bulk in db.bulk_tasks.find({"company_id": str(company["_id"])}).sort("created_at", -1):
+        campaigns.append({
+            "bulk_task_id": str(bulk["_id"]),
+            "template_id": bulk.get("template_id"),
+            "customer_category": bulk.get("customer_category"),
+            "status": bulk.get("status"),
+            "total_customers": bulk.get("total_customers", 0),
+            "completed_count": bulk.get("completed_count", 0),
+            "failed_count": bulk.get("failed_count", 0),
+            "created_at": bulk.get("created_at"),
+        })
+    return campaigns
+
+
+@router.get("/{bulk_task_id}")
+async def get_campaign(bulk_task_id: str, user=Depends(require_roles("company"))):
+    company = await _get_company(user)
+    bulk = await _get_bulk_task(bulk_task_id, company)
+    return await run_in_threadpool(bulk_task_progress, get_sync_db(), bulk)
+
+
+@router.post("/{bulk_task_id}/resume")
+async def resume_campaign(bulk_task_id: str, user=Depends(require_roles("company"))):
+    """Re-queues unfinished customers after a crash; finished ones are kept."""
+    company = await _get_company(user)
+    await _get_bulk_task(bulk_task_id, company)
+    result = await run_in_threadpool(resume_bulk_task, get_sync_db(), bulk_task_id, enqueue_render)
+    return {"message": "Bulk task resumed", "bulk_task_id": bulk_task_id, **result}
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
 from datetime import datetime
 from bson import ObjectId
-from app.services.storage import save_upload_file
+from app.services.storage import stream_upload
 from app.utils.auth import require_roles
 from app.db.connection import db
 
@@ -53,8 +53,9 @@ async def upload_media(
     if ext not in allowed:
         raise HTTPException(400, "Unsupported file type")
 
-    # 4. Save file
-    local_path, size = await save_upload_file(file, company_id)
+    # 4. Save file (streamed to disk, never held in memory)
+    stored = await stream_upload(file, company_id)
+    local_path, size = stored["path"], stored["size"]
 
     # 5. Create media document
     media_doc = {
@@ -67,6 +68,7 @@ async def upload_media(
         ),
         "original_name": file.filename,
         "size": size,
+        "sha256": stored["sha256"],
         "created_at": datetime.utcnow(),
         "updated_at": datetime.utcnow(),
     }
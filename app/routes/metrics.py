@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.utils.metrics import render_latest
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of this process's render, TTS, queue and DB metrics."""
+    return PlainTextResponse(render_latest(), media_type="text/plain; version=0.0.4; charset=utf-8")
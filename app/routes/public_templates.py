@@ -1,5 +1,4 @@
 from fastapi import APIRouter, HTTPException, Body
-from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
 from bson import ObjectId
 from datetime import datetime
@@ -7,7 +6,10 @@ import os
 from pymongo import ReturnDocument
 
 from app.db.connection import db
-from app.services.video_renderer import render_preview, render_image_preview
+from app.services.video_renderer import render_image_preview
+from app.services.smart_render import render_preview_smart
+from app.services.output_store import KIND_DOWNLOAD
+from app.services.single_flight import render_identity, render_once
 from copy import deepcopy
 
 router = APIRouter(prefix="/public/templates", tags=["Public Templates"])
@@ -74,7 +76,6 @@ async def public_preview(template_id: str, data: dict):
     if template_type in ("img", "image"):
 
         filename = f"{template_id}_public_preview.jpg"
-        preview_path = os.path.join(media_dir, filename)
 
         tpl_json = deepcopy(template.get("template_json", {}))
 
@@ -82,12 +83,18 @@ async def public_preview(template_id: str, data: dict):
             tpl_json, fields, customer, company
         )
 
-        await run_in_threadpool(
+        key = render_identity("public_preview", template_id, tpl_json, customer, company)
+        preview_path = os.path.join(media_dir, f"{template_id}_public_preview_{key[:16]}.jpg")
+        await render_once(
+            key,
+            preview_path,
             render_image_preview,
             tpl_json,
             customer,
             company,
-            preview_path
+            kind="public_preview",
+            cost=0,  # a single frame
+            company_id=company_id,
         )
 
         return FileResponse(
@@ -98,7 +105,6 @@ async def public_preview(template_id: str, data: dict):
 
     # VIDEO TEMPLATE
     filename = f"{template_id}_public_preview.mp4"
-    preview_path = os.path.join(media_dir, filename)
 
     full_template = deepcopy(template)
 
@@ -109,14 +115,21 @@ async def public_preview(template_id: str, data: dict):
 
     full_template["template_json"] = tpl_json
 
-    await run_in_threadpool(
-        render_preview,
+    # Same template + inputs = same file; the first request renders it and
+    # everyone arriving meanwhile (or later) gets that result
+    key = render_identity("public_preview", template_id, full_template, customer, company)
+    preview_path = os.path.join(media_dir, f"{template_id}_public_preview_{key[:16]}.mp4")
+    await render_once(
+        key,
+        preview_path,
+        render_preview_smart,
         full_template,
         {
             "customer": customer,
             "company": company
         },
-        preview_path
+        kind="public_preview",
+        company_id=company_id,
     )
 
     # Return the generated file directly so clients receive a usable URL/file
@@ -158,7 +171,6 @@ async def public_download(template_id: str, data: dict):
     if template_type in ("img", "image"):
 
         filename = f"{template_id}_download.jpg"
-        preview_path = os.path.join(media_dir, filename)
 
         tpl_json = deepcopy(template.get("template_json", {}))
 
@@ -166,12 +178,19 @@ async def public_download(template_id: str, data: dict):
             tpl_json, fields, customer, company
         )
 
-        await run_in_threadpool(
+        key = render_identity("public_download", template_id, tpl_json, customer, company)
+        preview_path = os.path.join(media_dir, f"{template_id}_download_{key[:16]}.jpg")
+        await render_once(
+            key,
+            preview_path,
             render_image_preview,
             tpl_json,
             customer,
             company,
-            preview_path
+            kind="public_download",
+            cost=0,  # a single frame
+            output_kind=KIND_DOWNLOAD,
+            company_id=company_id,
         )
 
         return FileResponse(
@@ -182,7 +201,6 @@ async def public_download(template_id: str, data: dict):
 
     # VIDEO
     filename = f"{template_id}_download.mp4"
-    preview_path = os.path.join(media_dir, filename)
 
     full_template = deepcopy(template)
 
@@ -194,14 +212,20 @@ async def public_download(template_id: str, data: dict):
 
     full_template["template_json"] = tpl_json
 
-    await run_in_threadpool(
-        render_preview,
+    key = render_identity("public_download", template_id, full_template, customer, company)
+    preview_path = os.path.join(media_dir, f"{template_id}_download_{key[:16]}.mp4")
+    await render_once(
+        key,
+        preview_path,
+        render_preview_smart,
         full_template,
         {
             "customer": customer,
             "company": company
         },
-        preview_path
+        kind="public_download",
+        output_kind=KIND_DOWNLOAD,
+        company_id=company_id,
     )
 
     return FileResponse(
@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from datetime import datetime
 from bson import ObjectId
 
 from app.db.connection import db
 from app.utils.auth import require_roles
-from app.worker.video_worker import render_video_task
+from app.worker.lanes import LANE_BATCH
+from app.worker.queue import enqueue_render, lane_stats
 
 router = APIRouter(prefix="/tasks", tags=["Tasks"])
 
@@ -42,6 +44,8 @@ async def generate_video(
         "template_id": template_id,
         "customer_id": customer_id,
         "status": "pending",
+        "lane": LANE_BATCH,
+        "attempts": 0,
         "output_url": None,
         "created_at": datetime.utcnow(),
         "updated_at": datetime.utcnow(),
@@ -50,10 +54,47 @@ async def generate_video(
     result = await db.video_tasks.insert_one(task_doc)
     task_id = str(result.inserted_id)
 
-    # 5. Start background rendering
-    render_video_task(task_id)
+    # 5. Queue rendering; a worker picks it up, the request returns now
+    await run_in_threadpool(enqueue_render, task_id)
 
     return {
-        "message": "Video generation started",
-        "task_id": task_id
+        "message": "Video generation queued",
+        "task_id": task_id,
+        "status": "pending"
+    }
+
+
+@router.get("/lanes")
+async def get_lane_stats(user=Depends(require_roles("superadmin", "admin", "company"))):
+    """Queue depth and slot usage per scheduling lane."""
+    return await run_in_threadpool(lane_stats)
+
+
+@router.get("/{task_id}")
+async def get_task_status(
+    task_id: str,
+    user=Depends(require_roles("company"))
+):
+    if not ObjectId.is_valid(task_id):
+        raise HTTPException(400, "Invalid task id")
+
+    company = await db.companies.find_one({"user_id": str(user["_id"])})
+    if not company:
+        raise HTTPException(400, "Company not found")
+
+    task = await db.video_tasks.find_one({
+        "_id": ObjectId(task_id),
+        "company_id": str(company["_id"])
+    })
+    if not task:
+        raise HTTPException(404, "Task not found")
+
+    return {
+        "task_id": task_id,
+        "status": task.get("status"),
+        "attempts": task.get("attempts", 0),
+        "output_video_url": task.get("output_video_url"),
+        "error": task.get("error"),
+        "next_attempt_at": task.get("next_attempt_at"),
+        "updated_at": task.get("updated_at"),
     }
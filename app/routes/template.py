@@ -1,17 +1,23 @@
 import re
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi import Query
-from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
 from datetime import datetime
 from bson import ObjectId
 import json
 from app.db.connection import db
 from app.utils.auth import require_roles,get_current_user
 from app.services.video_renderer import render_preview,render_image_preview
+from app.services.smart_render import render_preview_smart
+from app.services.single_flight import render_identity, render_once
+from app.services.output_store import touch_output
 from app.utils.placeholders import replace_placeholders
-from app.services.kokoro_tts import synthesize_and_store_media
-from app.services.url import build_media_url
+from app.services.render_context import (
+    apply_dynamic_audio_to_template,
+    normalize_company,
+    normalize_customer,
+)
 import uuid
 import os
 router = APIRouter(prefix="/templates", tags=["Templates"])
@@ -190,23 +196,32 @@ async def preview_template(template_id: str):
         if template_type in ("img", "image"):
             preview_filename = f"{template_id}_preview.jpg"
             preview_path = os.path.join(media_dir, preview_filename)
-            await run_in_threadpool(
+            await render_once(
+                render_identity("template_preview", template_id, template, company_context),
+                preview_path,
                 render_image_preview,
                 template["template_json"],
                 {},
                 company_context,
-                preview_path,
+                reuse=False,
+                kind="template_preview",
+                cost=0,  # a single frame
+                company_id=company_id,
             )
             return FileResponse(path=preview_path, media_type="image/jpeg", filename=preview_filename)
 
         # VIDEO template -> MP4
         preview_filename = f"{template_id}_preview.mp4"
         preview_path = os.path.join(media_dir, preview_filename)
-        await run_in_threadpool(
+        await render_once(
+            render_identity("template_preview", template_id, template, company_context),
+            preview_path,
             render_preview,
             template,
             {"customer": {}, "company": company_context},
-            preview_path,
+            reuse=False,
+            kind="template_preview",
+            company_id=company_id,
         )
         return FileResponse(path=preview_path, media_type="video/mp4", filename=preview_filename)
     except Exception as e:
@@ -239,196 +254,6 @@ def replace_placeholders(data, customer):
         json_str = json_str.replace(placeholder, str(value))
     return json.loads(json_str)
 
-def normalize_customer(customer: dict) -> dict:
-    safe = {}
-    for k, v in customer.items():
-        if k == "_id":
-            safe["id"] = str(v)
-        elif hasattr(v, "isoformat"):
-            safe[k] = v.isoformat()
-        else:
-            safe[k] = str(v) if v is not None else ""
-    return safe
-
-def normalize_company(company: dict | None) -> dict:
-    if not company:
-        return {}
-
-    return {
-        "company_name": company.get("company_name", ""),
-        "description": company.get("description", ""),        
-        "mobile": company.get("mobile", ""),        
-        "logo_url": company.get("logo_url", ""),   # image path / url
-    }
-
-PLACEHOLDER_RE = re.compile(r"\{\{?\s*([\w.]+)\s*\}?\}")
-
-def _resolve_placeholders(text: str, context: dict) -> str:
-    """
-    Replace {{customer.full_name}}, {{company.company_name}}, {{customer.city}}
-    and also flat {{full_name}} style placeholders.
-
-    context = {
-        "customer": {"full_name": "John", "city": "Mumbai", ...},
-        "company":  {"company_name": "Acme", "mobile": "...", ...},
-    }
-    """
-    def replacer(match):
-        path = match.group(1).strip()          # e.g. "customer.full_name"
-        parts = path.split(".")
-
-        if len(parts) == 1:
-            # flat key → search all context buckets
-            key = parts[0].lower()
-            for bucket in context.values():
-                if isinstance(bucket, dict):
-                    # case-insensitive key lookup
-                    for k, v in bucket.items():
-                        if k.lower() == key:
-                            return str(v) if v is not None else ""
-            return match.group(0)              # leave untouched if not found
-
-        # nested: parts[0] = bucket, rest = key path
-        bucket_name = parts[0].lower()
-        bucket = None
-        for k, v in context.items():
-            if k.lower() == bucket_name:
-                bucket = v
-                break
-        if not isinstance(bucket, dict):
-            return match.group(0)
-
-        value = bucket
-        for key in parts[1:]:
-            if not isinstance(value, dict):
-                return match.group(0)
-            # case-insensitive
-            value = next(
-                (v for k, v in value.items() if k.lower() == key.lower()),
-                None
-            )
-            if value is None:
-                return ""
-        return str(value) if value is not None else ""
-
-    return PLACEHOLDER_RE.sub(replacer, text)
-
-async def _apply_dynamic_audio_to_template(
-    template_json: dict,
-    *,
-    customer: dict,
-    company: dict,
-    company_id: str | None,
-):
-    """
-    For every audio track item where:
-        metadata.isCustomerField == True
-        metadata.fieldPath       == "voiceover"   (case-insensitive)
-        metadata.dataType        == "audio"        (case-insensitive)
-
-    1. Resolve placeholders in item["voisetext"]  → resolved_text
-    2. Call synthesize_and_store_media(resolved_text, voice, speed)
-    3. Patch item.details.src + metadata.uploadedUrl / originalUrl
-    """
-    if not isinstance(template_json, dict) or not company_id:
-        return
-
-    design    = template_json.get("design", {})
-    track_map = design.get("trackItemsMap", {})
-
-    context = {
-        "customer": customer or {},
-        "company":  company  or {},
-    }
-
-    for tid, item in (track_map or {}).items():
-        if not isinstance(item, dict):
-            continue
-        if item.get("type") != "audio":
-            continue
-
-        metadata = item.get("metadata") or {}
-
-        # ── Guard checks ──────────────────────────────────────────────────
-        if not metadata.get("isCustomerField"):
-            continue
-
-        field_path = str(
-            metadata.get("fieldPath") or metadata.get("fieldpath") or ""
-        ).strip().lower()
-        if field_path != "voiceover":
-            continue
-
-        data_type = str(
-            metadata.get("dataType") or metadata.get("datatype") or ""
-        ).strip().lower()
-        if data_type != "audio":
-            continue
-
-        # ── Resolve voisetext ─────────────────────────────────────────────
-        raw_text = (
-            item.get("voisetext")
-            or (item.get("details") or {}).get("voisetext")
-            or ""
-        )
-        if not isinstance(raw_text, str) or not raw_text.strip():
-            print(f"[TTS] Skipping track {tid}: empty voisetext")
-            continue
-
-        resolved_text = _resolve_placeholders(raw_text, context).strip()
-        if not resolved_text:
-            print(f"[TTS] Skipping track {tid}: resolved text is empty")
-            continue
-
-        print(f"[TTS] Track {tid} | raw: {raw_text!r} → resolved: {resolved_text!r}")
-
-        # ── Voice / speed ─────────────────────────────────────────────────
-        voice = (
-            item.get("voice")
-            or metadata.get("voice")
-            or "af_heart"
-        )
-        try:
-            speed = float(item.get("playbackRate") or item.get("speed") or 1.0)
-        except (TypeError, ValueError):
-            speed = 1.0
-        speed = max(0.5, min(2.0, speed))      # clamp to valid range
-
-        # ── Generate TTS via synthesize_and_store_media ───────────────────
-        try:
-            stored = await synthesize_and_store_media(
-                company_id=str(company_id),
-                voisetext=resolved_text,
-                voice=str(voice),
-                speed=speed,
-            )
-        except Exception as exc:
-            print(f"[TTS] ERROR generating audio for track {tid}: {exc}")
-            import traceback; traceback.print_exc()
-            continue          # leave original audio untouched rather than crashing
-
-        # ── Patch the item in-place ───────────────────────────────────────
-        # details.src  →  local file path used by the renderer
-        details = item.get("details") or {}
-        details["src"] = f"./media/{stored['file_url']}"
-        item["details"] = details
-
-        # keep resolved text so renderer doesn't have to resolve again
-        item["voisetext"] = resolved_text
-
-        # public URL stored in metadata for logging / frontend display
-        new_url = build_media_url(stored["file_url"])
-        if new_url:
-            metadata["uploadedUrl"]  = new_url
-            metadata["originalUrl"]  = new_url
-        item["metadata"] = metadata
-
-        print(f"[TTS] Track {tid} patched → {details['src']}")
-
-    # write back (mutates template_json in-place, caller already holds ref)
-    design["trackItemsMap"] = track_map
-    template_json["design"] = design
-
 @router.post("/{template_id}/preview/{customer_id}")
 async def preview_template_customer(template_id: str, customer_id: str):
 
@@ -461,12 +286,17 @@ async def preview_template_customer(template_id: str, customer_id: str):
         preview_filename = f"{template_id}_{customer_id}_preview.jpg"
         preview_path = os.path.join(media_dir, preview_filename)
 
-        await run_in_threadpool(
+        await render_once(
+            render_identity("customer_preview", template_id, template, customer, company),
+            preview_path,
             render_image_preview,
             template["template_json"],
             customer,
             company,
-            preview_path
+            reuse=False,
+            kind="customer_preview",
+            cost=0,  # a single frame
+            company_id=template.get("company_id") or customer.get("linked_company_id"),
         )
 
         return FileResponse(preview_path, media_type="image/jpeg", filename=preview_filename)
@@ -475,25 +305,31 @@ async def preview_template_customer(template_id: str, customer_id: str):
     preview_filename = f"{template_id}_{customer_id}_preview.mp4"
     preview_path = os.path.join(media_dir, preview_filename)
 
-    # ✅ Dynamic audio TTS (voisetext -> mp3) before rendering
-    tpl_json = template.get("template_json", {}) or {}
+    # Keyed before TTS: concurrent clicks share one voiceover and one render
+    key = render_identity("customer_preview", template_id, template, customer, company)
     effective_company_id = template.get("company_id") or customer.get("linked_company_id")
-    await _apply_dynamic_audio_to_template(
-        tpl_json,
-        customer=customer,
-        company=company,
-        company_id=str(effective_company_id or ""),
-    )
-    template["template_json"] = tpl_json
 
-    await run_in_threadpool(
-        render_preview,
+    async def add_voiceovers():
+        # ✅ Dynamic audio TTS (voisetext -> mp3) before rendering
+        tpl_json = template.get("template_json", {}) or {}
+        await apply_dynamic_audio_to_template(
+            tpl_json,
+            customer=customer,
+            company=company,
+            company_id=str(effective_company_id or ""),
+        )
+        template["template_json"] = tpl_json
+
+    await render_once(
+        key,
+        preview_path,
+        render_preview_smart,
         template,
-        {
-            "customer": customer,
-            "company": company
-        },
-        preview_path
+        {"customer": customer, "company": company},
+        reuse=False,
+        kind="customer_preview",
+        company_id=effective_company_id,
+        prepare=add_voiceovers,
     )
 
     return FileResponse(preview_path, media_type="video/mp4")
@@ -518,6 +354,7 @@ async def download_video(template_id: str, customer_id: str):
             status_code=404,
             detail="Video file does not exist. You must first generate a preview."
         )
+    await run_in_threadpool(touch_output, file_path)
 
     return FileResponse(
         path=file_path,
@@ -5,11 +5,11 @@ import uuid
 
 from app.db.connection import db
 from app.utils.auth import require_roles
-from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
 import os
 import json
-from app.services.video_renderer import render_preview
+from app.services.smart_render import render_preview_smart
+from app.services.single_flight import render_identity, render_once
 
 
 router = APIRouter(prefix="/video-task", tags=["Video Task"])
@@ -97,6 +97,12 @@ async def public_video_download(
     if not customer:
         raise HTTPException(404, "Customer not found")
 
+    # 3️⃣ Fetch company (customer's company, else the template owner)
+    company = None
+    company_id = customer.get("linked_company_id") or template.get("company_id")
+    if company_id and ObjectId.is_valid(str(company_id)):
+        company = await db.companies.find_one({"_id": ObjectId(str(company_id))})
+
     customer = normalize_doc(customer)
     company = normalize_doc(company)
 
@@ -107,24 +113,31 @@ async def public_video_download(
     filename = f"{template_id}_{customer_id}_preview.mp4"
     output_path = os.path.join(media_dir, filename)
 
-    # 5️⃣ Render only if not exists
-    if not os.path.exists(output_path):
-        await run_in_threadpool(
-            render_preview,
-            template,
-            {"customer": customer, "company": company},
-            output_path,
-        )
-
-        # 6️⃣ Create video task entry
-        await db.video_tasks.insert_one({
+    # 5️⃣ Render only if not exists; concurrent hits share one render
+    await render_once(
+        render_identity("public_video", template_id, customer_id),
+        output_path,
+        render_preview_smart,
+        template,
+        {"customer": customer, "company": company},
+        kind="preview_file",
+        company_id=company_id,
+    )
+
+    # 6️⃣ Create video task entry (once, however many requests rendered)
+    await db.video_tasks.update_one(
+        {
             "template_id": ObjectId(template_id),
             "customer_id": ObjectId(customer_id),
+            "is_public": True
+        },
+        {"$setOnInsert": {
             "video_path": f"/media/{filename}",
             "download_count": 0,
-            "is_public": True,
             "created_at": datetime.utcnow()
-        })
+        }},
+        upsert=True
+    )
 
     # 7️⃣ Increment download count
     await db.video_tasks.update_one(
@@ -1,59 +1,24 @@
+import sys
+import asyncio
 import logging
 import subprocess
 from fastapi import APIRouter, UploadFile, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel, field_validator
 from typing import Optional
 from bson import ObjectId
 from app.utils.auth import require_roles
+from app.utils.metrics import process_rss_bytes
 from app.db.connection import db
 from datetime import datetime
-from app.services.kokoro_tts import (
-    CUDA_AVAILABLE,
-    get_model,
-    get_pipeline,
-    synthesize_and_store_media,
-)
+from app.services.tts import synthesize_and_store_media, wav_stream_header
+from app.services.tts_executor import memory_usage, stream_pcm, tts_executor, warm_up
+from app.services.voices import VOICE_IDS, VOICES
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/kokoro", tags=["kokoro-tts"])
-logger.info(f"Kokoro: CUDA available: {CUDA_AVAILABLE}")
-
-# Voice catalogue (kept identical to official app choices)
-VOICES = [
-    {"id": "af_heart",    "name": "Heart",    "lang": "en-us", "gender": "Female"},
-    {"id": "af_bella",    "name": "Bella",    "lang": "en-us", "gender": "Female"},
-    {"id": "af_nicole",   "name": "Nicole",   "lang": "en-us", "gender": "Female"},
-    {"id": "af_aoede",    "name": "Aoede",    "lang": "en-us", "gender": "Female"},
-    {"id": "af_kore",     "name": "Kore",     "lang": "en-us", "gender": "Female"},
-    {"id": "af_sarah",    "name": "Sarah",    "lang": "en-us", "gender": "Female"},
-    {"id": "af_nova",     "name": "Nova",     "lang": "en-us", "gender": "Female"},
-    {"id": "af_sky",      "name": "Sky",      "lang": "en-us", "gender": "Female"},
-    {"id": "af_alloy",    "name": "Alloy",    "lang": "en-us", "gender": "Female"},
-    {"id": "af_jessica",  "name": "Jessica",  "lang": "en-us", "gender": "Female"},
-    {"id": "af_river",    "name": "River",    "lang": "en-us", "gender": "Female"},
-    {"id": "am_michael",  "name": "Michael",  "lang": "en-us", "gender": "Male"},
-    {"id": "am_fenrir",   "name": "Fenrir",   "lang": "en-us", "gender": "Male"},
-    {"id": "am_puck",     "name": "Puck",     "lang": "en-us", "gender": "Male"},
-    {"id": "am_echo",     "name": "Echo",     "lang": "en-us", "gender": "Male"},
-    {"id": "am_eric",     "name": "Eric",     "lang": "en-us", "gender": "Male"},
-    {"id": "am_liam",     "name": "Liam",     "lang": "en-us", "gender": "Male"},
-    {"id": "am_onyx",     "name": "Onyx",     "lang": "en-us", "gender": "Male"},
-    {"id": "am_santa",    "name": "Santa",    "lang": "en-us", "gender": "Male"},
-    {"id": "am_adam",     "name": "Adam",     "lang": "en-us", "gender": "Male"},
-    {"id": "bf_emma",     "name": "Emma",     "lang": "en-gb", "gender": "Female"},
-    {"id": "bf_isabella", "name": "Isabella", "lang": "en-gb", "gender": "Female"},
-    {"id": "bf_alice",    "name": "Alice",    "lang": "en-gb", "gender": "Female"},
-    {"id": "bf_lily",     "name": "Lily",     "lang": "en-gb", "gender": "Female"},
-    {"id": "bm_george",   "name": "George",   "lang": "en-gb", "gender": "Male"},
-    {"id": "bm_fable",    "name": "Fable",    "lang": "en-gb", "gender": "Male"},
-    {"id": "bm_lewis",    "name": "Lewis",    "lang": "en-gb", "gender": "Male"},
-    {"id": "bm_daniel",   "name": "Daniel",   "lang": "en-gb", "gender": "Male"},
-]
-
-VOICE_IDS = {v["id"] for v in VOICES}
 
 
 # ---- Request schema -----------------------------------------------------
@@ -163,16 +128,83 @@ async def tts_to_media(
 
     return {"media": serialize_mongo(media_doc)}
 
+@router.post("/tts/stream")
+async def tts_stream(
+    request: TTSRequest,
+    format: str = "wav",
+    user=Depends(require_roles("superadmin", "company"))
+):
+    """
+    Streams the audio while it is synthesized, chunk by chunk (lines, and
+    long paragraphs cut at punctuation by Kokoro), as 24kHz mono 16-bit
+    WAV (length unknown up front) or raw PCM (format=pcm). Nothing is
+    stored; POST /kokoro/tts saves to the library.
+    """
+    if format not in ("wav", "pcm"):
+        raise HTTPException(400, "format must be 'wav' or 'pcm'")
+
+    chunks = tts_executor.stream(stream_pcm, request.voisetext, request.voice, request.speed)
+    # wait for the first chunk so a full queue or a failed synthesis
+    # still gets a proper status instead of an empty 200
+    try:
+        first = await anext(chunks)
+    except StopAsyncIteration:
+        raise HTTPException(500, "No audio chunks produced")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("TTS stream failed")
+        raise HTTPException(500, f"TTS generation failed: {e}")
+
+    async def body():
+        try:
+            if format == "wav":
+                yield wav_stream_header()
+            yield first
+            async for chunk in chunks:
+                yield chunk
+        except Exception:
+            # headers are sent; the client sees a truncated stream
+            logger.exception("TTS stream failed mid-way")
+        finally:
+            await chunks.aclose()
+
+    media_type = "audio/wav" if format == "wav" else "audio/L16; rate=24000; channels=1"
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-store"})
+
 @router.get("/health")
-def health():
-    return {"status": "ok", "cuda": CUDA_AVAILABLE, "device": "cuda" if CUDA_AVAILABLE else "cpu"}
+async def health():
+    """
+    Device plus TTS memory: this process, and one TTS pool process when the
+    pool is running (that is where API synthesis loads the model). Neither
+    is loaded just to answer: until a process synthesizes, its device is
+    unknown (null).
+    """
+    api = {"loaded": "app.services.kokoro_tts" in sys.modules, "rss_bytes": process_rss_bytes()}
+    if api["loaded"]:
+        api.update(await asyncio.to_thread(memory_usage))
+    memory = {"api": api}
+    device = api.get("device")
+    if tts_executor.started:
+        try:
+            memory["tts_worker"] = await asyncio.wait_for(tts_executor.run(memory_usage), 2)
+            device = memory["tts_worker"]["device"] or device
+        except (asyncio.TimeoutError, HTTPException):
+            memory["tts_worker"] = "busy"
+    return {
+        "status": "ok",
+        "cuda": device == "cuda" if device else None,
+        "device": device,
+        "memory": memory,
+    }
 
 async def warmup():
-    """Pre-load model + both pipelines so the first request isn't slow."""
+    """
+    Pre-load the model and the TTS_WARMUP_VOICES packs where synthesis runs
+    (the TTS pool, which starts here) so the first request isn't slow.
+    """
     try:
-        get_model()
-        get_pipeline("a")
-        get_pipeline("b")
-        logger.info("Kokoro warmup complete ✓")
+        voices = await tts_executor.run(warm_up)
+        logger.info(f"Kokoro warmup complete ✓ ({len(voices)} voices)")
     except Exception as e:
         logger.warning(f"Kokoro warmup skipped: {e}")
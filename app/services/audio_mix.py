@@ -0,0 +1,155 @@
+import os
+import json
+import hashlib
+
+from app.services.output_store import KIND_CACHE, record_output, touch_output
+from app.services.render_helper import item_seek_window, run_ffmpeg, seek_input_args
+from app.services.workspace import WORKSPACE_PREFIX, RenderWorkspace
+from app.utils.metrics import record_cache
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media")
+FFMPEG = "ffmpeg"
+AUDIO_BED_CACHE = os.getenv("AUDIO_BED_CACHE", "true").lower() == "true"
+AUDIO_BED_DIR = os.path.join(MEDIA_ROOT, "audio_bed_cache")
+AUDIO_BED_BITRATE = os.getenv("AUDIO_BED_BITRATE", "256k")
+
+# ---------------------------------------------------------
+# MIX FILTERS
+# ---------------------------------------------------------
+
+def audio_source_filter(src: dict, label: str) -> str | None:
+    """
+    Builds the trim/volume/delay chain for one audio source dict
+    ({index, start_ms, end_ms, trim_from, trim_to, volume}).
+    Returns None when the source has nothing audible on the timeline.
+    """
+    display_dur_ms = max(0, src["end_ms"] - src["start_ms"])
+    trim_len_ms = display_dur_ms
+    if src["trim_to"] is not None:
+        trim_len_ms = max(0, src["trim_to"] - src["trim_from"])
+        trim_len_ms = min(trim_len_ms, display_dur_ms)
+    duration_sec = max(0.0, trim_len_ms / 1000.0)
+    if duration_sec <= 0:
+        return None
+    # Inputs opened with -ss already start at the seek point
+    start_sec = max(0.0, (src["trim_from"] - src.get("seek_ms", 0)) / 1000.0)
+    vol_filter = f",volume={src['volume']:.3f}" if src["volume"] != 1.0 else ""
+    return (
+        f"[{src['index']}:a]atrim=start={start_sec}:duration={duration_sec},asetpts=PTS-STARTPTS"
+        f"{vol_filter},adelay={src['start_ms']}|{src['start_ms']},aresample=async=1:first_pts=0{label}"
+    )
+
+
+def mix_audio_sources(filter_parts: list, audio_sources: list, out_label: str = "[outa]", extra_labels=None) -> bool:
+    """
+    Appends the filters mixing every source (plus any already-prepared
+    extra_labels) into out_label. Returns False when nothing is audible.
+    """
+    audio_labels = list(extra_labels or [])
+    for i, src in enumerate(audio_sources):
+        label = f"[aud{i}]"
+        chain = audio_source_filter(src, label)
+        if chain is None:
+            continue
+        filter_parts.append(chain)
+        audio_labels.append(label)
+
+    if not audio_labels:
+        return False
+    filter_parts.append(
+        f"{''.join(audio_labels)}amix=inputs={len(audio_labels)}:normalize=0{out_label}"
+    )
+    return True
+
+# ---------------------------------------------------------
+# AUDIO BED CACHE
+# ---------------------------------------------------------
+
+def _source_fingerprint(path: str) -> dict:
+    if path.startswith("http"):
+        return {"src": path}
+    try:
+        st = os.stat(path)
+        return {"src": path, "size": st.st_size, "mtime": st.st_mtime_ns}
+    except OSError:
+        return {"src": path, "missing": True}
+
+
+def audio_bed_key(static_sources: list, duration: float) -> str:
+    """
+    Content key for a pre-mixed bed. It covers the source files (size+mtime)
+    and every mix parameter, so editing the template or replacing a track
+    produces a new bed while unchanged templates keep hitting the cache.
+    """
+    spec = {
+        "duration": round(float(duration), 3),
+        "bitrate": AUDIO_BED_BITRATE,
+        "sources": [
+            {
+                **_source_fingerprint(s["src"]),
+                "start_ms": s["start_ms"],
+                "end_ms": s["end_ms"],
+                "trim_from": s["trim_from"],
+                "trim_to": s["trim_to"],
+                "volume": round(s["volume"], 3),
+            }
+            for s in static_sources
+        ],
+    }
+    raw = json.dumps(spec, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:32]
+
+
+def get_or_build_audio_bed(static_sources: list, duration: float) -> str | None:
+    """
+    Returns an AAC file holding the mix of all static audio sources, building
+    it on first use. Returns None if the bed cannot be built so the caller can
+    fall back to mixing everything inline.
+    """
+    if not static_sources:
+        return None
+
+    os.makedirs(AUDIO_BED_DIR, exist_ok=True)
+    key = audio_bed_key(static_sources, duration)
+    bed_path = os.path.join(AUDIO_BED_DIR, f"bed_{key}.m4a").replace("\\", "/")
+    hit = os.path.exists(bed_path)
+    record_cache("audio_bed", hit)
+    if hit:
+        touch_output(bed_path)
+        return bed_path
+
+    # Re-index the sources against this command's own inputs
+    sources = [dict(s, index=i) for i, s in enumerate(static_sources)]
+    for s in sources:
+        seek_sec, length_sec = item_seek_window(s["item"], duration)
+        s["seek_args"] = seek_input_args(seek_sec, length_sec)
+        s["seek_ms"] = int(round(seek_sec * 1000))
+    filter_parts: list[str] = []
+    if not mix_audio_sources(filter_parts, sources):
+        return None
+
+    with RenderWorkspace(prefix=WORKSPACE_PREFIX + "bed_") as ws:
+        tmp_path = ws.path("bed.m4a")
+        cmd = [FFMPEG, "-y"]
+        for s in sources:
+            cmd += s["seek_args"] + ["-i", s["src"]]
+        cmd += [
+            "-filter_complex", ";".join(filter_parts),
+            "-map", "[outa]",
+            "-c:a", "aac",
+            "-b:a", AUDIO_BED_BITRATE,
+            "-t", str(duration),
+            tmp_path,
+        ]
+        print("Build audio bed FFmpeg command:", " ".join(cmd))
+        try:
+            run_ffmpeg(cmd, stage="audio_bed", capture_output=True)
+            ws.promote(tmp_path, bed_path)
+            record_output(bed_path, KIND_CACHE)
+        except Exception as e:
+            print(f"   ⚠️ Audio bed build failed, mixing inline: {e}")
+            return None
+    return bed_path
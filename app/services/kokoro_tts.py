@@ -1,21 +1,93 @@
-import subprocess
-import uuid
+import os
+import time
 import logging
+import threading
+from collections import OrderedDict
 from functools import lru_cache
 from io import BytesIO
+from typing import Iterator
 
 import numpy as np
 import soundfile as sf
 import torch
 
-from fastapi import UploadFile, HTTPException
+from fastapi import HTTPException
 
-from app.services.storage import save_upload_file
+from app.services.render_helper import run_ffmpeg
+from app.services.tts import RENDER_AUDIO_EXT, safe_lookup_tts
+from app.services.tts_cache import KOKORO_SPLIT_PATTERN, store_tts, tts_cache_key
+from app.services.voices import VOICE_IDS, VOICES, voice_lang_code
+from app.utils.metrics import process_rss_bytes, record_cache, record_tts
 
 logger = logging.getLogger(__name__)
 
 CUDA_AVAILABLE = torch.cuda.is_available()
 
+# Where texts are cut into chunks before phonemizing; Kokoro's default (new
+# lines) unless set. A sentence split, (?<=[.!?])\s+, lets personalized
+# scripts share chunks in the chunk memo ("Hi Anna! Welcome to Acme." and
+# "Hi Ben! Welcome to Acme." differ only in their first chunk) but changes
+# the prosody of every synthesis; the TTS cache keys it separately.
+TTS_SPLIT_PATTERN = os.getenv("TTS_SPLIT_PATTERN", KOKORO_SPLIT_PATTERN)
+# Separately synthesized voiceover segments are joined with this overlap
+TTS_CROSSFADE_MS = float(os.getenv("TTS_CROSSFADE_MS", "30"))
+# Voices loaded at startup: comma separated ids, or "all" for the catalog
+TTS_WARMUP_VOICES = os.getenv("TTS_WARMUP_VOICES", "af_heart")
+# Voices outside the catalog (blends) kept loaded, per language
+TTS_EXTRA_VOICES_PER_LANG = max(1, int(os.getenv("TTS_EXTRA_VOICES_PER_LANG", "8")))
+# CPU inference profile (compare them with bench_tts_cpu.py). Threads: 0
+# keeps torch's default of one intra-op thread per core, too many when
+# several TTS processes share the machine.
+TTS_INTRA_OP_THREADS = max(0, int(os.getenv("TTS_INTRA_OP_THREADS", "0")))
+TTS_INTER_OP_THREADS = max(0, int(os.getenv("TTS_INTER_OP_THREADS", "0")))
+# inference_mode also skips autograd's version counters; "0" uses no_grad
+TTS_INFERENCE_MODE = os.getenv("TTS_INFERENCE_MODE", "1").lower() in ("1", "true", "yes")
+# "int8": dynamic int8 quantization of the Linear layers (CPU only; the
+# audio changes slightly, so the TTS cache keys it separately)
+TTS_QUANTIZE = os.getenv("TTS_QUANTIZE", "").lower()
+# "compile" (torch.compile) or "script" (TorchScript of the decoder);
+# falls back to eager when the model does not compile
+TTS_COMPILE = os.getenv("TTS_COMPILE", "").lower()
+# Audio of recent phoneme chunks, reused across requests
+TTS_CHUNK_MEMO_BYTES = int(float(os.getenv("TTS_CHUNK_MEMO_MB", "64")) * 1024 * 1024)
+
+_chunk_memo: OrderedDict = OrderedDict()
+_chunk_memo_bytes = 0
+_chunk_memo_lock = threading.Lock()
+
+_pipelines = {}
+_voice_packs: OrderedDict = OrderedDict()
+_cache_lock = threading.RLock()
+
+
+def _set_threads():
+    if TTS_INTRA_OP_THREADS:
+        torch.set_num_threads(TTS_INTRA_OP_THREADS)
+    if TTS_INTER_OP_THREADS:
+        try:
+            torch.set_num_interop_threads(TTS_INTER_OP_THREADS)
+        except RuntimeError as e:
+            # only possible before the first parallel op of the process
+            logger.warning(f"Inter-op threads left at {torch.get_num_interop_threads()}: {e}")
+
+
+def _optimize_for_cpu(model):
+    if TTS_QUANTIZE == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if TTS_COMPILE == "compile":
+        # phoneme counts vary per chunk: compile for dynamic shapes
+        model.forward_with_tokens = torch.compile(model.forward_with_tokens, dynamic=True)
+    elif TTS_COMPILE == "script":
+        try:
+            model.decoder = torch.jit.script(model.decoder)
+        except Exception as e:
+            logger.warning(f"TorchScript failed, running the decoder eager: {e}")
+    return model
+
+
+def inference_context():
+    return torch.inference_mode() if TTS_INFERENCE_MODE else torch.no_grad()
+
 
 @lru_cache(maxsize=1)
 def get_model():
@@ -23,45 +95,250 @@ def get_model():
 
     device = "cuda" if CUDA_AVAILABLE else "cpu"
     logger.info(f"Loading KModel on {device}…")
+    _set_threads()
     model = KModel().to(device).eval()
-    logger.info(f"KModel ready ✓ (device={device})")
+    if device == "cpu":
+        model = _optimize_for_cpu(model)
+    logger.info(
+        f"KModel ready ✓ (device={device}, threads={torch.get_num_threads()}, "
+        f"quantize={TTS_QUANTIZE or 'none'}, compile={TTS_COMPILE or 'none'})"
+    )
     return model, device
 
 
-@lru_cache(maxsize=2)
 def get_pipeline(lang_code: str):
-    from kokoro import KPipeline
+    """KPipeline (G2P only) for a language, loaded once and kept: there are few."""
+    with _cache_lock:
+        pipeline = _pipelines.get(lang_code)
+        if pipeline is not None:
+            return pipeline
+
+        from kokoro import KPipeline
+
+        logger.info(f"Loading KPipeline lang_code='{lang_code}'…")
+        pipeline = KPipeline(lang_code=lang_code, model=False)
+        pipeline.g2p.lexicon.golds["kokoro"] = "kˈOkəɹO" if lang_code == "a" else "kˈQkəɹQ"
+        _pipelines[lang_code] = pipeline
+        logger.info(f"KPipeline '{lang_code}' ready ✓")
+        return pipeline
+
+
+def get_voice_pack(voice: str):
+    """
+    Style embeddings of a voice (one row per phoneme count), on the model's
+    device. Catalog voices stay resident once loaded (~0.5MB each); other
+    voices, e.g. blends like "af_heart,af_bella", are kept least recently
+    used, TTS_EXTRA_VOICES_PER_LANG per language.
+    """
+    with _cache_lock:
+        pack = _voice_packs.get(voice)
+        if pack is not None:
+            _voice_packs.move_to_end(voice)
+            return pack
+
+    lang_code = voice_lang_code(voice)
+    pipeline = get_pipeline(lang_code)
+    _model, device = get_model()
+    pack = pipeline.load_voice(voice).to(device)
+
+    with _cache_lock:
+        _voice_packs[voice] = pack
+        extras = [v for v in _voice_packs if v not in VOICE_IDS and voice_lang_code(v) == lang_code]
+        for old in extras[:max(0, len(extras) - TTS_EXTRA_VOICES_PER_LANG)]:
+            del _voice_packs[old]
+    return pack
+
+
+def warmup_voices(voices: str | None = None) -> list[str]:
+    """
+    Loads the model plus the pipelines and voice packs of voices (comma
+    separated, "all" for the catalog; default TTS_WARMUP_VOICES), so first
+    requests do not pay for them. Returns the voices loaded.
+    """
+    spec = (TTS_WARMUP_VOICES if voices is None else voices).strip()
+    if spec == "all":
+        names = [v["id"] for v in VOICES]
+    else:
+        names = [v.strip() for v in spec.split(",") if v.strip()]
+    get_model()
+    for voice in names:
+        get_voice_pack(voice)
+    return names
+
+
+def _tensor_bytes(tensor) -> int:
+    return tensor.element_size() * tensor.nelement()
+
+
+def tts_memory_usage() -> dict:
+    """What this process holds for TTS; loads nothing."""
+    with _cache_lock:
+        packs = list(_voice_packs.items())
+        pipelines = sorted(_pipelines)
+    by_lang = {}
+    for voice, pack in packs:
+        entry = by_lang.setdefault(voice_lang_code(voice), {"voices": 0, "bytes": 0})
+        entry["voices"] += 1
+        entry["bytes"] += _tensor_bytes(pack)
+
+    model_bytes = device = None
+    if get_model.cache_info().currsize:
+        model, device = get_model()
+        model_bytes = sum(_tensor_bytes(p) for p in model.parameters())
+    with _chunk_memo_lock:
+        memo_bytes = _chunk_memo_bytes
+    return {
+        "device": device,
+        "model_bytes": model_bytes,
+        "pipelines": pipelines,
+        "voice_packs": {
+            "voices": len(packs),
+            "bytes": sum(entry["bytes"] for entry in by_lang.values()),
+            "by_lang": by_lang,
+        },
+        "chunk_memo_bytes": memo_bytes,
+        "rss_bytes": process_rss_bytes(),
+    }
+
+
+def _memo_get(key: tuple) -> np.ndarray | None:
+    with _chunk_memo_lock:
+        audio = _chunk_memo.get(key)
+        if audio is not None:
+            _chunk_memo.move_to_end(key)
+        return audio
+
+
+def _memo_put(key: tuple, audio: np.ndarray):
+    global _chunk_memo_bytes
+    if audio.nbytes > TTS_CHUNK_MEMO_BYTES:
+        return
+    with _chunk_memo_lock:
+        if key in _chunk_memo:
+            return
+        _chunk_memo[key] = audio
+        _chunk_memo_bytes += audio.nbytes
+        while _chunk_memo_bytes > TTS_CHUNK_MEMO_BYTES:
+            _, evicted = _chunk_memo.popitem(last=False)
+            _chunk_memo_bytes -= evicted.nbytes
+
+
+def _chunk_audio(model, pack, ps: str, voice: str, speed: float) -> np.ndarray:
+    key = (ps, voice, round(speed, 3))
+    audio = _memo_get(key)
+    if audio is None:
+        ref_s = pack[len(ps) - 1]
+        with inference_context():
+            audio = model(ps, ref_s, speed).cpu().numpy()
+        _memo_put(key, audio)
+    return audio
+
+
+def synthesize_deduplicated(items: list[tuple[str, str, float]]) -> list[np.ndarray | None]:
+    """
+    Synthesizes (text, voice, speed) requests, running every distinct
+    phoneme chunk through the model once however many requests contain it;
+    returns one audio array per request, in order, or None where a text
+    produced no audio.
+
+    Requests are grouped by voice and speed so each group loads its voice
+    pack once. This is not a batched forward pass: KModel.forward_with_tokens
+    expands predicted durations for a batch of one, so chunks still run one
+    at a time. The saving is the repeated chunks (and the chunk memo).
+    """
+    results = [None] * len(items)
+    groups = {}
+    for index, (text, voice, speed) in enumerate(items):
+        if not text or not str(text).strip():
+            continue
+        groups.setdefault((voice, float(speed)), []).append(index)
+    if not groups:
+        return results
+
+    model, _device = get_model()
+    for (voice, speed), indexes in groups.items():
+        started = time.perf_counter()
+        pipeline = get_pipeline(voice_lang_code(voice))
+        pack = get_voice_pack(voice)
 
-    logger.info(f"Loading KPipeline lang_code='{lang_code}'…")
-    pipeline = KPipeline(lang_code=lang_code, model=False)
-    pipeline.g2p.lexicon.golds["kokoro"] = "kˈOkəɹO" if lang_code == "a" else "kˈQkəɹQ"
-    logger.info(f"KPipeline '{lang_code}' ready ✓")
-    return pipeline
+        # phonemes of every request, then the distinct chunks among them
+        request_chunks = {}
+        chunk_audio = {}
+        for index in indexes:
+            chunks = []
+            for _, ps, _ in pipeline(items[index][0], voice, speed, split_pattern=TTS_SPLIT_PATTERN):
+                if ps:
+                    chunks.append(ps)
+                    chunk_audio.setdefault(ps, None)
+            request_chunks[index] = chunks
+
+        for ps in chunk_audio:
+            chunk_audio[ps] = _chunk_audio(model, pack, ps, voice, speed)
+
+        for index in indexes:
+            chunks = request_chunks[index]
+            if chunks:
+                results[index] = np.concatenate([chunk_audio[ps] for ps in chunks])
+        chars = sum(len(items[index][0]) for index in indexes)
+        record_tts(voice, chars, time.perf_counter() - started)
+    return results
 
 
 def synthesize_audio_numpy(voisetext: str, voice: str, speed: float) -> np.ndarray:
     if not voisetext or not str(voisetext).strip():
         raise HTTPException(400, "Text cannot be empty")
 
-    lang_code = str(voice)[0] if voice else "a"
+    audio = synthesize_deduplicated([(voisetext, voice, speed)])[0]
+    if audio is None:
+        raise HTTPException(500, "No audio chunks produced")
+    return audio
+
+
+def synthesize_stream(voisetext: str, voice: str, speed: float) -> Iterator[np.ndarray]:
+    """Yields the audio chunk by chunk as each is synthesized."""
+    if not voisetext or not str(voisetext).strip():
+        raise HTTPException(400, "Text cannot be empty")
+
+    started = time.perf_counter()
     model, _device = get_model()
-    pipeline = get_pipeline(lang_code)
+    pipeline = get_pipeline(voice_lang_code(voice))
+    pack = get_voice_pack(voice)
 
-    pack = pipeline.load_voice(voice)
-    audio_chunks = []
+    produced = False
+    for _, ps, _ in pipeline(voisetext, voice, speed, split_pattern=TTS_SPLIT_PATTERN):
+        if ps:
+            produced = True
+            yield _chunk_audio(model, pack, ps, voice, speed)
+    if not produced:
+        raise HTTPException(500, "No audio chunks produced")
+    record_tts(voice, len(voisetext), time.perf_counter() - started)
+
+
+def pcm16_bytes(audio_data: np.ndarray) -> bytes:
+    """Little-endian 16-bit PCM, the sample format of the WAV files we write."""
+    return (np.clip(audio_data, -1.0, 1.0) * 32767).astype("<i2").tobytes()
 
-    for _, ps, _ in pipeline(voisetext, voice, speed):
-        if ps is None:
+
+def crossfade_concat(chunks: list[np.ndarray], samplerate: int = 24000,
+                     crossfade_ms: float = TTS_CROSSFADE_MS) -> np.ndarray:
+    """Joins audio arrays, overlapping each seam with a linear crossfade."""
+    overlap = int(samplerate * crossfade_ms / 1000)
+    audio = chunks[0]
+    for chunk in chunks[1:]:
+        n = min(overlap, len(audio), len(chunk))
+        if n == 0:
+            audio = np.concatenate([audio, chunk])
             continue
-        ref_s = pack[len(ps) - 1]
-        with torch.no_grad():
-            audio_tensor = model(ps, ref_s, speed)
-        audio_chunks.append(audio_tensor.cpu().numpy())
+        fade_in = np.linspace(0.0, 1.0, n, dtype=audio.dtype)
+        seam = audio[-n:] * (1.0 - fade_in) + chunk[:n] * fade_in
+        audio = np.concatenate([audio[:-n], seam, chunk[n:]])
+    return audio
 
-    if not audio_chunks:
-        raise HTTPException(500, "No audio chunks produced")
 
-    return np.concatenate(audio_chunks)
+def compose_audio_files(paths: list[str], ext: str) -> tuple[bytes, str]:
+    """Reads audio files and joins them with crossfade_concat; returns like encode_audio."""
+    chunks = [sf.read(path, dtype="float32")[0] for path in paths]
+    return encode_audio(crossfade_concat(chunks), ext)
 
 
 def encode_wav_bytes(audio_data: np.ndarray, samplerate: int = 24000) -> bytes:
@@ -70,12 +347,33 @@ def encode_wav_bytes(audio_data: np.ndarray, samplerate: int = 24000) -> bytes:
     return wav_buffer.getvalue()
 
 
+def encode_flac_bytes(audio_data: np.ndarray, samplerate: int = 24000) -> bytes:
+    flac_buffer = BytesIO()
+    sf.write(flac_buffer, audio_data, samplerate=samplerate, format="FLAC", subtype="PCM_16")
+    return flac_buffer.getvalue()
+
+
+def encode_audio(audio_data: np.ndarray, ext: str = "mp3") -> tuple[bytes, str]:
+    """
+    Returns (bytes, ext): mp3 through ffmpeg, flac or wav in-process. Falls
+    back to wav when the requested encoding fails.
+    """
+    if ext == "mp3":
+        return try_convert_wav_to_mp3(encode_wav_bytes(audio_data))
+    if ext == "flac":
+        try:
+            return encode_flac_bytes(audio_data), "flac"
+        except Exception as e:
+            logger.warning(f"FLAC encoding failed, writing WAV: {e}")
+    return encode_wav_bytes(audio_data), "wav"
+
+
 def try_convert_wav_to_mp3(wav_bytes: bytes) -> tuple[bytes, str]:
     """
     Returns (bytes, ext) where ext is 'mp3' or 'wav' (fallback).
     """
     try:
-        proc = subprocess.run(
+        proc = run_ffmpeg(
             [
                 "ffmpeg",
                 "-y",
@@ -89,6 +387,8 @@ def try_convert_wav_to_mp3(wav_bytes: bytes) -> tuple[bytes, str]:
                 "mp3",
                 "pipe:1",
             ],
+            stage="tts_mp3",
+            check=False,
             input=wav_bytes,
             capture_output=True,
             timeout=30,
@@ -100,33 +400,36 @@ def try_convert_wav_to_mp3(wav_bytes: bytes) -> tuple[bytes, str]:
     return wav_bytes, "wav"
 
 
-async def synthesize_and_store_media(
-    *,
-    company_id: str,
-    voisetext: str,
-    voice: str,
-    speed: float,
-) -> dict:
+def synthesize_deduplicated_cached(items: list[tuple[str, str, float]],
+                                   ext: str = RENDER_AUDIO_EXT) -> list[dict | None]:
     """
-    Generates TTS audio, stores it under ./media/<company_id>/..., and returns:
-      { "file_url": "<relative path>", "file_type": "audio", "size": <int>, "original_name": <str> }
+    Blocking many-text counterpart of synthesize_cached for workers: looks
+    every (text, voice, speed) up in the TTS cache and synthesizes the misses
+    in one synthesize_deduplicated call. Returns an entry per item, None for
+    empty texts and for texts that produced no audio.
     """
-    if not company_id:
-        raise HTTPException(400, "company_id is required")
-
-    audio_data = synthesize_audio_numpy(voisetext=voisetext, voice=voice, speed=speed)
-    wav_bytes = encode_wav_bytes(audio_data)
-    final_bytes, ext = try_convert_wav_to_mp3(wav_bytes)
-
-    uid = uuid.uuid4().hex
-    filename = f"tts_{uid}.{ext}"
-    fake_upload = UploadFile(filename=filename, file=BytesIO(final_bytes))
-    local_path, size = await save_upload_file(fake_upload, company_id)
+    keys = [
+        tts_cache_key(text, voice, speed, ext) if text and str(text).strip() else None
+        for text, voice, speed in items
+    ]
+    entries = {}
+    misses = {}
+    for key, item in zip(keys, items):
+        if key is None or key in entries or key in misses:
+            continue
+        cached = safe_lookup_tts(key)
+        record_cache("tts", cached is not None)
+        if cached is not None:
+            entries[key] = cached
+        else:
+            misses[key] = item
 
-    return {
-        "file_url": local_path,  # relative path (no ./media prefix)
-        "file_type": "audio",
-        "original_name": filename,
-        "size": size,
-    }
+    if misses:
+        audios = synthesize_deduplicated(list(misses.values()))
+        for (key, (text, voice, speed)), audio in zip(misses.items(), audios):
+            if audio is None:
+                continue
+            final_bytes, stored_ext = encode_audio(audio, ext)
+            entries[key] = store_tts(key, final_bytes, stored_ext, voice=voice, speed=speed, chars=len(text))
 
+    return [entries.get(key) if key is not None else None for key in keys]
@@ -0,0 +1,341 @@
+import os
+import re
+import time
+import shutil
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media")
+
+# What the store tracks. Anything it did not record (user uploads, task
+# deliverables referenced by video_tasks) is never deleted.
+KIND_PREVIEW = "preview"     # editor / customer / public previews
+KIND_DOWNLOAD = "download"   # public download renders
+KIND_TTS = "tts"             # per-render voiceover files from before the TTS cache
+KIND_CACHE = "cache"         # mezzanines, audio beds, fonts
+KINDS = (KIND_PREVIEW, KIND_DOWNLOAD, KIND_TTS, KIND_CACHE)
+
+_GB = 1024 ** 3
+
+
+def _parse_ttl_days(raw: str) -> dict:
+    ttl = {KIND_PREVIEW: 7.0, KIND_DOWNLOAD: 7.0, KIND_TTS: 2.0, KIND_CACHE: 30.0}
+    for part in raw.split(","):
+        if "=" in part:
+            kind, value = part.split("=", 1)
+            if kind.strip() in ttl:
+                ttl[kind.strip()] = float(value)
+    return ttl
+
+
+# Days since last access after which an artifact expires, per kind
+OUTPUT_TTL_DAYS = _parse_ttl_days(os.getenv("OUTPUT_TTL_DAYS", ""))
+# Least recently used artifacts go first once the total passes this...
+OUTPUT_DISK_BUDGET_BYTES = int(float(os.getenv("OUTPUT_DISK_BUDGET_GB", "20")) * _GB)
+# ...or once one company's artifacts pass this (0 disables quotas)
+OUTPUT_COMPANY_QUOTA_BYTES = int(float(os.getenv("OUTPUT_COMPANY_QUOTA_GB", "2")) * _GB)
+# Files accessed this recently are never evicted: a render may be reading
+# them or a response streaming them
+OUTPUT_EVICT_GRACE_SECONDS = float(os.getenv("OUTPUT_EVICT_GRACE_SECONDS", "600"))
+OUTPUT_EVICT_INTERVAL_SECONDS = float(os.getenv("OUTPUT_EVICT_INTERVAL_SECONDS", "900"))
+# Access times are written at most this often per file and process
+OUTPUT_TOUCH_INTERVAL_SECONDS = float(os.getenv("OUTPUT_TOUCH_INTERVAL_SECONDS", "60"))
+
+_touched: dict[str, float] = {}
+_touched_lock = threading.Lock()
+
+# ---------------------------------------------------------
+# HELPERS
+# ---------------------------------------------------------
+
+def _db(database):
+    if database is not None:
+        return database
+    from app.db.connection import get_sync_db
+    return get_sync_db()
+
+
+def media_key(path: str) -> str | None:
+    """Path relative to MEDIA_ROOT with forward slashes; None outside it."""
+    if not path:
+        return None
+    root = os.path.abspath(MEDIA_ROOT)
+    full = os.path.abspath(path)
+    if os.path.commonpath([root, full]) != root or full == root:
+        return None
+    return os.path.relpath(full, root).replace("\\", "/")
+
+
+def _full_path(key: str) -> str:
+    return os.path.join(os.path.abspath(MEDIA_ROOT), key)
+
+
+def ensure_output_indexes(database):
+    database.generated_outputs.create_index(
+        [("last_access_at", ASCENDING)], name="lru",
+    )
+    database.generated_outputs.create_index(
+        [("kind", ASCENDING), ("last_access_at", ASCENDING)], name="kind_lru",
+    )
+    database.generated_outputs.create_index(
+        [("company_id", ASCENDING), ("last_access_at", ASCENDING)], name="company_lru",
+    )
+
+# ---------------------------------------------------------
+# RECORDING
+# ---------------------------------------------------------
+
+def record_output(path: str, kind: str, company_id: str | None = None, database=None):
+    """
+    Registers a generated file (or refreshes its size and access time).
+    Never raises: a render that succeeded must not fail on bookkeeping.
+    """
+    key = media_key(path)
+    if key is None:
+        return
+    try:
+        now = datetime.utcnow()
+        size = os.path.getsize(_full_path(key))
+        _db(database).generated_outputs.update_one(
+            {"_id": key},
+            {
+                "$set": {
+                    "kind": kind,
+                    "company_id": str(company_id) if company_id else None,
+                    "size": size,
+                    "last_access_at": now,
+                },
+                "$setOnInsert": {"created_at": now},
+            },
+            upsert=True,
+        )
+        with _touched_lock:
+            _touched[key] = time.monotonic()
+    except Exception as e:
+        print(f"[outputs] Could not record {path}: {e}")
+
+
+def touch_output(path: str, database=None):
+    """Marks a tracked file as used now (cache hit, download); throttled."""
+    key = media_key(path)
+    if key is None:
+        return
+    now = time.monotonic()
+    with _touched_lock:
+        if now - _touched.get(key, float("-inf")) < OUTPUT_TOUCH_INTERVAL_SECONDS:
+            return
+        _touched[key] = now
+    try:
+        _db(database).generated_outputs.update_one(
+            {"_id": key},
+            {"$max": {"last_access_at": datetime.utcnow()}},
+        )
+    except Exception as e:
+        print(f"[outputs] Could not touch {path}: {e}")
+
+# ---------------------------------------------------------
+# EVICTION
+# ---------------------------------------------------------
+
+def _is_upload(database, key: str) -> bool:
+    # media.file_url is stored as "<company>/<file>", "./media/<company>/<file>"
+    # or a full URL; all of them end with the key
+    return database.media.find_one(
+        {"file_url": {"$regex": "(^|/)" + re.escape(key) + "$"}},
+        {"_id": 1},
+    ) is not None
+
+
+def _evict(database, doc: dict) -> int:
+    """Deletes one artifact and its record; returns the bytes freed."""
+    key = doc["_id"]
+    if _is_upload(database, key):
+        # a user saved this file to their library; it is theirs now
+        database.generated_outputs.delete_one({"_id": key})
+        return 0
+    try:
+        os.remove(_full_path(key))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"[outputs] Could not delete {key}: {e}")
+        return 0
+    database.generated_outputs.delete_one({"_id": key})
+    with _touched_lock:
+        _touched.pop(key, None)
+    return int(doc.get("size") or 0)
+
+
+def _evict_lru(database, query: dict, excess: int, cutoff: datetime) -> tuple[int, int]:
+    count = freed = 0
+    cursor = database.generated_outputs.find(
+        {**query, "last_access_at": {"$lt": cutoff}}
+    ).sort("last_access_at", ASCENDING)
+    for doc in cursor:
+        if freed >= excess:
+            break
+        freed += _evict(database, doc)
+        count += 1
+    return count, freed
+
+
+def evict_outputs(database=None, now: datetime | None = None) -> dict:
+    """
+    One eviction pass: expired artifacts first, then least recently used
+    ones of every company over its quota, then least recently used ones
+    overall until the total fits the disk budget.
+    """
+    database = _db(database)
+    now = now or datetime.utcnow()
+    grace_cutoff = now - timedelta(seconds=OUTPUT_EVICT_GRACE_SECONDS)
+    stats = {"expired": 0, "over_quota": 0, "over_budget": 0, "freed_bytes": 0}
+
+    for kind, days in OUTPUT_TTL_DAYS.items():
+        if days <= 0:
+            continue
+        cutoff = min(grace_cutoff, now - timedelta(days=days))
+        for doc in database.generated_outputs.find({"kind": kind, "last_access_at": {"$lt": cutoff}}):
+            stats["freed_bytes"] += _evict(database, doc)
+            stats["expired"] += 1
+
+    if OUTPUT_COMPANY_QUOTA_BYTES > 0:
+        usage = database.generated_outputs.aggregate([
+            {"$match": {"company_id": {"$ne": None}}},
+            {"$group": {"_id": "$company_id", "size": {"$sum": "$size"}}},
+        ])
+        for row in usage:
+            excess = row["size"] - OUTPUT_COMPANY_QUOTA_BYTES
+            if excess > 0:
+                count, freed = _evict_lru(database, {"company_id": row["_id"]}, excess, grace_cutoff)
+                stats["over_quota"] += count
+                stats["freed_bytes"] += freed
+
+    total = _total_size(database)
+    if total > OUTPUT_DISK_BUDGET_BYTES:
+        count, freed = _evict_lru(database, {}, total - OUTPUT_DISK_BUDGET_BYTES, grace_cutoff)
+        stats["over_budget"] += count
+        stats["freed_bytes"] += freed
+    return stats
+
+
+def _total_size(database) -> int:
+    rows = list(database.generated_outputs.aggregate([
+        {"$group": {"_id": None, "size": {"$sum": "$size"}}},
+    ]))
+    return int(rows[0]["size"]) if rows else 0
+
+# ---------------------------------------------------------
+# ADOPTION OF FILES WRITTEN BEFORE THE STORE EXISTED
+# ---------------------------------------------------------
+
+_PREVIEW_RE = re.compile(
+    r"^(?P<template>[0-9a-f]{24})_(?:[0-9a-f]{24}_)?"
+    r"(?P<kind>preview|public_preview|download)(?:_[0-9a-f]{16})?\.(?:mp4|jpg)$"
+)
+_TTS_RE = re.compile(r"^[0-9a-f]{32}_tts_[0-9a-f]{32}\.(?:mp3|wav)$")
+CACHE_DIRS = ("mezzanine_cache", "audio_bed_cache", "font_cache")
+
+
+def _adopt(database, key: str, kind: str, company_id) -> bool:
+    full = _full_path(key)
+    try:
+        stat = os.stat(full)
+    except OSError:
+        return False
+    result = database.generated_outputs.update_one(
+        {"_id": key},
+        {"$setOnInsert": {
+            "kind": kind,
+            "company_id": str(company_id) if company_id else None,
+            "size": stat.st_size,
+            "created_at": datetime.utcfromtimestamp(stat.st_mtime),
+            "last_access_at": datetime.utcfromtimestamp(stat.st_mtime),
+        }},
+        upsert=True,
+    )
+    return result.upserted_id is not None
+
+
+def adopt_untracked_outputs(database=None) -> int:
+    """
+    Registers generated files already on disk (previews, downloads, render
+    TTS, caches) so eviction can reclaim them; returns how many were new.
+    Files that media documents reference are skipped.
+    """
+    from bson import ObjectId
+
+    database = _db(database)
+    root = os.path.abspath(MEDIA_ROOT)
+    if not os.path.isdir(root):
+        return 0
+    adopted = 0
+    template_companies = {}
+
+    for name in os.listdir(root):
+        full = os.path.join(root, name)
+        match = _PREVIEW_RE.match(name)
+        if match and os.path.isfile(full):
+            template_id = match.group("template")
+            if template_id not in template_companies:
+                template = database.templates.find_one({"_id": ObjectId(template_id)}, {"company_id": 1})
+                template_companies[template_id] = (template or {}).get("company_id")
+            kind = KIND_DOWNLOAD if match.group("kind") == "download" else KIND_PREVIEW
+            adopted += _adopt(database, name, kind, template_companies[template_id])
+        elif name in CACHE_DIRS and os.path.isdir(full):
+            for entry in os.listdir(full):
+                if not entry.startswith(".") and os.path.isfile(os.path.join(full, entry)):
+                    adopted += _adopt(database, f"{name}/{entry}", KIND_CACHE, None)
+        elif os.path.isdir(full):
+            # media/<company_id>/<uuid>_tts_<uuid>.mp3 written by render-time TTS
+            # before it went through the TTS cache (which evicts its own files)
+            for entry in os.listdir(full):
+                key = f"{name}/{entry}"
+                if _TTS_RE.match(entry) and not _is_upload(database, key):
+                    adopted += _adopt(database, key, KIND_TTS, name)
+    return adopted
+
+# ---------------------------------------------------------
+# USAGE
+# ---------------------------------------------------------
+
+def output_usage(database=None) -> dict:
+    """Tracked bytes by kind and by company against the configured limits."""
+    database = _db(database)
+    by_kind = {
+        row["_id"]: {"bytes": row["size"], "files": row["files"]}
+        for row in database.generated_outputs.aggregate([
+            {"$group": {"_id": "$kind", "size": {"$sum": "$size"}, "files": {"$sum": 1}}},
+        ])
+    }
+    companies = [
+        {
+            "company_id": row["_id"],
+            "bytes": row["size"],
+            "files": row["files"],
+            "quota_bytes": OUTPUT_COMPANY_QUOTA_BYTES or None,
+        }
+        for row in database.generated_outputs.aggregate([
+            {"$match": {"company_id": {"$ne": None}}},
+            {"$group": {"_id": "$company_id", "size": {"$sum": "$size"}, "files": {"$sum": 1}}},
+            {"$sort": {"size": -1}},
+        ])
+    ]
+    disk = None
+    try:
+        total, used, free = shutil.disk_usage(os.path.abspath(MEDIA_ROOT))
+        disk = {"total_bytes": total, "used_bytes": used, "free_bytes": free}
+    except OSError:
+        pass
+    return {
+        "tracked_bytes": sum(kind["bytes"] for kind in by_kind.values()),
+        "budget_bytes": OUTPUT_DISK_BUDGET_BYTES,
+        "ttl_days": OUTPUT_TTL_DAYS,
+        "by_kind": by_kind,
+        "companies": companies,
+        "disk": disk,
+    }
@@ -0,0 +1,296 @@
+import os
+import re
+
+from app.services.tts import RENDER_AUDIO_EXT, synthesize_cached, synthesize_composed
+from app.services.url import build_media_url
+
+# -------------------------------------------------
+# Render context shared by the preview routes and the render worker
+# -------------------------------------------------
+
+# Voiceovers synthesized in segments (static script parts once per voice
+# and speed, customer-specific ones per customer) unless a track's
+# metadata.composeSegments says otherwise
+TTS_COMPOSE_SEGMENTS = os.getenv("TTS_COMPOSE_SEGMENTS", "0").lower() in ("1", "true", "yes")
+# Where scripts are cut into segments: sentence ends
+TTS_SEGMENT_SPLIT_RE = re.compile(os.getenv("TTS_SEGMENT_SPLIT", r"(?<=[.!?])\s+"))
+# Sentences holding a customer placeholder are cut further at clause
+# punctuation, so only the clause around the placeholder is per customer;
+# empty keeps those sentences whole
+TTS_CLAUSE_SPLIT = os.getenv("TTS_CLAUSE_SPLIT", r"(?<=[,;:])\s+")
+TTS_CLAUSE_SPLIT_RE = re.compile(TTS_CLAUSE_SPLIT) if TTS_CLAUSE_SPLIT else None
+
+def normalize_customer(customer: dict) -> dict:
+    safe = {}
+    for k, v in customer.items():
+        if k == "_id":
+            safe["id"] = str(v)
+        elif hasattr(v, "isoformat"):
+            safe[k] = v.isoformat()
+        else:
+            safe[k] = str(v) if v is not None else ""
+    return safe
+
+def normalize_company(company: dict | None) -> dict:
+    if not company:
+        return {}
+
+    return {
+        "company_name": company.get("company_name", ""),
+        "description": company.get("description", ""),        
+        "mobile": company.get("mobile", ""),        
+        "logo_url": company.get("logo_url", ""),   # image path / url
+    }
+
+PLACEHOLDER_RE = re.compile(r"\{\{?\s*([\w.]+)\s*\}?\}")
+
+def resolve_text_placeholders(text: str, context: dict) -> str:
+    """
+    Replace {{customer.full_name}}, {{company.company_name}}, {{customer.city}}
+    and also flat {{full_name}} style placeholders.
+
+    context = {
+        "customer": {"full_name": "John", "city": "Mumbai", ...},
+        "company":  {"company_name": "Acme", "mobile": "...", ...},
+    }
+    """
+    def replacer(match):
+        path = match.group(1).strip()          # e.g. "customer.full_name"
+        parts = path.split(".")
+
+        if len(parts) == 1:
+            # flat key → search all context buckets
+            key = parts[0].lower()
+            for bucket in context.values():
+                if isinstance(bucket, dict):
+                    # case-insensitive key lookup
+                    for k, v in bucket.items():
+                        if k.lower() == key:
+                            return str(v) if v is not None else ""
+            return match.group(0)              # leave untouched if not found
+
+        # nested: parts[0] = bucket, rest = key path
+        bucket_name = parts[0].lower()
+        bucket = None
+        for k, v in context.items():
+            if k.lower() == bucket_name:
+                bucket = v
+                break
+        if not isinstance(bucket, dict):
+            return match.group(0)
+
+        value = bucket
+        for key in parts[1:]:
+            if not isinstance(value, dict):
+                return match.group(0)
+            # case-insensitive
+            value = next(
+                (v for k, v in value.items() if k.lower() == key.lower()),
+                None
+            )
+            if value is None:
+                return ""
+        return str(value) if value is not None else ""
+
+    return PLACEHOLDER_RE.sub(replacer, text)
+
+def _is_dynamic(text: str) -> bool:
+    return any(
+        not match.group(1).strip().lower().startswith("company.")
+        for match in PLACEHOLDER_RE.finditer(text)
+    )
+
+def _voiceover_parts(raw_text: str, context: dict) -> list[list]:
+    # [resolved text, dynamic] pairs, alternating static and dynamic
+    parts = []
+    for sentence in TTS_SEGMENT_SPLIT_RE.split(raw_text.strip()):
+        if TTS_CLAUSE_SPLIT_RE is not None and _is_dynamic(sentence):
+            parts.extend(TTS_CLAUSE_SPLIT_RE.split(sentence))
+        else:
+            parts.append(sentence)
+
+    segments = []
+    for part in parts:
+        dynamic = _is_dynamic(part)
+        resolved = resolve_text_placeholders(part, context).strip()
+        if not resolved:
+            continue
+        if segments and segments[-1][1] == dynamic:
+            segments[-1][0] = f"{segments[-1][0]} {resolved}"
+        else:
+            segments.append([resolved, dynamic])
+    return segments
+
+def voiceover_segments(raw_text: str, context: dict) -> list[str]:
+    """
+    Cuts a voiceover script at TTS_SEGMENT_SPLIT boundaries, and sentences
+    with customer placeholders further at TTS_CLAUSE_SPLIT ones, then merges
+    neighbouring parts into alternating static and dynamic segments and
+    resolves them. Static parts hold no placeholders, or only
+    {{company.*}} ones, which are the same for every customer of a
+    campaign; so static segments come out identical across customers.
+    """
+    return [text for text, _ in _voiceover_parts(raw_text, context)]
+
+def voiceover_requests(template_json: dict, *, customer: dict, company: dict) -> list[dict]:
+    """
+    The voiceovers a template needs for one customer: every audio track item
+    where
+        metadata.isCustomerField == True
+        metadata.fieldPath       == "voiceover"   (case-insensitive)
+        metadata.dataType        == "audio"        (case-insensitive)
+
+    as {"tid", "item", "text", "voice", "speed", "segments",
+    "static_segments"} with placeholders in item["voisetext"] resolved into
+    text. segments is the voiceover_segments() split when the track is
+    composed, else None; static_segments are those of its segments without
+    customer placeholders, the same for every customer.
+    """
+    if not isinstance(template_json, dict):
+        return []
+
+    design    = template_json.get("design", {})
+    track_map = design.get("trackItemsMap", {})
+
+    context = {
+        "customer": customer or {},
+        "company":  company  or {},
+    }
+
+    requests = []
+    for tid, item in (track_map or {}).items():
+        if not isinstance(item, dict):
+            continue
+        if item.get("type") != "audio":
+            continue
+
+        metadata = item.get("metadata") or {}
+
+        # ── Guard checks ──────────────────────────────────────────────────
+        if not metadata.get("isCustomerField"):
+            continue
+
+        field_path = str(
+            metadata.get("fieldPath") or metadata.get("fieldpath") or ""
+        ).strip().lower()
+        if field_path != "voiceover":
+            continue
+
+        data_type = str(
+            metadata.get("dataType") or metadata.get("datatype") or ""
+        ).strip().lower()
+        if data_type != "audio":
+            continue
+
+        # ── Resolve voisetext ─────────────────────────────────────────────
+        raw_text = (
+            item.get("voisetext")
+            or (item.get("details") or {}).get("voisetext")
+            or ""
+        )
+        if not isinstance(raw_text, str) or not raw_text.strip():
+            print(f"[TTS] Skipping track {tid}: empty voisetext")
+            continue
+
+        resolved_text = resolve_text_placeholders(raw_text, context).strip()
+        if not resolved_text:
+            print(f"[TTS] Skipping track {tid}: resolved text is empty")
+            continue
+
+        # ── Voice / speed ─────────────────────────────────────────────────
+        voice = (
+            item.get("voice")
+            or metadata.get("voice")
+            or "af_heart"
+        )
+        try:
+            speed = float(item.get("playbackRate") or item.get("speed") or 1.0)
+        except (TypeError, ValueError):
+            speed = 1.0
+        speed = max(0.5, min(2.0, speed))      # clamp to valid range
+
+        compose = metadata.get("composeSegments")
+        if compose is None:
+            compose = TTS_COMPOSE_SEGMENTS
+        parts = _voiceover_parts(raw_text, context) if compose else []
+        composed = len(parts) > 1
+
+        requests.append({
+            "tid": tid,
+            "item": item,
+            "text": resolved_text,
+            "voice": str(voice),
+            "speed": speed,
+            "segments": [text for text, _ in parts] if composed else None,
+            "static_segments": [text for text, dynamic in parts if not dynamic] if composed else [],
+        })
+    return requests
+
+async def apply_dynamic_audio_to_template(
+    template_json: dict,
+    *,
+    customer: dict,
+    company: dict,
+    company_id: str | None,
+):
+    """
+    For every voiceover item (see voiceover_requests):
+
+    1. Resolve placeholders in item["voisetext"]  → resolved_text
+    2. Get audio for (resolved_text, voice, speed) via synthesize_cached,
+       or synthesize_composed for tracks composed from segments
+    3. Patch item.details.src + metadata.uploadedUrl / originalUrl
+    """
+    if not isinstance(template_json, dict) or not company_id:
+        return
+
+    design    = template_json.get("design", {})
+    track_map = design.get("trackItemsMap", {})
+
+    for request in voiceover_requests(template_json, customer=customer, company=company):
+        tid, item, resolved_text = request["tid"], request["item"], request["text"]
+        metadata = item.get("metadata") or {}
+        print(f"[TTS] Track {tid} | resolved: {resolved_text!r}")
+
+        # ── Generate TTS (content-addressed cache, Kokoro only on a miss) ─
+        try:
+            if request["segments"]:
+                stored = await synthesize_composed(
+                    segments=request["segments"],
+                    voice=request["voice"],
+                    speed=request["speed"],
+                )
+            else:
+                stored = await synthesize_cached(
+                    voisetext=resolved_text,
+                    voice=request["voice"],
+                    speed=request["speed"],
+                    # only the renderer reads it: lossless, no mp3 round trip
+                    ext=RENDER_AUDIO_EXT,
+                )
+        except Exception as exc:
+            print(f"[TTS] ERROR generating audio for track {tid}: {exc}")
+            import traceback; traceback.print_exc()
+            continue          # leave original audio untouched rather than crashing
+
+        # ── Patch the item in-place ───────────────────────────────────────
+        # details.src  →  local file path used by the renderer
+        details = item.get("details") or {}
+        details["src"] = f"./media/{stored['file_url']}"
+        item["details"] = details
+
+        # keep resolved text so renderer doesn't have to resolve again
+        item["voisetext"] = resolved_text
+
+        # public URL stored in metadata for logging / frontend display
+        new_url = build_media_url(stored["file_url"])
+        if new_url:
+            metadata["uploadedUrl"]  = new_url
+            metadata["originalUrl"]  = new_url
+        item["metadata"] = metadata
+
+        print(f"[TTS] Track {tid} patched → {details['src']}")
+
+    # write back (mutates template_json in-place, caller already holds ref)
+    design["trackItemsMap"] = track_map
+    template_json["design"] = design
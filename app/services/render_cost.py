@@ -0,0 +1,146 @@
+import os
+import math
+import threading
+from contextlib import contextmanager
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+# Relative decode/compose cost of one on-screen second of a layer, on top of
+# the per-frame overlay every layer pays
+LAYER_DECODE_COST = {
+    "video": 1.0,    # decoded frame by frame, usually at source resolution
+    "image": 0.15,   # decoded once, scaled and overlaid every frame
+    "text": 0.1,     # drawtext per frame
+}
+# Each audio input adds decode + resample + mix work to the whole render
+AUDIO_TRACK_COST = 0.05
+# Cost units one ffmpeg thread is expected to handle before another thread
+# pays off; a 5s image template is ~2k units, a 60s 1080p template with four
+# video layers ~150k
+RENDER_COST_PER_THREAD = float(os.getenv("RENDER_COST_PER_THREAD", "20000"))
+RENDER_MIN_THREADS = max(1, int(os.getenv("RENDER_MIN_THREADS", "1")))
+# x264 and the filter graph stop scaling well past ~8 threads at 1080p
+RENDER_MAX_THREADS = max(
+    RENDER_MIN_THREADS,
+    int(os.getenv("RENDER_MAX_THREADS", str(min(8, os.cpu_count() or 2)))),
+)
+
+_local = threading.local()
+
+# ---------------------------------------------------------
+# ESTIMATE
+# ---------------------------------------------------------
+
+def _duration_and_design(template) -> tuple[float, dict]:
+    """Same duration rules as render_preview: explicit, else trim span, else 10s."""
+    if not isinstance(template, dict):
+        return 10.0, {}
+    source = template
+    template_json = template.get("template_json", template)
+    if not isinstance(template_json, dict):
+        template_json = {}
+    duration = source.get("duration") or template_json.get("duration")
+    trim = source.get("trim") or template_json.get("trim") or {}
+    if not duration and isinstance(trim, dict) and trim.get("end") is not None:
+        try:
+            duration = float(trim.get("end", 0)) - float(trim.get("start", 0))
+        except (TypeError, ValueError):
+            duration = None
+    try:
+        duration = float(duration or 0)
+    except (TypeError, ValueError):
+        duration = 0.0
+    design = template_json.get("design") or {}
+    return (duration if duration > 0 else 10.0), design
+
+
+def _int(value, default: int) -> int:
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def _active_seconds(item: dict, duration: float) -> float:
+    display = item.get("display") or {}
+    try:
+        start = float(display.get("from", 0)) / 1000
+        end = float(display.get("to", duration * 1000)) / 1000
+    except (TypeError, ValueError):
+        return duration
+    return max(0.0, min(end, duration) - max(start, 0.0))
+
+
+def estimate_render_cost(template) -> dict:
+    """
+    Estimates how much CPU work rendering a template takes, from
+
+        duration x output pixels x fps x active layers x decode cost x audio
+
+    Accepts a full template document or its template_json. "cost" is in
+    relative units (megapixel-frames scaled by the layer and audio factors);
+    only ratios between templates matter: the scheduler uses it to order
+    the batch lane and to size each job's ffmpeg threads.
+    """
+    duration, design = _duration_and_design(template)
+    size = design.get("size") or {}
+    width = _int(size.get("width"), 1920)
+    height = _int(size.get("height"), 1080)
+    fps = _int(design.get("fps"), 30)
+
+    layers = 0.0
+    decode = 0.0
+    audio_tracks = 0
+    for item in (design.get("trackItemsMap") or {}).values():
+        if not isinstance(item, dict):
+            continue
+        kind = item.get("type")
+        if kind == "audio":
+            audio_tracks += 1
+            continue
+        if kind not in LAYER_DECODE_COST:
+            continue
+        # layers count by the share of the timeline they are on screen
+        share = _active_seconds(item, duration) / duration
+        layers += share
+        decode += share * LAYER_DECODE_COST[kind]
+
+    megapixel_frames = width * height / 1e6 * fps * duration
+    cost = megapixel_frames * (1 + layers) * (1 + decode) * (1 + AUDIO_TRACK_COST * audio_tracks)
+    return {
+        "duration": duration,
+        "pixels": width * height,
+        "fps": fps,
+        "layers": round(layers, 3),
+        "decode": round(decode, 3),
+        "audio_tracks": audio_tracks,
+        "cost": round(cost, 1),
+    }
+
+
+def threads_for_cost(cost: float | None, max_threads: int = RENDER_MAX_THREADS) -> int:
+    """ffmpeg threads worth giving a render of this cost."""
+    if cost is None:
+        return RENDER_MIN_THREADS
+    wanted = math.ceil(max(0.0, cost) / RENDER_COST_PER_THREAD)
+    return max(RENDER_MIN_THREADS, min(max_threads, wanted))
+
+
+@contextmanager
+def allocated_threads(threads: int | None):
+    """
+    Makes threads the ffmpeg thread count of renders run by this thread.
+    Entered by the worker-side scheduler, read by video_renderer.
+    """
+    previous = getattr(_local, "threads", None)
+    _local.threads = threads
+    try:
+        yield
+    finally:
+        _local.threads = previous
+
+
+def current_threads() -> int | None:
+    """Threads the scheduler gave the render running on this thread, if any."""
+    return getattr(_local, "threads", None)
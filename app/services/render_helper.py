@@ -1,7 +1,31 @@
 import os
+import subprocess
 
+from app.utils.metrics import FFMPEG_EXITS
 from app.utils.placeholders import replace_placeholders
 
+# -------------------------------------------------
+# FFMPEG
+# -------------------------------------------------
+
+def run_ffmpeg(cmd: list, stage: str, check: bool = True, **kwargs):
+    """
+    subprocess.run for ffmpeg that counts exit codes per pipeline stage.
+    Raises CalledProcessError like check=True would.
+    """
+    try:
+        result = subprocess.run(cmd, **kwargs)
+    except OSError:
+        FFMPEG_EXITS.inc(stage=stage, code="spawn_error")
+        raise
+    except subprocess.TimeoutExpired:
+        FFMPEG_EXITS.inc(stage=stage, code="timeout")
+        raise
+    FFMPEG_EXITS.inc(stage=stage, code=result.returncode)
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, cmd, result.stdout, result.stderr)
+    return result
+
 # -------------------------------------------------
 # BACKGROUND (image / video)
 # -------------------------------------------------
@@ -59,3 +83,39 @@ def get_text_items(template_json: dict) -> list:
         if item.get("type") == "text"
     ]
 
+
+# -------------------------------------------------
+# INPUT SEEKING
+# -------------------------------------------------
+
+def item_seek_window(item: dict, duration: float) -> tuple[float, float | None]:
+    """
+    Returns (seek_sec, length_sec) for a video/audio item: the part of the
+    source that is actually shown, from trim.from for the shorter of the
+    trimmed length and the display window. length_sec is None when the item
+    has no visible window.
+    """
+    display = item.get("display", {}) or {}
+    trim = item.get("trim", {}) or {}
+
+    start_ms = float(display.get("from", 0) or 0)
+    end_ms = float(display.get("to", duration * 1000))
+    length_ms = max(0.0, end_ms - start_ms)
+
+    trim_from = max(0.0, float(trim.get("from", 0) or 0))
+    if trim.get("to") is not None:
+        length_ms = min(length_ms, max(0.0, float(trim["to"]) - trim_from))
+
+    if length_ms <= 0:
+        return trim_from / 1000.0, None
+    return trim_from / 1000.0, length_ms / 1000.0
+
+
+def seek_input_args(seek_sec: float, length_sec: float | None) -> list[str]:
+    """ffmpeg input options so only the needed range of a source is decoded."""
+    args = []
+    if seek_sec > 0:
+        args += ["-ss", f"{seek_sec:.3f}"]
+    if length_sec:
+        args += ["-t", f"{length_sec:.3f}"]
+    return args
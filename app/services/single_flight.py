@@ -0,0 +1,112 @@
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+from contextlib import contextmanager
+
+from app.services.output_store import KIND_PREVIEW, record_output, touch_output
+from app.services.render_cost import estimate_render_cost
+from app.utils.metrics import REGISTRY, record_cache
+from app.worker.lanes import LANE_INTERACTIVE, run_in_lane
+
+COALESCED = REGISTRY.counter(
+    "autovid_render_coalesced_total",
+    "Requests that joined a render already in flight instead of starting ffmpeg.",
+    ("kind",),
+)
+
+# ---------------------------------------------------------
+# HELPERS
+# ---------------------------------------------------------
+
+def render_identity(*parts) -> str:
+    """Stable hash of everything that determines a render's output."""
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def atomic_output(output_path: str):
+    """
+    Yields a temporary path next to output_path (same extension, so ffmpeg
+    picks the same muxer) and renames it over output_path only on success.
+    Readers see either the previous file or the complete new one.
+    """
+    root, ext = os.path.splitext(output_path)
+    tmp_path = f"{root}.{uuid.uuid4().hex}.part{ext}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# ---------------------------------------------------------
+# SINGLE FLIGHT
+# ---------------------------------------------------------
+
+class SingleFlight:
+    """
+    Runs at most one coroutine per key at a time; concurrent callers with
+    the same key await the first caller's result (or exception).
+    """
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: str, fn, kind: str = "render"):
+        task = self._inflight.get(key)
+        if task is None:
+            # A task, not a bare await: the render keeps going for the other
+            # callers even if the first client disconnects
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        else:
+            COALESCED.inc(kind=kind)
+        return await asyncio.shield(task)
+
+
+renders = SingleFlight()
+
+
+async def render_once(key: str, output_path: str, render, *args, reuse: bool = True,
+                      lane: str = LANE_INTERACTIVE, kind: str = "render", cost: float | None = None,
+                      output_kind: str = KIND_PREVIEW, company_id: str | None = None, prepare=None):
+    """
+    Calls render(*args, tmp_path) once per key, however many requests ask
+    for it concurrently, and atomically moves the result to output_path.
+    With reuse=True an existing output_path is served without rendering.
+    prepare, an async callable, runs first within the same single flight
+    (e.g. voiceover TTS that fills in the template). Renderers take the
+    template first; its estimated cost sizes the render's core share
+    unless cost is given. The output is registered in the output store as
+    output_kind, charged to company_id.
+    """
+    async def work():
+        if reuse:
+            cached = os.path.exists(output_path)
+            record_cache(kind, cached)
+            if cached:
+                await asyncio.to_thread(touch_output, output_path)
+                return output_path
+
+        if prepare is not None:
+            await prepare()
+        render_cost = cost
+        if render_cost is None and args:
+            render_cost = estimate_render_cost(args[0])["cost"]
+
+        def run():
+            with atomic_output(output_path) as tmp_path:
+                render(*args, tmp_path)
+            record_output(output_path, output_kind, company_id)
+
+        await run_in_lane(lane, run, cost=render_cost)
+        return output_path
+
+    return await renders.do(key, work, kind=kind)
@@ -0,0 +1,493 @@
+import os
+import copy
+import json
+import math
+import hashlib
+import time
+import traceback
+
+from app.services.audio_mix import mix_audio_sources
+from app.services.output_store import KIND_CACHE, record_output, touch_output
+from app.services.render_helper import item_seek_window, run_ffmpeg, seek_input_args
+from app.services.video_renderer import (
+    FFMPEG,
+    MEDIA_ROOT,
+    build_audio_source,
+    has_audio_stream,
+    is_dynamic_item,
+    normalize_media_src,
+    render_preview,
+    resolve_fps,
+    resolve_canvas_size,
+    safe_float,
+)
+from app.services.workspace import RenderWorkspace
+from app.utils.metrics import REGISTRY, RENDER_SECONDS, record_cache
+from app.utils.placeholders import replace_placeholders
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+SMART_RENDER = os.getenv("SMART_RENDER", "true").lower() == "true"
+# Above this share of re-encoded time a full encode is just as cheap
+SMART_RENDER_MAX_DYNAMIC_RATIO = float(os.getenv("SMART_RENDER_MAX_DYNAMIC_RATIO", "0.5"))
+MEZZANINE_GOP_SECONDS = float(os.getenv("MEZZANINE_GOP_SECONDS", "1.0"))
+MEZZANINE_DIR = os.path.join(MEDIA_ROOT, "mezzanine_cache")
+
+# A broken fast path still produces correct video through the full encode,
+# so it only shows up here: alert on reason="failed"
+SMART_RENDER_FALLBACKS = REGISTRY.counter(
+    "autovid_smart_render_fallback_total",
+    "Renders that took the full encode instead of smart rendering, by reason (not_eligible or failed).",
+    ("reason",),
+)
+
+
+class NotEligible(Exception):
+    """The template cannot be smart-rendered; use the full encode."""
+
+# ---------------------------------------------------------
+# TEMPLATE ANALYSIS
+# ---------------------------------------------------------
+
+def _split_template(template: dict):
+    if isinstance(template, dict) and "template_json" in template:
+        full_template = template
+    else:
+        full_template = {
+            "template_json": template,
+            "duration": template.get("duration") if isinstance(template, dict) else None,
+            "trim": template.get("trim") if isinstance(template, dict) else None,
+        }
+    template_json = full_template.get("template_json") or {}
+    design = template_json.get("design", {}) if isinstance(template_json, dict) else {}
+    return full_template, design
+
+
+def _resolve_duration(full_template: dict) -> float:
+    trim = full_template.get("trim") or {}
+    duration = full_template.get("duration")
+    if not duration and trim.get("end") is not None:
+        duration = float(trim.get("end", 0)) - float(trim.get("start", 0))
+    try:
+        duration = float(duration)
+    except (TypeError, ValueError):
+        duration = 0
+    return duration if duration > 0 else 10.0
+
+
+def _paint_order(design: dict) -> list[str]:
+    """Item ids in the order render_preview draws them: visuals, then text."""
+    items_map = design.get("trackItemsMap", {})
+    order = [
+        tid for tid in design.get("trackItemIds", [])
+        if items_map.get(tid, {}).get("type") in ("video", "image")
+    ]
+    for track in design.get("tracks", []):
+        if track.get("type") == "text":
+            order += [tid for tid in track.get("items", []) if tid in items_map]
+    return order
+
+
+def _item_window(item: dict, duration: float) -> tuple[float, float]:
+    display = item.get("display", {}) or {}
+    start = max(0.0, float(display.get("from", 0) or 0) / 1000)
+    end = min(duration, float(display.get("to", duration * 1000)) / 1000)
+    return start, end
+
+
+def dynamic_windows(design: dict, duration: float) -> list[tuple[float, float]]:
+    """Merged time ranges (seconds) where a dynamic visual or text layer is active."""
+    items_map = design.get("trackItemsMap", {})
+    windows = []
+    for tid in _paint_order(design):
+        item = items_map[tid]
+        if is_dynamic_item(item):
+            start, end = _item_window(item, duration)
+            if end > start:
+                windows.append((start, end))
+    return _merge(windows)
+
+
+def align_windows(windows, gop_sec: float, duration: float) -> list[tuple[float, float]]:
+    """Expands windows outwards to the mezzanine keyframe grid."""
+    aligned = []
+    for start, end in windows:
+        a = math.floor(start / gop_sec + 1e-9) * gop_sec
+        b = math.ceil(end / gop_sec - 1e-9) * gop_sec
+        aligned.append((max(0.0, a), min(duration, b)))
+    return _merge(aligned)
+
+
+def _merge(windows):
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1] + 1e-6:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _check_layering(design: dict, duration: float):
+    """
+    The mezzanine bakes every static layer in, so a static layer painted
+    above a dynamic one at the same time would end up underneath it.
+    """
+    items_map = design.get("trackItemsMap", {})
+    order = _paint_order(design)
+    for pos, tid in enumerate(order):
+        item = items_map[tid]
+        if not is_dynamic_item(item):
+            continue
+        d_start, d_end = _item_window(item, duration)
+        for later in order[pos + 1:]:
+            other = items_map[later]
+            if is_dynamic_item(other):
+                continue
+            o_start, o_end = _item_window(other, duration)
+            if o_start < d_end and d_start < o_end:
+                raise NotEligible(f"static layer {later} is drawn above dynamic layer {tid}")
+
+
+def _static_template(full_template: dict, design: dict) -> dict:
+    """Template copy with every dynamic layer removed, for the mezzanine."""
+    static = copy.deepcopy(full_template)
+    static.pop("_id", None)
+    static_design = static["template_json"]["design"]
+    items_map = static_design.get("trackItemsMap", {})
+
+    # The full render lowers video audio under any audio track; removing the
+    # dynamic ones (voiceovers) must not change that in the mezzanine
+    static["duck_video_audio"] = any(
+        item.get("type") == "audio" and (item.get("details") or {}).get("src")
+        for item in items_map.values()
+    )
+    for tid in [tid for tid, item in items_map.items() if is_dynamic_item(item)]:
+        del items_map[tid]
+
+    static_design["trackItemIds"] = [
+        tid for tid in static_design.get("trackItemIds", []) if tid in items_map
+    ]
+    for track in static_design.get("tracks", []):
+        track["items"] = [tid for tid in track.get("items", []) if tid in items_map]
+    return static
+
+
+def check_eligibility(template: dict) -> dict:
+    """
+    Returns the smart-render plan for a template or raises NotEligible.
+    """
+    full_template, design = _split_template(template)
+    if not design.get("trackItemsMap"):
+        raise NotEligible("template has no items")
+
+    duration = _resolve_duration(full_template)
+    fps = resolve_fps(design)
+    if fps <= 0:
+        raise NotEligible("invalid fps")
+    gop_frames = max(1, int(round(MEZZANINE_GOP_SECONDS * fps)))
+    gop_sec = gop_frames / fps
+    if duration < 2 * gop_sec:
+        raise NotEligible("template shorter than two mezzanine GOPs")
+
+    items_map = design["trackItemsMap"]
+    for tid, item in items_map.items():
+        if item.get("type") not in ("video", "image", "text", "audio"):
+            raise NotEligible(f"unsupported item type {item.get('type')}")
+        if item.get("type") == "video" and is_dynamic_item(item):
+            volume = safe_float((item.get("details") or {}).get("volume", 100))
+            if volume > 0:
+                raise NotEligible(f"dynamic video {tid} carries audio")
+
+    _check_layering(design, duration)
+
+    windows = align_windows(dynamic_windows(design, duration), gop_sec, duration)
+    dynamic_time = sum(end - start for start, end in windows)
+    if dynamic_time > SMART_RENDER_MAX_DYNAMIC_RATIO * duration:
+        raise NotEligible(f"dynamic layers cover {dynamic_time:.1f}s of {duration:.1f}s")
+
+    return {
+        "template": full_template,
+        "design": design,
+        "duration": duration,
+        "fps": fps,
+        "gop_frames": gop_frames,
+        "windows": windows,
+    }
+
+# ---------------------------------------------------------
+# MEZZANINE
+# ---------------------------------------------------------
+
+def encoder_args(fps: int, gop_frames: int) -> list[str]:
+    """Encoder options shared by the mezzanine and the re-encoded windows."""
+    gop_sec = gop_frames / fps
+    return [
+        "-profile:v", "high",
+        "-g", str(gop_frames),
+        "-keyint_min", str(gop_frames),
+        "-sc_threshold", "0",
+        "-force_key_frames", f"expr:gte(t,n_forced*{gop_sec})",
+    ]
+
+
+def _fingerprint(src: str) -> dict:
+    if not isinstance(src, str) or not src:
+        return {}
+    try:
+        path = normalize_media_src(src)
+    except Exception:
+        return {"src": src}
+    if path.startswith("http"):
+        return {"src": path}
+    try:
+        st = os.stat(path)
+        return {"src": path, "size": st.st_size, "mtime": st.st_mtime_ns}
+    except OSError:
+        return {"src": path, "missing": True}
+
+
+def mezzanine_key(static_template: dict, fps: int, gop_frames: int) -> str:
+    design = static_template["template_json"]["design"]
+    spec = {
+        "design": design,
+        "duration": static_template.get("duration"),
+        "trim": static_template.get("trim"),
+        "duck_video_audio": static_template.get("duck_video_audio"),
+        "encoder": encoder_args(fps, gop_frames),
+        "media": [
+            _fingerprint((item.get("details") or {}).get("src"))
+            for item in design.get("trackItemsMap", {}).values()
+        ],
+    }
+    raw = json.dumps(spec, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:32]
+
+
+def get_or_build_mezzanine(plan: dict) -> str:
+    """
+    Renders every static layer once per template version into an MP4 with a
+    fixed GOP, so windows can be cut on keyframes and stream-copied.
+    """
+    static = _static_template(plan["template"], plan["design"])
+    static["duration"] = plan["duration"]
+    os.makedirs(MEZZANINE_DIR, exist_ok=True)
+    key = mezzanine_key(static, plan["fps"], plan["gop_frames"])
+    path = os.path.join(MEZZANINE_DIR, f"mezz_{key}.mp4").replace("\\", "/")
+    hit = os.path.exists(path)
+    record_cache("mezzanine", hit)
+    if hit:
+        touch_output(path)
+        return path
+
+    # render_preview promotes atomically, so concurrent builders never
+    # expose a half-written mezzanine
+    render_preview(
+        static,
+        {"customer": {}, "company": {}},
+        path,
+        extra_output_args=encoder_args(plan["fps"], plan["gop_frames"]),
+        profile="mezzanine",
+    )
+    record_output(path, KIND_CACHE)
+    return path
+
+# ---------------------------------------------------------
+# SEGMENTS
+# ---------------------------------------------------------
+
+def _window_template(plan: dict, mezz_path: str, start: float, end: float) -> dict:
+    """
+    Template for one re-encoded window: the mezzanine slice as a full-canvas
+    base video with the dynamic layers shifted onto the window's timeline.
+    """
+    design = plan["design"]
+    canvas_w, canvas_h = resolve_canvas_size(design)
+    items_map = design.get("trackItemsMap", {})
+    length = end - start
+
+    win_map = {
+        "__mezzanine__": {
+            "type": "video",
+            "details": {
+                "src": os.path.relpath(mezz_path, MEDIA_ROOT).replace("\\", "/"),
+                "width": canvas_w,
+                "height": canvas_h,
+                "left": 0,
+                "top": 0,
+                "volume": 0,
+            },
+            "display": {"from": 0, "to": length * 1000},
+            "trim": {"from": start * 1000, "to": end * 1000},
+        }
+    }
+    visual_ids = ["__mezzanine__"]
+    text_ids = []
+
+    for tid in _paint_order(design):
+        item = items_map[tid]
+        if not is_dynamic_item(item):
+            continue
+        i_start, i_end = _item_window(item, plan["duration"])
+        if i_end <= start or i_start >= end:
+            continue
+        shifted = copy.deepcopy(item)
+        clip_start = max(i_start, start)
+        shifted["display"] = {
+            "from": round((clip_start - start) * 1000, 3),
+            "to": round((min(i_end, end) - start) * 1000, 3),
+        }
+        if item.get("type") == "video":
+            trim = dict(shifted.get("trim") or {})
+            skipped_ms = (clip_start - i_start) * 1000
+            trim["from"] = float(trim.get("from", 0) or 0) + skipped_ms
+            shifted["trim"] = trim
+        win_map[tid] = shifted
+        if item.get("type") == "text":
+            text_ids.append(tid)
+        else:
+            visual_ids.append(tid)
+
+    return {
+        "duration": length,
+        "template_json": {
+            "design": {
+                "size": {"width": canvas_w, "height": canvas_h},
+                "fps": plan["fps"],
+                "trackItemIds": visual_ids,
+                "trackItemsMap": win_map,
+                "tracks": [{"type": "text", "items": text_ids}],
+            }
+        },
+    }
+
+
+def _copy_segment(mezz_path: str, start: float, end: float, out_path: str):
+    cmd = [
+        FFMPEG, "-y", "-v", "error",
+        "-ss", f"{start:.3f}", "-i", mezz_path,
+        "-t", f"{end - start:.3f}",
+        "-map", "0:v", "-c:v", "copy",
+        "-bsf:v", "h264_mp4toannexb",
+        "-f", "mpegts", out_path,
+    ]
+    run_ffmpeg(cmd, stage="segment_copy")
+
+
+def _dynamic_audio_sources(plan: dict, context: dict, first_index: int) -> list[dict]:
+    items_map = plan["design"].get("trackItemsMap", {})
+    sources = []
+    for tid in plan["design"].get("trackItemIds", []) or list(items_map.keys()):
+        item = items_map.get(tid, {})
+        if item.get("type") != "audio" or not is_dynamic_item(item):
+            continue
+        details = item.get("details", {})
+        volume = safe_float(details.get("volume", 100)) / 100.0
+        src = replace_placeholders(details.get("src", ""), context)
+        if volume <= 0 or not src:
+            continue
+        entry = {"src": normalize_media_src(src), "item": item}
+        seek_sec, length_sec = item_seek_window(item, plan["duration"])
+        entry["seek_ms"] = int(round(seek_sec * 1000))
+        source = build_audio_source(entry, plan["duration"], volume, index=first_index + len(sources))
+        source["seek_args"] = seek_input_args(seek_sec, length_sec)
+        sources.append(source)
+    return sources
+
+# ---------------------------------------------------------
+# ENTRY POINT
+# ---------------------------------------------------------
+
+def smart_render(plan: dict, context: dict, output_path: str) -> str:
+    mezz_path = get_or_build_mezzanine(plan)
+    duration = plan["duration"]
+    with RenderWorkspace() as ws:
+        # Alternate stream-copied and re-encoded segments along the timeline
+        segments = []
+        cursor = 0.0
+        for start, end in plan["windows"] + [(duration, duration)]:
+            if start > cursor:
+                seg = ws.path(f"seg_{len(segments):03d}.ts")
+                _copy_segment(mezz_path, cursor, start, seg)
+                segments.append(seg)
+            if end > start:
+                seg = ws.path(f"seg_{len(segments):03d}.ts")
+                render_preview(
+                    _window_template(plan, mezz_path, start, end),
+                    context,
+                    seg,
+                    audio=False,
+                    extra_output_args=encoder_args(plan["fps"], plan["gop_frames"]),
+                    profile="window",
+                    workspace=ws,
+                )
+                segments.append(seg)
+            cursor = max(cursor, end)
+
+        concat_list = ws.path("segments.txt")
+        with open(concat_list, "w", encoding="utf-8") as f:
+            for seg in segments:
+                f.write(f"file '{os.path.abspath(seg)}'\n")
+
+        # Join the segments and lay the mezzanine audio (static mix) back in,
+        # mixing any customer-specific tracks such as TTS voiceovers on top.
+        dynamic_audio = _dynamic_audio_sources(plan, context, first_index=2)
+        mezz_has_audio = has_audio_stream(mezz_path)
+        cmd = [FFMPEG, "-y", "-f", "concat", "-safe", "0", "-i", concat_list, "-i", mezz_path]
+        for src in dynamic_audio:
+            cmd += src["seek_args"] + ["-i", src["src"]]
+        cmd += ["-map", "0:v", "-c:v", "copy"]
+
+        if dynamic_audio:
+            filter_parts = []
+            bed_labels = []
+            if mezz_has_audio:
+                filter_parts.append("[1:a]aresample=async=1:first_pts=0[abed]")
+                bed_labels.append("[abed]")
+            if mix_audio_sources(filter_parts, dynamic_audio, "[outa]", extra_labels=bed_labels):
+                cmd += ["-filter_complex", ";".join(filter_parts), "-map", "[outa]", "-c:a", "aac"]
+            else:
+                cmd += ["-an"]
+        elif mezz_has_audio:
+            cmd += ["-map", "1:a", "-c:a", "copy"]
+        else:
+            cmd += ["-an"]
+
+        scratch_output = ws.path("output.mp4")
+        cmd += ["-t", str(duration), "-movflags", "+faststart", scratch_output]
+        print("Smart render FFmpeg command:", " ".join(cmd))
+        run_ffmpeg(cmd, stage="smart_concat")
+        ws.promote(scratch_output, output_path)
+    return output_path
+
+
+def render_preview_smart(template, context_data=None, output_path=None):
+    """
+    Drop-in replacement for render_preview: re-encodes only the windows where
+    dynamic layers are active and stream-copies the rest from a cached
+    mezzanine. Falls back to the full encode whenever the template is not
+    eligible or the smart path fails.
+    """
+    context = context_data if isinstance(context_data, dict) else {"customer": {}, "company": {}}
+    if SMART_RENDER:
+        try:
+            plan = check_eligibility(template)
+        except NotEligible as e:
+            SMART_RENDER_FALLBACKS.inc(reason="not_eligible")
+            print(f"   ℹ️ Smart render not eligible ({e}); full encode")
+        else:
+            try:
+                started = time.perf_counter()
+                result = smart_render(plan, context, output_path)
+                RENDER_SECONDS.observe(
+                    time.perf_counter() - started,
+                    template_type=(template or {}).get("type") or "video",
+                    profile="smart",
+                )
+                return result
+            except Exception as e:
+                SMART_RENDER_FALLBACKS.inc(reason="failed")
+                print(f"   ⚠️ Smart render failed ({type(e).__name__}: {e}); full encode")
+                traceback.print_exc()
+    return render_preview(template, context_data, output_path)
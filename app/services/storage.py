@@ -1,8 +1,17 @@
 import os
 import uuid
+import asyncio
+import hashlib
 from typing import Tuple
 
+from fastapi import HTTPException
+
 LOCAL_MEDIA_ROOT = os.getenv("LOCAL_MEDIA_ROOT", "./media")
+# Uploads are copied to disk in chunks of this size, so a worker holds one
+# chunk per upload however large the file is
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+# Larger uploads are refused with a 413
+UPLOAD_MAX_BYTES = int(float(os.getenv("UPLOAD_MAX_MB", "5120")) * 1024 * 1024)
 
 def save_file_local(file_obj: bytes, folder_path: str, filename: str) -> str:
     company_folder = os.path.join(LOCAL_MEDIA_ROOT, folder_path)
@@ -16,20 +25,58 @@ def save_file_local(file_obj: bytes, folder_path: str, filename: str) -> str:
 
     return f"{folder_path}/{unique_name}"
 
+def _too_large() -> HTTPException:
+    return HTTPException(413, f"File exceeds the {UPLOAD_MAX_BYTES // (1024 * 1024)}MB upload limit")
+
+async def stream_upload(file, folder_path: str, max_bytes: int | None = None) -> dict:
+    """
+    Copies an upload to LOCAL_MEDIA_ROOT/folder_path/<uuid>_<filename> in
+    UPLOAD_CHUNK_BYTES chunks, hashing it on the way. It is written to a
+    temp file next to the target and renamed when complete, so a failed or
+    oversized upload leaves nothing behind. Returns
+      { "path": "<folder_path>/<name>", "size": <int>, "sha256": <hex> }
+    """
+    max_bytes = UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    # multipart parsing already knows the size of spooled uploads
+    declared = getattr(file, "size", None)
+    if declared is not None and declared > max_bytes:
+        raise _too_large()
+
+    folder = os.path.join(LOCAL_MEDIA_ROOT, folder_path)
+    os.makedirs(folder, exist_ok=True)
+    unique_name = f"{uuid.uuid4().hex}_{file.filename}"
+    full_path = os.path.join(folder, unique_name)
+    tmp_path = os.path.join(folder, f".{unique_name}.part")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise _too_large()
+                digest.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+        os.replace(tmp_path, full_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return {"path": f"{folder_path}/{unique_name}", "size": size, "sha256": digest.hexdigest()}
+
 async def save_company_file(file, company_user_id: str):
-    content = await file.read()
-    path = save_file_local(content, company_user_id, file.filename)
-    return path, len(content)
+    stored = await stream_upload(file, company_user_id)
+    return stored["path"], stored["size"]
 
 async def save_customer_file(
     file,
     company_user_id: str,
     customer_id: str
 ):
-    content = await file.read()
     folder = f"{company_user_id}/customers/{customer_id}"
-    path = save_file_local(content, folder, file.filename)
-    return path, len(content)
+    stored = await stream_upload(file, folder)
+    return stored["path"], stored["size"]
 
 def save_file_local_for_media(file_obj: bytes, company_id: str, filename: str) -> str:
     print(f"Saving file for company {company_id} with filename {filename}")
@@ -52,6 +99,6 @@ def save_file_local_for_media(file_obj: bytes, company_id: str, filename: str) -
 
 async def save_upload_file(file, company_id: str) -> Tuple[str, int]:
     print("Saving uploaded file for company:", company_id)
-    content = await file.read()
-    path = save_file_local_for_media(content, company_id, file.filename)
-    return path, len(content)
+    # RELATIVE path WITHOUT "media/" prefix, like save_file_local_for_media
+    stored = await stream_upload(file, company_id)
+    return stored["path"], stored["size"]
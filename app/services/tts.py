@@ -0,0 +1,143 @@
+import os
+import uuid
+import struct
+import asyncio
+from io import BytesIO
+
+from fastapi import UploadFile, HTTPException
+
+from app.services.storage import save_upload_file
+from app.services.tts_cache import MEDIA_ROOT, lookup_tts, store_tts, tts_cache_key
+from app.services.tts_executor import compose_files, tts_executor
+from app.utils.metrics import record_cache
+
+# TTS entry points of the API and the renderer: cache, TTS pool, library
+# copies. Nothing here imports torch, numpy or Kokoro (seconds of import
+# and hundreds of MB per process); inference lives in kokoro_tts, imported
+# by TTS pool processes and render workers when they first synthesize.
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+# Encoding of voiceovers that only feed a render: lossless and written
+# in-process, where mp3 costs an ffmpeg process and a lossy transcode before
+# the renderer decodes it again for AAC. "flac" or "wav".
+RENDER_AUDIO_EXT = os.getenv("TTS_RENDER_FORMAT", "flac")
+
+# ---------------------------------------------------------
+# SYNTHESIS
+# ---------------------------------------------------------
+
+def wav_stream_header(samplerate: int = 24000) -> bytes:
+    """
+    Header of a mono 16-bit WAV whose length is not known yet: the RIFF and
+    data sizes are left at their maximum, which players read as "until EOF".
+    """
+    unknown = 0xFFFFFFFF
+    fmt = struct.pack("<HHIIHH", 1, 1, samplerate, samplerate * 2, 2, 16)
+    return (
+        b"RIFF" + struct.pack("<I", unknown) + b"WAVE"
+        + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+        + b"data" + struct.pack("<I", unknown)
+    )
+
+
+def safe_lookup_tts(key: str) -> dict | None:
+    """lookup_tts that treats a failing cache as a miss."""
+    try:
+        return lookup_tts(key)
+    except Exception as e:
+        print(f"[tts-cache] Lookup failed, synthesizing: {e}")
+        return None
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def synthesize_cached(*, voisetext: str, voice: str, speed: float, ext: str = "mp3") -> dict:
+    """
+    Audio for (text, voice, speed) from the content-addressed TTS cache;
+    Kokoro only runs on a miss. ext is the encoding: mp3 for anything users
+    download, RENDER_AUDIO_EXT for audio that only feeds a render. Returns
+      { "file_url": "tts_cache/<key>.<ext>", "size": <int>, "ext": <str> }
+    with file_url relative to the media root.
+    """
+    if not voisetext or not str(voisetext).strip():
+        raise HTTPException(400, "Text cannot be empty")
+
+    key = tts_cache_key(voisetext, voice, speed, ext)
+    cached = await asyncio.to_thread(safe_lookup_tts, key)
+    record_cache("tts", cached is not None)
+    if cached is not None:
+        return cached
+
+    # inference and the mp3 encode run on the TTS pool, off the event loop
+    final_bytes, stored_ext = await tts_executor.synthesize(voisetext, voice, speed, ext)
+    return await asyncio.to_thread(
+        store_tts, key, final_bytes, stored_ext, voice=voice, speed=speed, chars=len(voisetext),
+    )
+
+
+async def synthesize_composed(*, segments: list[str], voice: str, speed: float,
+                              ext: str = RENDER_AUDIO_EXT) -> dict:
+    """
+    Audio for the segments read in order, each synthesized (and cached) on
+    its own and joined with short crossfades: segments shared by many
+    customers are synthesized once per voice and speed. Returns like
+    synthesize_cached. ext must be one soundfile can read back (flac, wav).
+    """
+    segments = [segment for segment in segments if segment and segment.strip()]
+    if len(segments) <= 1:
+        return await synthesize_cached(voisetext=" ".join(segments), voice=voice, speed=speed, ext=ext)
+
+    key = tts_cache_key(" ".join(segments), voice, speed, ext, variant="segments")
+    cached = await asyncio.to_thread(safe_lookup_tts, key)
+    record_cache("tts", cached is not None)
+    if cached is not None:
+        return cached
+
+    parts = [
+        await synthesize_cached(voisetext=segment, voice=voice, speed=speed, ext=ext)
+        for segment in segments
+    ]
+    paths = [os.path.join(MEDIA_ROOT, part["file_url"]) for part in parts]
+    # decoding and joining need numpy: done on the TTS pool too
+    final_bytes, stored_ext = await tts_executor.run(compose_files, paths, ext)
+    return await asyncio.to_thread(
+        store_tts, key, final_bytes, stored_ext,
+        voice=voice, speed=speed, chars=sum(len(segment) for segment in segments),
+    )
+
+
+async def synthesize_and_store_media(
+    *,
+    company_id: str,
+    voisetext: str,
+    voice: str,
+    speed: float,
+) -> dict:
+    """
+    Generates TTS audio, stores it under ./media/<company_id>/..., and returns:
+      { "file_url": "<relative path>", "file_type": "audio", "size": <int>, "original_name": <str> }
+    """
+    if not company_id:
+        raise HTTPException(400, "company_id is required")
+
+    # the library copy belongs to the company; the synthesis itself is shared
+    cached = await synthesize_cached(voisetext=voisetext, voice=voice, speed=speed)
+    final_bytes = await asyncio.to_thread(_read_bytes, os.path.join(MEDIA_ROOT, cached["file_url"]))
+    ext = cached["ext"]
+
+    uid = uuid.uuid4().hex
+    filename = f"tts_{uid}.{ext}"
+    fake_upload = UploadFile(filename=filename, file=BytesIO(final_bytes))
+    local_path, size = await save_upload_file(fake_upload, company_id)
+
+    return {
+        "file_url": local_path,  # relative path (no ./media prefix)
+        "file_type": "audio",
+        "original_name": filename,
+        "size": size,
+    }
@@ -0,0 +1,180 @@
+import os
+import json
+import uuid
+import hashlib
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+
+from app.services.output_store import OUTPUT_EVICT_GRACE_SECONDS
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media")
+TTS_CACHE_DIR = os.path.join(MEDIA_ROOT, "tts_cache")
+# Least recently used entries are deleted once the cache passes this
+TTS_CACHE_BUDGET_BYTES = int(float(os.getenv("TTS_CACHE_BUDGET_MB", "2048")) * 1024 * 1024)
+
+
+# KPipeline's own split_pattern: new lines
+KOKORO_SPLIT_PATTERN = r"\n+"
+
+
+def _model_version() -> str:
+    # a new kokoro release, quantized weights, or another split of the text
+    # into chunks change the audio for the same input
+    try:
+        from importlib.metadata import version
+        name = f"kokoro-{version('kokoro')}"
+    except Exception:
+        name = "kokoro"
+    quantize = os.getenv("TTS_QUANTIZE", "").lower()
+    if quantize:
+        name = f"{name}+{quantize}"
+    split = os.getenv("TTS_SPLIT_PATTERN", KOKORO_SPLIT_PATTERN)
+    if split != KOKORO_SPLIT_PATTERN:
+        name = f"{name}+split-{hashlib.sha256(split.encode('utf-8')).hexdigest()[:8]}"
+    return name
+
+
+TTS_MODEL_VERSION = os.getenv("TTS_MODEL_VERSION") or _model_version()
+
+# ---------------------------------------------------------
+# INDEX
+# ---------------------------------------------------------
+
+def _db(database):
+    if database is not None:
+        return database
+    from app.db.connection import get_sync_db
+    return get_sync_db()
+
+
+def ensure_tts_cache_indexes(database):
+    database.tts_cache.create_index([("last_access_at", ASCENDING)], name="lru")
+
+
+def tts_cache_key(text: str, voice: str, speed: float, ext: str = "mp3", variant: str = "") -> str:
+    """
+    Content address of one synthesis: same inputs, same model -> same audio.
+    ext is the requested encoding (mp3 for downloads, flac/wav for renders);
+    variant names another way of producing audio for the same text
+    ("segments": composed from separately synthesized parts).
+    """
+    parts = [text, voice, round(float(speed), 3), TTS_MODEL_VERSION]
+    if ext != "mp3" or variant:
+        # mp3 keys predate other encodings; keep them valid
+        parts.append(ext)
+    if variant:
+        parts.append(variant)
+    raw = json.dumps(parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def lookup_tts(key: str, database=None) -> dict | None:
+    """
+    The cached entry for key ({"file_url", "size", "ext"}, file_url relative
+    to MEDIA_ROOT) or None. Entries whose file is gone are dropped.
+    """
+    database = _db(database)
+    doc = database.tts_cache.find_one_and_update(
+        {"_id": key},
+        {"$set": {"last_access_at": datetime.utcnow()}, "$inc": {"hits": 1}},
+    )
+    if doc is None:
+        return None
+    if not os.path.exists(os.path.join(MEDIA_ROOT, doc["file_url"])):
+        database.tts_cache.delete_one({"_id": key})
+        return None
+    return {"file_url": doc["file_url"], "size": doc["size"], "ext": doc["ext"]}
+
+
+def store_tts(key: str, data: bytes, ext: str, *, voice: str, speed: float, chars: int,
+              database=None) -> dict:
+    """Writes audio for key (atomically) and indexes it; returns like lookup_tts."""
+    os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+    file_url = f"tts_cache/{key}.{ext}"
+    path = os.path.join(MEDIA_ROOT, file_url)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    now = datetime.utcnow()
+    try:
+        _db(database).tts_cache.update_one(
+            {"_id": key},
+            {
+                "$set": {
+                    "file_url": file_url,
+                    "ext": ext,
+                    "size": len(data),
+                    "voice": voice,
+                    "speed": speed,
+                    "chars": chars,
+                    "model_version": TTS_MODEL_VERSION,
+                    "last_access_at": now,
+                },
+                "$setOnInsert": {"created_at": now, "hits": 0},
+            },
+            upsert=True,
+        )
+    except Exception as e:
+        # the file is written; it is only missing from the index
+        print(f"[tts-cache] Could not index {file_url}: {e}")
+    return {"file_url": file_url, "size": len(data), "ext": ext}
+
+# ---------------------------------------------------------
+# EVICTION
+# ---------------------------------------------------------
+
+def tts_cache_usage(database=None) -> dict:
+    rows = list(_db(database).tts_cache.aggregate([
+        {"$group": {"_id": None, "size": {"$sum": "$size"}, "entries": {"$sum": 1}, "hits": {"$sum": "$hits"}}},
+    ]))
+    row = rows[0] if rows else {"size": 0, "entries": 0, "hits": 0}
+    return {
+        "bytes": row["size"],
+        "entries": row["entries"],
+        "hits": row["hits"],
+        "budget_bytes": TTS_CACHE_BUDGET_BYTES,
+        "model_version": TTS_MODEL_VERSION,
+    }
+
+
+def evict_tts_cache(database=None, now: datetime | None = None) -> int:
+    """
+    Deletes least recently used entries until the cache fits its budget.
+    Entries used within OUTPUT_EVICT_GRACE_SECONDS are kept: a lookup may
+    just have handed the file to a render that has not opened it yet.
+    """
+    database = _db(database)
+    excess = tts_cache_usage(database)["bytes"] - TTS_CACHE_BUDGET_BYTES
+    evicted = skipped = 0
+    if excess <= 0:
+        return 0
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=OUTPUT_EVICT_GRACE_SECONDS)
+    cursor = database.tts_cache.find({"last_access_at": {"$lt": cutoff}}).sort("last_access_at", ASCENDING)
+    for doc in cursor:
+        if excess <= 0:
+            break
+        try:
+            os.remove(os.path.join(MEDIA_ROOT, doc["file_url"]))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # in use (Windows) or not ours to delete: keep the entry
+            print(f"[tts-cache] Could not delete {doc['file_url']}: {e}")
+            skipped += 1
+            continue
+        database.tts_cache.delete_one({"_id": doc["_id"]})
+        excess -= int(doc.get("size") or 0)
+        evicted += 1
+    if skipped:
+        print(f"[tts-cache] Kept {skipped} over-budget entries that could not be deleted")
+    return evicted
@@ -0,0 +1,296 @@
+import os
+import queue
+import asyncio
+import threading
+import contextvars
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import HTTPException
+
+from app.utils.metrics import REGISTRY
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+# Synthesis processes; each holds its own copy of the model (~0.5GB RAM).
+# 0 synthesizes in a thread of the calling process instead.
+TTS_WORKERS = max(0, int(os.getenv("TTS_WORKERS", "1")))
+# Requests waiting for a free process; past this, callers get a 503 at
+# once instead of queueing behind minutes of synthesis
+TTS_QUEUE_SIZE = max(0, int(os.getenv("TTS_QUEUE_SIZE", "32")))
+
+TTS_REJECTED = REGISTRY.counter(
+    "autovid_tts_rejected_total",
+    "TTS requests refused because the TTS queue was full.",
+)
+
+# Set by render workers: they are already off the event loop, and a TTS
+# pool per render process would load a model copy each
+_inline = contextvars.ContextVar("tts_inline", default=False)
+
+
+@contextmanager
+def inline_tts():
+    """Within this block TTS runs in a thread of the calling process."""
+    token = _inline.set(True)
+    try:
+        yield
+    finally:
+        _inline.reset(token)
+
+# ---------------------------------------------------------
+# CHILD PROCESS
+# ---------------------------------------------------------
+
+# Pool callables import kokoro_tts (torch) lazily: the API process that
+# submits them never imports it
+
+def warm_up() -> list[str]:
+    """Loads the model and the TTS_WARMUP_VOICES packs; returns the voices."""
+    from app.services.kokoro_tts import warmup_voices
+
+    return warmup_voices()
+
+
+def _load_model():
+    # pool initializer: every process loads the model and the warm-up
+    # voices once, up front
+    warm_up()
+
+
+def memory_usage() -> dict:
+    from app.services.kokoro_tts import tts_memory_usage
+
+    return tts_memory_usage()
+
+
+def compose_files(paths: list[str], ext: str) -> tuple[bytes, str]:
+    from app.services.kokoro_tts import compose_audio_files
+
+    return compose_audio_files(paths, ext)
+
+
+def synthesize_encoded(voisetext: str, voice: str, speed: float, ext: str = "mp3") -> tuple[bytes, str]:
+    """Synthesis plus encoding; returns (bytes, ext) like encode_audio."""
+    from app.services.kokoro_tts import encode_audio, synthesize_audio_numpy
+
+    audio = synthesize_audio_numpy(voisetext=voisetext, voice=voice, speed=speed)
+    return encode_audio(audio, ext)
+
+
+def stream_pcm(channel, voisetext: str, voice: str, speed: float):
+    """Puts 16-bit PCM on channel as each chunk of the text is synthesized."""
+    from app.services.kokoro_tts import pcm16_bytes, synthesize_stream
+
+    for audio in synthesize_stream(voisetext=voisetext, voice=voice, speed=speed):
+        channel.put(pcm16_bytes(audio))
+
+
+class StreamClosed(Exception):
+    """Raised in a stream producer once its consumer has gone away."""
+
+
+class _Channel:
+    """The channel a stream producer puts on; put fails once closed is set."""
+
+    def __init__(self, channel, closed):
+        self.channel = channel
+        self.closed = closed
+
+    def put(self, item):
+        if self.closed.is_set():
+            raise StreamClosed()
+        self.channel.put(item)
+
+
+def _fill_channel(fn, channel, closed, args: tuple):
+    try:
+        return fn(_Channel(channel, closed), *args)
+    except StreamClosed:
+        # the client disconnected: stop synthesizing at the next chunk
+        return None
+    finally:
+        # end marker, also after an error
+        channel.put(None)
+
+
+def _run_in_child(fn, args: tuple) -> dict:
+    """
+    Runs in a pool process. Metrics are shipped back with the result
+    because /metrics is served by the parent; HTTP errors keep their status.
+    """
+    REGISTRY.drain()
+    try:
+        return {"result": fn(*args), "metrics": REGISTRY.drain()}
+    except HTTPException as e:
+        return {"status": e.status_code, "error": e.detail, "metrics": REGISTRY.drain()}
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}", "metrics": REGISTRY.drain()}
+
+# ---------------------------------------------------------
+# EXECUTOR
+# ---------------------------------------------------------
+
+class TTSExecutor:
+    """
+    Process pool for Kokoro inference and its encode, so a synthesis
+    never blocks the API event loop. At most workers requests run at once
+    and queue_size more wait; further requests are refused with a 503.
+    """
+
+    def __init__(self, workers: int = TTS_WORKERS, queue_size: int = TTS_QUEUE_SIZE,
+                 initializer=_load_model):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.initializer = initializer
+        self._lock = threading.Lock()
+        self._pool = None
+        self._manager = None
+        # requests submitted and not yet finished, running or queued
+        self.in_flight = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: children must not inherit the parent's Mongo clients
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self.initializer,
+                )
+            return self._pool
+
+    @property
+    def started(self) -> bool:
+        return self._pool is not None
+
+    def _reset_pool(self, broken):
+        with self._lock:
+            if self._pool is broken:
+                self._pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _get_manager(self):
+        with self._lock:
+            if self._manager is None:
+                # queues that pool processes can write to while the parent reads
+                self._manager = multiprocessing.get_context("spawn").Manager()
+            return self._manager
+
+    def _admit(self):
+        with self._lock:
+            if self.in_flight >= self.workers + self.queue_size:
+                TTS_REJECTED.inc()
+                raise HTTPException(503, "Voice generation is busy, please retry shortly")
+            self.in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    @staticmethod
+    def _unpack(result: dict):
+        REGISTRY.merge(result.get("metrics"))
+        if "status" in result:
+            raise HTTPException(result["status"], result["error"])
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result["result"]
+
+    def _in_process(self) -> bool:
+        return self.workers == 0 or _inline.get()
+
+    async def run(self, fn, *args):
+        """Awaits fn(*args) on the pool; fn must be a picklable module-level function."""
+        if self._in_process():
+            return await asyncio.to_thread(fn, *args)
+
+        self._admit()
+        try:
+            pool = self._get_pool()
+            result = await asyncio.wrap_future(pool.submit(_run_in_child, fn, args))
+        except BrokenProcessPool:
+            # a synthesis process died (OOM kill): start a fresh pool
+            self._reset_pool(pool)
+            raise HTTPException(503, "Voice generation crashed, please retry")
+        finally:
+            self._release()
+        return self._unpack(result)
+
+    async def stream(self, fn, *args):
+        """
+        Async iterator over the items fn(channel, *args) puts on channel, as
+        they are put; fn runs on the pool like run(). An error of fn is
+        raised after the items produced before it.
+
+        If the consumer stops early (a client disconnect), fn is stopped at
+        its next put; its request stays in in_flight until it has returned.
+        """
+        if self._in_process():
+            channel, closed = queue.Queue(), threading.Event()
+            done = asyncio.ensure_future(asyncio.to_thread(_fill_channel, fn, channel, closed, args))
+            try:
+                while (item := await asyncio.to_thread(channel.get)) is not None:
+                    yield item
+            finally:
+                closed.set()
+            await done
+            return
+
+        self._admit()
+        future = None
+        try:
+            pool = self._get_pool()
+            manager = self._get_manager()
+            channel, closed = manager.Queue(), manager.Event()
+            future = pool.submit(_run_in_child, _fill_channel, (fn, channel, closed, args))
+            done = asyncio.wrap_future(future)
+            while True:
+                try:
+                    item = await asyncio.to_thread(channel.get, True, 1.0)
+                except queue.Empty:
+                    if done.done():
+                        # the process died before putting its end marker
+                        break
+                    continue
+                if item is None:
+                    break
+                yield item
+            result = await done
+        except BrokenProcessPool:
+            self._reset_pool(pool)
+            raise HTTPException(503, "Voice generation crashed, please retry")
+        finally:
+            if future is None or future.done():
+                self._release()
+            else:
+                # the consumer went away while the process still synthesizes:
+                # its slot is only free once it has noticed and returned
+                closed.set()
+                future.add_done_callback(lambda _: self._release())
+        self._unpack(result)
+
+    async def synthesize(self, voisetext: str, voice: str, speed: float,
+                         ext: str = "mp3") -> tuple[bytes, str]:
+        return await self.run(synthesize_encoded, voisetext, voice, speed, ext)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            manager, self._manager = self._manager, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
+
+
+tts_executor = TTSExecutor()
+
+REGISTRY.gauge(
+    "autovid_tts_in_flight",
+    "TTS requests submitted to the TTS pool, running or queued.",
+    callback=lambda: {(): tts_executor.in_flight},
+)
@@ -10,7 +10,7 @@ import hashlib
 import json 
 import shlex
 from bson import ObjectId 
-from app.db.connection import db 
+from app.db.connection import get_sync_db
 from dotenv import load_dotenv
 load_dotenv()
 # ---------------------------------------------------------
@@ -268,6 +268,8 @@ def render_preview(template, output_path):
 
     
 def render_video(task_id: str):
+    # Blocking client: this runs in workers, outside any event loop
+    db = get_sync_db()
     task = db.video_tasks.find_one({"_id": ObjectId(task_id)})
     template = db.templates.find_one({"_id": ObjectId(task["template_id"])})
     customer = db.customers.find_one({"_id": ObjectId(task["customer_id"])})
@@ -2,20 +2,32 @@ import os
 import subprocess
 import shlex
 from typing import Dict, Any
-import uuid 
 import re 
 import urllib.parse 
 import requests 
 import hashlib 
 import shlex
+import time
 from bson import ObjectId 
-from app.db.connection import db 
+from app.db.connection import get_sync_db
 from dotenv import load_dotenv
 load_dotenv()
 from app.services.render_helper import (
     find_background,
+    item_seek_window,
+    run_ffmpeg,
+    seek_input_args,
 )
-from app.utils.placeholders import replace_placeholders
+from app.services.audio_mix import (
+    AUDIO_BED_CACHE,
+    get_or_build_audio_bed,
+    mix_audio_sources,
+)
+from app.services.output_store import KIND_CACHE, record_output, touch_output
+from app.services.render_cost import current_threads
+from app.services.workspace import RenderWorkspace
+from app.utils.metrics import RENDER_SECONDS
+from app.utils.placeholders import has_placeholders, replace_placeholders
 # ---------------------------------------------------------
 # CONFIG
 # ---------------------------------------------------------
@@ -31,6 +43,9 @@ FONT_PATH = os.path.join(BASE_DIR, "Fonts", "arial.ttf")
 FONT_PATH = FONT_PATH.replace("\\", "/")
 PX_RE = re.compile(r"-?\d+(\.\d+)?")
 FONT_CACHE_DIR = os.path.join(MEDIA_ROOT, "font_cache")
+# Filter graphs longer than this (in characters) are passed to ffmpeg through
+# -filter_complex_script instead of argv, which has a hard size limit.
+FILTER_SCRIPT_THRESHOLD = int(os.getenv("FFMPEG_FILTER_SCRIPT_THRESHOLD", "8000"))
 
 def abs_media_path(path: str) -> str:
     path = path.replace("\\", "/")
@@ -177,11 +192,13 @@ def download_font(font_url: str) -> str:
     ext = os.path.splitext(urllib.parse.urlparse(font_url).path)[1] or ".ttf"
     font_path = os.path.join(FONT_CACHE_DIR, f"{url_hash}{ext}")
     if os.path.exists(font_path):
+        touch_output(font_path)
         return font_path
     resp = requests.get(font_url, timeout=20)
     resp.raise_for_status()
     with open(font_path, "wb") as f:
         f.write(resp.content)
+    record_output(font_path, KIND_CACHE)
     return font_path
 
 def resolve_font_file(details: Dict[str, Any]) -> str:
@@ -380,7 +397,45 @@ def smart_logo_mapping(src: str, size: str = None) -> str:
     
     return src
 
-def add_text_item_filters(filter_parts, last_label, item, duration, text_idx, context, canvas_w=None, canvas_h=None):
+def is_dynamic_item(item: dict) -> bool:
+    """
+    True when a track item changes per customer: flagged customer fields,
+    placeholder text/src/voiceover, or dummy logo URLs that get smart-mapped.
+    """
+    if not isinstance(item, dict):
+        return False
+    metadata = item.get("metadata") or {}
+    if metadata.get("isCustomerField"):
+        return True
+    details = item.get("details") or {}
+    src = details.get("src")
+    if isinstance(src, str) and (has_placeholders(src) or smart_logo_mapping(src) != src):
+        return True
+    for value in (details.get("text"), item.get("voisetext"), details.get("voisetext")):
+        if has_placeholders(value):
+            return True
+    return False
+
+def build_audio_source(entry: dict, duration: float, volume: float, index=None, audio_input=None) -> dict:
+    item = entry["item"]
+    display = item.get("display", {})
+    trim = item.get("trim", {}) or {}
+    trim_to = trim.get("to")
+    return {
+        "index": index,
+        "src": entry["src"],
+        "item": item,
+        "seek_ms": entry.get("seek_ms", 0),
+        "audio_input": audio_input,
+        "dynamic": is_dynamic_item(item),
+        "start_ms": int(display.get("from", 0)),
+        "end_ms": int(display.get("to", duration * 1000)),
+        "trim_from": int(trim.get("from", 0)),
+        "trim_to": int(trim_to) if trim_to is not None else None,
+        "volume": volume,
+    }
+
+def add_text_item_filters(filter_parts, last_label, item, duration, text_idx, context, canvas_w=None, canvas_h=None, workspace=None):
     details = item.get("details", {})
     display = item.get("display", {})
     start = display.get("from", 0) / 1000
@@ -443,13 +498,14 @@ def add_text_item_filters(filter_parts, last_label, item, duration, text_idx, co
         canvas_width=canvas_w,
     )
 
+    # Text goes through textfile= so long paragraphs don't need escaping and
+    # don't bloat the filter graph. Inline text= is only a fallback.
     textfile_path = ""
-    try:
-        textfile_path = write_text_temp(wrapped_text)
-    except Exception:
-        textfile_path = ""
-
-    text = ffmpeg_escape_text(wrapped_text)
+    if workspace is not None:
+        try:
+            textfile_path = workspace.write_text(wrapped_text)
+        except Exception:
+            textfile_path = ""
 
     # ------------------------
     # POSITION
@@ -478,9 +534,11 @@ def add_text_item_filters(filter_parts, last_label, item, duration, text_idx, co
     bg_color = parse_color(details.get("backgroundColor", "transparent"))
     bg_color_str = ffmpeg_color(bg_color, opacity)
 
-    text_source = f"text='{text}'"
     if textfile_path:
-        text_source = f"textfile='{ffmpeg_escape_path(textfile_path)}'"
+        # expansion=none keeps '%' literal, matching the escaped text= path
+        text_source = f"textfile='{ffmpeg_escape_path(textfile_path)}':expansion=none"
+    else:
+        text_source = f"text='{ffmpeg_escape_text(wrapped_text)}'"
 
     base_params = [
         f"fontfile='{ffmpeg_escape_path(font_path)}'",
@@ -671,13 +729,16 @@ def normalize_media_src(src: str) -> str:
         return src
     return abs_media_path(src)
 
-def write_text_temp(text: str) -> str:
-    ensure_dir(MEDIA_ROOT)
-    name = f"text_{uuid.uuid4().hex}.txt"
-    path = os.path.abspath(os.path.join(MEDIA_ROOT, name))
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(text or "")
-    return path
+def filter_complex_args(filter_complex: str, workspace=None) -> list[str]:
+    """
+    Returns the ffmpeg args for a filter graph. Large graphs are written to a
+    script file in the render workspace so templates with hundreds of items
+    stay under argv limits.
+    """
+    if workspace is None or len(filter_complex) < FILTER_SCRIPT_THRESHOLD:
+        return ["-filter_complex", filter_complex]
+    script_path = workspace.write_text(filter_complex, suffix=".ffscript")
+    return ["-filter_complex_script", script_path]
 
 def to_even(value, min_value=2):
     try:
@@ -708,7 +769,18 @@ def safe_float(val):
     except (ValueError, IndexError):
         return 0.0
     
-def render_image_preview(template_json, customer, company, output_path):
+def render_image_preview(template_json, customer, company, output_path, *, workspace=None):
+    """
+    Renders the first frame of a template to a JPEG. Intermediates go to a
+    per-render workspace; the JPEG is promoted to output_path atomically.
+    """
+    if workspace is not None:
+        return _render_image_preview(template_json, customer, company, output_path, workspace)
+    with RenderWorkspace() as ws:
+        return _render_image_preview(template_json, customer, company, output_path, ws)
+
+def _render_image_preview(template_json, customer, company, output_path, workspace):
+    started = time.perf_counter()
     design = template_json.get("design", {}) if isinstance(template_json, dict) else {}
     canvas_w, canvas_h = resolve_canvas_size(design)
 
@@ -818,6 +890,7 @@ def render_image_preview(template_json, customer, company, output_path):
             context,
             canvas_w=canvas_w,
             canvas_h=canvas_h,
+            workspace=workspace,
         )
 
     # -----------------------------
@@ -830,16 +903,17 @@ def render_image_preview(template_json, customer, company, output_path):
 
     # Ensure the output path uses forward slashes (ffmpeg on Windows can be picky)
     output_path = str(output_path).replace("\\", "/")
+    scratch_output = workspace.path("output.jpg")
 
     # Force image2 muxer and single frame output
+    cmd += filter_complex_args(";".join(filter_parts), workspace)
     cmd += [
-        "-filter_complex", ";".join(filter_parts),
         "-map", current,
         "-frames:v", "1",
         "-q:v", "2",
         "-vcodec", "mjpeg",
         "-f", "image2",
-        output_path,
+        scratch_output,
     ]
 
     # Debug: print ffmpeg command
@@ -848,12 +922,37 @@ def render_image_preview(template_json, customer, company, output_path):
     except Exception:
         print("Render image FFmpeg command:", cmd)
 
-    subprocess.run(cmd, check=True)
+    run_ffmpeg(cmd, stage="image")
+    workspace.promote(scratch_output, output_path)
+    RENDER_SECONDS.observe(time.perf_counter() - started, template_type="image", profile="image")
 
     # Return the executed command string for debugging
     return " ".join(shlex.quote(c) for c in cmd)
 
-def render_preview(template_json, context_data=None, output_path=None):
+def render_preview(template_json, context_data=None, output_path=None, *, audio=True, extra_output_args=None,
+                   profile="full", workspace=None):
+    """
+    Renders a video template to output_path.
+
+    audio=False renders picture only; extra_output_args are appended to the
+    encoder options (smart rendering uses both to produce segments that can be
+    stream-copied next to its mezzanine). profile labels the render metrics.
+
+    Intermediates live in a per-render workspace (the caller's, if given)
+    and the finished file is promoted to output_path atomically.
+
+    Video audio is lowered under the template's audio tracks; a full
+    template's "duck_video_audio" decides that instead when set.
+    """
+    options = dict(audio=audio, extra_output_args=extra_output_args, profile=profile)
+    if workspace is not None:
+        return _render_preview(template_json, context_data, output_path, workspace=workspace, **options)
+    with RenderWorkspace() as ws:
+        return _render_preview(template_json, context_data, output_path, workspace=ws, **options)
+
+def _render_preview(template_json, context_data, output_path, *, audio, extra_output_args, profile, workspace):
+    started = time.perf_counter()
+    template_type = "video"
     if output_path is None and isinstance(context_data, str):
         output_path = context_data
         context_data = None
@@ -873,11 +972,14 @@ def render_preview(template_json, context_data=None, output_path=None):
     if isinstance(template_json, dict) and "template_json" in template_json:
         full_template = template_json
         template_json = full_template.get("template_json", {})
+        template_type = full_template.get("type") or template_type
+        duck_video_audio = full_template.get("duck_video_audio")
         trim = full_template.get("trim") or {}
         duration = full_template.get("duration")
         if not duration and trim.get("end") is not None:
             duration = float(trim.get("end", 0)) - float(trim.get("start", 0))
     else:
+        duck_video_audio = None
         trim = template_json.get("trim") if isinstance(template_json, dict) else {}
         duration = template_json.get("duration") if isinstance(template_json, dict) else None
         if not duration and isinstance(trim, dict) and trim.get("end") is not None:
@@ -1014,6 +1116,15 @@ def render_preview(template_json, context_data=None, output_path=None):
                         "item": item
                     })
 
+    # Decode only the shown range of every video/audio source: -ss/-t are
+    # input options, so the filters below work on an already-trimmed stream.
+    for entry in visual_inputs + audio_inputs:
+        if entry.get("media_type", "audio") == "image":
+            continue
+        seek_sec, length_sec = item_seek_window(entry["item"], duration)
+        entry["seek_args"] = seek_input_args(seek_sec, length_sec)
+        entry["seek_ms"] = int(round(seek_sec * 1000))
+
     # -------------------------------------------------
     # 2️⃣ BASE CANVAS
     # -------------------------------------------------
@@ -1077,86 +1188,62 @@ def render_preview(template_json, context_data=None, output_path=None):
                     context,
                     canvas_w=canvas_w,
                     canvas_h=canvas_h,
+                    workspace=workspace,
                 )
 
     # -------------------------------------------------
     # 5️⃣ AUDIO FILTERS (SAFE & DYNAMIC)
     # -------------------------------------------------
     audio_sources = []
-    has_external_audio = len(audio_inputs) > 0
+    has_external_audio = len(audio_inputs) > 0 if duck_video_audio is None else bool(duck_video_audio)
 
     for i, v in enumerate(visual_inputs):
+        if not audio:
+            break
         if (v.get("media_type") or "").lower() == "video":
             if not has_audio_stream(v["src"]):
                 continue
-            display = v["item"].get("display", {})
-            trim = v["item"].get("trim", {})
-            start_ms = int(display.get("from", 0))
-            end_ms = int(display.get("to", duration * 1000))
-            trim_from = int(trim.get("from", 0))
-            trim_to = trim.get("to")
-            if trim_to is not None:
-                trim_to = int(trim_to)
             vol = safe_float(v["item"].get("details", {}).get("volume", 100)) / 100.0
             if vol <= 0:
                 continue
             # When mixing with MP3, lower video volume so both play together
             if has_external_audio and vol > 0.5:
                 vol = 0.4
-            audio_sources.append({
-                "index": i,
-                "start_ms": start_ms,
-                "end_ms": end_ms,
-                "trim_from": trim_from,
-                "trim_to": trim_to,
-                "volume": vol,
-            })
+            audio_sources.append(build_audio_source(v, duration, vol, index=i))
 
-    for i, a in enumerate(audio_inputs):
-        idx = len(visual_inputs) + i
-        display = a["item"].get("display", {})
-        trim = a["item"].get("trim", {})
-        start_ms = int(display.get("from", 0))
-        end_ms = int(display.get("to", duration * 1000))
-        trim_from = int(trim.get("from", 0))
-        trim_to = trim.get("to")
-        if trim_to is not None:
-            trim_to = int(trim_to)
+    for a in audio_inputs if audio else []:
         vol = safe_float(a["item"].get("details", {}).get("volume", 100)) / 100.0
         if vol <= 0:
             continue
-        audio_sources.append({
-            "index": idx,
-            "start_ms": start_ms,
-            "end_ms": end_ms,
-            "trim_from": trim_from,
-            "trim_to": trim_to,
-            "volume": vol,
-        })
-
-    audio_labels = []
-    if audio_sources:
-        for i, src in enumerate(audio_sources):
-            display_dur_ms = max(0, src["end_ms"] - src["start_ms"])
-            trim_len_ms = display_dur_ms
-            if src["trim_to"] is not None:
-                trim_len_ms = max(0, src["trim_to"] - src["trim_from"])
-                trim_len_ms = min(trim_len_ms, display_dur_ms)
-            duration_sec = max(0.0, trim_len_ms / 1000.0)
-            if duration_sec <= 0:
-                continue
-            start_sec = max(0.0, src["trim_from"] / 1000.0)
-            vol_filter = f",volume={src['volume']:.3f}" if src["volume"] != 1.0 else ""
-            filter_parts.append(
-                f"[{src['index']}:a]atrim=start={start_sec}:duration={duration_sec},asetpts=PTS-STARTPTS"
-                f"{vol_filter},adelay={src['start_ms']}|{src['start_ms']},aresample=async=1:first_pts=0[aud{i}]"
-            )
-            audio_labels.append(f"[aud{i}]")
+        audio_sources.append(build_audio_source(a, duration, vol, audio_input=a))
 
-    if audio_labels:
-        filter_parts.append(
-            f"{''.join(audio_labels)}amix=inputs={len(audio_labels)}:normalize=0[outa]"
-        )
+    # Static tracks (background music, base video audio) are pre-mixed once
+    # into a cached bed; only customer-specific tracks are mixed per render.
+    bed_path = None
+    static_sources = [s for s in audio_sources if not s["dynamic"]]
+    if AUDIO_BED_CACHE and static_sources:
+        bed_path = get_or_build_audio_bed(static_sources, duration)
+
+    if bed_path:
+        mix_sources = [s for s in audio_sources if s["dynamic"]]
+    else:
+        mix_sources = audio_sources
+    # Audio-only files are only opened when something still mixes them
+    extra_audio_inputs = []
+    for s in mix_sources:
+        if s.get("audio_input") is not None:
+            s["index"] = len(visual_inputs) + len(extra_audio_inputs)
+            extra_audio_inputs.append(s["audio_input"])
+
+    bed_index = len(visual_inputs) + len(extra_audio_inputs)
+    copy_bed = bool(bed_path) and not mix_sources
+    has_audio = copy_bed
+    if not copy_bed:
+        bed_labels = []
+        if bed_path:
+            filter_parts.append(f"[{bed_index}:a]aresample=async=1:first_pts=0[abed]")
+            bed_labels.append("[abed]")
+        has_audio = mix_audio_sources(filter_parts, mix_sources, "[outa]", extra_labels=bed_labels)
 
     # -------------------------------------------------
     # 6️⃣ BUILD FFMPEG COMMAND
@@ -1169,6 +1256,8 @@ def render_preview(template_json, context_data=None, output_path=None):
     print(f"   Audio inputs: {len(audio_inputs)}")
     for i, a in enumerate(audio_inputs):
         print(f"     [{i}] AUDIO: {a['src']}")
+    if bed_path:
+        print(f"   Audio bed: {bed_path} ({'stream copy' if copy_bed else 'mixed with dynamic tracks'})")
     print("=" * 80 + "\n")
     
     cmd = ["ffmpeg", "-y"]
@@ -1177,17 +1266,20 @@ def render_preview(template_json, context_data=None, output_path=None):
         if v["media_type"] == "image":
             cmd += ["-loop", "1", "-t", str(duration), "-i", v["src"]]
         else:
-            cmd += ["-i", v["src"]]
+            cmd += v.get("seek_args", []) + ["-i", v["src"]]
 
-    for a in audio_inputs:
-        cmd += ["-i", a["src"]]
+    for a in extra_audio_inputs:
+        cmd += a.get("seek_args", []) + ["-i", a["src"]]
 
-    cmd += [
-        "-filter_complex", ";".join(filter_parts),
-        "-map", last_label
-    ]
+    if bed_path:
+        cmd += ["-i", bed_path]
+
+    cmd += filter_complex_args(";".join(filter_parts), workspace)
+    cmd += ["-map", last_label]
 
-    if audio_labels:
+    if copy_bed:
+        cmd += ["-map", f"{bed_index}:a", "-c:a", "copy"]
+    elif has_audio:
         cmd += ["-map", "[outa]", "-c:a", "aac"]
     else:
         cmd += ["-an"]
@@ -1197,50 +1289,35 @@ def render_preview(template_json, context_data=None, output_path=None):
         "-pix_fmt", "yuv420p",
         "-r", str(fps),
         "-t", str(duration),
-        output_path
     ]
+    cmd += list(extra_output_args or [])
+    threads = current_threads()
+    if threads:
+        # the scheduler packed this render onto `threads` cores
+        cmd += ["-threads", str(threads), "-filter_complex_threads", str(threads)]
+    scratch_output = workspace.path("output" + (os.path.splitext(output_path)[1] or ".mp4"))
+    cmd.append(scratch_output)
     # Debug: print ffmpeg command
     try:
         print("Render video FFmpeg command:", " ".join(shlex.quote(c) for c in cmd))
     except Exception:
         print("Render video FFmpeg command:", cmd)
 
-    subprocess.run(cmd, check=True)
+    run_ffmpeg(cmd, stage=profile)
+    workspace.promote(scratch_output, output_path)
+    RENDER_SECONDS.observe(time.perf_counter() - started, template_type=template_type, profile=profile)
 
     return " ".join(shlex.quote(c) for c in cmd)
 
-def render_video(task_id: str):
-    task = db.video_tasks.find_one({"_id": ObjectId(task_id)})
-    template = db.templates.find_one({"_id": ObjectId(task["template_id"])})
-    customer = db.customers.find_one({"_id": ObjectId(task["customer_id"])})
-
-    base_video = abs_media_path(template["base_video_url"])
-    ensure_file_exists(base_video)
-
-    text = customer["full_name"]
-
-    output_path = os.path.join(MEDIA_ROOT, f"{task_id}.mp4")
-
-    vf = (
-        f"drawtext="
-        f"fontfile={FONT_PATH}:"
-        f"text='{escape_text(text)}':"
-        f"x=200:y=300:"
-        f"fontsize=40:"
-        f"fontcolor=white"
-    )
-
-    cmd = [
-        FFMPEG,
-        "-y",
-        "-i", base_video,
-        "-vf", vf,
-        "-c:v", "libx264",
-        "-pix_fmt", "yuv420p",
-        output_path
-    ]
-
-    print("SIMPLE CMD:", " ".join(cmd))
-    subprocess.run(cmd, check=True)
-
-    return output_path
\ No newline at end of file
+def render_video(task_id: str, database=None):
+    """
+    Renders a video task synchronously. Workers have no event loop, so this
+    uses the blocking pymongo client instead of the Motor `db`.
+    """
+    from app.worker.render_jobs import render_task
+
+    database = database if database is not None else get_sync_db()
+    task = database.video_tasks.find_one({"_id": ObjectId(task_id)})
+    if not task:
+        raise ValueError(f"Video task {task_id} not found")
+    return render_task(task, database)
@@ -0,0 +1,38 @@
+# Voice catalogue (kept identical to official app choices)
+VOICES = [
+    {"id": "af_heart",    "name": "Heart",    "lang": "en-us", "gender": "Female"},
+    {"id": "af_bella",    "name": "Bella",    "lang": "en-us", "gender": "Female"},
+    {"id": "af_nicole",   "name": "Nicole",   "lang": "en-us", "gender": "Female"},
+    {"id": "af_aoede",    "name": "Aoede",    "lang": "en-us", "gender": "Female"},
+    {"id": "af_kore",     "name": "Kore",     "lang": "en-us", "gender": "Female"},
+    {"id": "af_sarah",    "name": "Sarah",    "lang": "en-us", "gender": "Female"},
+    {"id": "af_nova",     "name": "Nova",     "lang": "en-us", "gender": "Female"},
+    {"id": "af_sky",      "name": "Sky",      "lang": "en-us", "gender": "Female"},
+    {"id": "af_alloy",    "name": "Alloy",    "lang": "en-us", "gender": "Female"},
+    {"id": "af_jessica",  "name": "Jessica",  "lang": "en-us", "gender": "Female"},
+    {"id": "af_river",    "name": "River",    "lang": "en-us", "gender": "Female"},
+    {"id": "am_michael",  "name": "Michael",  "lang": "en-us", "gender": "Male"},
+    {"id": "am_fenrir",   "name": "Fenrir",   "lang": "en-us", "gender": "Male"},
+    {"id": "am_puck",     "name": "Puck",     "lang": "en-us", "gender": "Male"},
+    {"id": "am_echo",     "name": "Echo",     "lang": "en-us", "gender": "Male"},
+    {"id": "am_eric",     "name": "Eric",     "lang": "en-us", "gender": "Male"},
+    {"id": "am_liam",     "name": "Liam",     "lang": "en-us", "gender": "Male"},
+    {"id": "am_onyx",     "name": "Onyx",     "lang": "en-us", "gender": "Male"},
+    {"id": "am_santa",    "name": "Santa",    "lang": "en-us", "gender": "Male"},
+    {"id": "am_adam",     "name": "Adam",     "lang": "en-us", "gender": "Male"},
+    {"id": "bf_emma",     "name": "Emma",     "lang": "en-gb", "gender": "Female"},
+    {"id": "bf_isabella", "name": "Isabella", "lang": "en-gb", "gender": "Female"},
+    {"id": "bf_alice",    "name": "Alice",    "lang": "en-gb", "gender": "Female"},
+    {"id": "bf_lily",     "name": "Lily",     "lang": "en-gb", "gender": "Female"},
+    {"id": "bm_george",   "name": "George",   "lang": "en-gb", "gender": "Male"},
+    {"id": "bm_fable",    "name": "Fable",    "lang": "en-gb", "gender": "Male"},
+    {"id": "bm_lewis",    "name": "Lewis",    "lang": "en-gb", "gender": "Male"},
+    {"id": "bm_daniel",   "name": "Daniel",   "lang": "en-gb", "gender": "Male"},
+]
+
+VOICE_IDS = {v["id"] for v in VOICES}
+
+
+def voice_lang_code(voice: str | None) -> str:
+    """Kokoro pipeline language of a voice: its first letter ("a" en-us, "b" en-gb)."""
+    return str(voice)[0] if voice else "a"
@@ -0,0 +1,121 @@
+import os
+import time
+import uuid
+import shutil
+import tempfile
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+
+def _default_scratch_root() -> str:
+    # tmpfs keeps filter scripts, segments and intermediate encodes off the
+    # disk that serves media/; fall back when /dev/shm is missing or read-only
+    shm = "/dev/shm"
+    if os.path.isdir(shm) and os.access(shm, os.W_OK):
+        return shm
+    return tempfile.gettempdir()
+
+
+# Note: Docker gives /dev/shm 64MB unless --shm-size is raised; point this
+# at a disk path when full-length renders do not fit
+RENDER_SCRATCH_DIR = os.getenv("RENDER_SCRATCH_DIR") or os.getenv("RENDER_TMP_DIR") or _default_scratch_root()
+WORKSPACE_PREFIX = "autovid_render_"
+# Workspaces older than this are leftovers of a killed process
+WORKSPACE_STALE_SECONDS = float(os.getenv("RENDER_WORKSPACE_STALE_SECONDS", str(6 * 3600)))
+
+# ---------------------------------------------------------
+# WORKSPACE
+# ---------------------------------------------------------
+
+class RenderWorkspace:
+    """
+    Private scratch directory for one render. Everything created through it
+    is removed on exit, whether the render succeeded, raised, or was
+    interrupted; only files handed to promote() survive.
+
+        with RenderWorkspace() as ws:
+            tmp = ws.path("out.mp4")
+            ...render into tmp...
+            ws.promote(tmp, output_path)
+    """
+
+    def __init__(self, root: str | None = None, prefix: str = WORKSPACE_PREFIX):
+        self.root = root or RENDER_SCRATCH_DIR
+        self.prefix = prefix
+        self.dir = None
+
+    def __enter__(self):
+        os.makedirs(self.root, exist_ok=True)
+        self.dir = tempfile.mkdtemp(prefix=self.prefix, dir=self.root).replace("\\", "/")
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+        return False
+
+    def cleanup(self):
+        if self.dir:
+            shutil.rmtree(self.dir, ignore_errors=True)
+            self.dir = None
+
+    def path(self, name: str) -> str:
+        """Path for a new file in the workspace; name collisions get a suffix."""
+        if self.dir is None:
+            raise RuntimeError("RenderWorkspace used outside its with-block")
+        path = os.path.join(self.dir, name)
+        if os.path.exists(path):
+            root, ext = os.path.splitext(name)
+            path = os.path.join(self.dir, f"{root}_{uuid.uuid4().hex[:8]}{ext}")
+        return path.replace("\\", "/")
+
+    def write_text(self, text: str, suffix: str = ".txt") -> str:
+        path = self.path(f"text_{uuid.uuid4().hex}{suffix}")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text or "")
+        return path
+
+    def promote(self, src: str, dest: str) -> str:
+        """
+        Atomically publishes src at dest. Across filesystems (tmpfs -> disk)
+        the file is first copied next to dest, then renamed over it, so
+        readers never see a partial file.
+        """
+        dest_dir = os.path.dirname(os.path.abspath(dest))
+        os.makedirs(dest_dir, exist_ok=True)
+        try:
+            os.replace(src, dest)
+            return dest
+        except OSError:
+            pass
+
+        root, ext = os.path.splitext(dest)
+        staging = f"{root}.{uuid.uuid4().hex}.part{ext}"
+        try:
+            shutil.copyfile(src, staging)
+            os.replace(staging, dest)
+        finally:
+            if os.path.exists(staging):
+                os.remove(staging)
+        os.remove(src)
+        return dest
+
+
+def sweep_stale_workspaces(root: str | None = None, max_age: float = WORKSPACE_STALE_SECONDS) -> int:
+    """Removes workspaces left behind by killed processes; returns how many."""
+    root = root or RENDER_SCRATCH_DIR
+    if not os.path.isdir(root):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not name.startswith(WORKSPACE_PREFIX) or not os.path.isdir(path):
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        except OSError:
+            continue
+    return removed
@@ -0,0 +1,371 @@
+"""
+Minimal in-process metrics registry exported in the Prometheus text format.
+
+Recording is a dict lookup plus a locked add, cheap enough for request and
+render hot paths. Values live per process: with several uvicorn or Celery
+processes, scrape each one (or run a single API process in front of them).
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RENDER_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def drain(self) -> dict:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: dict):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return list(self._values.items())
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> list[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self.samples())
+        ]
+
+
+class Gauge(_Metric):
+    """A gauge either set explicitly or computed by a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        # callback() -> {label-values tuple: value}
+        self._callback = callback
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def merge(self, values: dict):
+        # point-in-time values of another process mean nothing here
+        pass
+
+    def render(self) -> list[str]:
+        if self._callback is not None:
+            try:
+                values = self._callback()
+            except Exception as e:
+                print(f"[metrics] {self.name} callback failed: {e}")
+                values = {}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+            if value is not None
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket (non-cumulative) counts, count, sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, (counts, count, total) in values.items():
+                state = self._values.get(key)
+                if state is None:
+                    state = self._values[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += count
+                state[2] += total
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            snapshot = {key: (list(state[0]), state[1], state[2]) for key, state in self._values.items()}
+        lines = self.header()
+        for key, (counts, count, total) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_count{labels} {count}")
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def drain(self) -> dict:
+        """
+        Takes (and resets) every counter and histogram value. Worker
+        processes return this with their results so the parent, which
+        serves /metrics, can merge() it.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.drain() for m in metrics if not isinstance(m, Gauge)}
+
+    def merge(self, drained: dict):
+        for name, values in (drained or {}).items():
+            metric = self._metrics.get(name)
+            if metric is not None and values:
+                metric.merge(values)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ---------------------------------------------------------
+# METRICS
+# ---------------------------------------------------------
+
+RENDER_SECONDS = REGISTRY.histogram(
+    "autovid_render_duration_seconds",
+    "Wall time of one template render.",
+    ("template_type", "profile"),
+    buckets=RENDER_BUCKETS,
+)
+FFMPEG_EXITS = REGISTRY.counter(
+    "autovid_ffmpeg_exit_total",
+    "ffmpeg invocations by pipeline stage and exit code.",
+    ("stage", "code"),
+)
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "autovid_queue_wait_seconds",
+    "Time a render waited, in the broker (stage=broker) or for a lane slot (stage=slot).",
+    ("lane", "stage"),
+    buckets=RENDER_BUCKETS,
+)
+TTS_SECONDS = REGISTRY.histogram(
+    "autovid_tts_synthesis_seconds",
+    "Kokoro synthesis latency per request.",
+    ("voice",),
+)
+TTS_CHARACTERS = REGISTRY.counter(
+    "autovid_tts_characters_total",
+    "Characters synthesized; rate() over autovid_tts_synthesis_seconds_sum gives chars/s.",
+    ("voice",),
+)
+TTS_CHARS_PER_SECOND = REGISTRY.histogram(
+    "autovid_tts_chars_per_second",
+    "Synthesis throughput per request.",
+    ("voice",),
+    buckets=(10, 25, 50, 100, 200, 400, 800, 1600, 3200),
+)
+MONGO_SECONDS = REGISTRY.histogram(
+    "autovid_mongo_command_seconds",
+    "MongoDB command latency by collection and command.",
+    ("collection", "command"),
+)
+MONGO_FAILURES = REGISTRY.counter(
+    "autovid_mongo_command_failures_total",
+    "Failed MongoDB commands by collection and command.",
+    ("collection", "command"),
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "autovid_cache_requests_total",
+    "Cache lookups by cache and result (hit or miss).",
+    ("cache", "result"),
+)
+
+
+def _cache_hit_ratios() -> dict:
+    totals = {}
+    for (cache, result), value in CACHE_REQUESTS.samples():
+        hits, lookups = totals.get(cache, (0, 0))
+        totals[cache] = (hits + (value if result == "hit" else 0), lookups + value)
+    return {(cache,): hits / lookups for cache, (hits, lookups) in totals.items() if lookups}
+
+
+REGISTRY.gauge(
+    "autovid_cache_hit_ratio",
+    "Hits over lookups since process start, per cache.",
+    ("cache",),
+    callback=_cache_hit_ratios,
+)
+
+
+def process_rss_bytes() -> int | None:
+    """Resident memory of this process (Linux); None where /proc is missing."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+REGISTRY.gauge(
+    "autovid_process_resident_bytes",
+    "Resident memory of this process.",
+    callback=lambda: {(): process_rss_bytes()},
+)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_tts(voice: str, characters: int, seconds: float):
+    TTS_SECONDS.observe(seconds, voice=voice)
+    TTS_CHARACTERS.inc(characters, voice=voice)
+    if seconds > 0:
+        TTS_CHARS_PER_SECOND.observe(characters / seconds, voice=voice)
+
+# ---------------------------------------------------------
+# MONGO COMMAND LISTENER
+# ---------------------------------------------------------
+
+try:
+    from pymongo import monitoring as _monitoring
+    _CommandListenerBase = _monitoring.CommandListener
+except Exception:  # pymongo missing: nothing to listen to
+    _CommandListenerBase = object
+
+
+class MongoCommandMetrics(_CommandListenerBase):
+    """
+    Records per-collection command latency. Only the started event carries
+    the collection name, so it is kept until the matching reply arrives.
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    @staticmethod
+    def _event_key(event):
+        return (event.connection_id, event.request_id)
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = "admin" if event.database_name == "admin" else "-"
+        self._pending[self._event_key(event)] = collection
+
+    def _finish(self, event, failed: bool):
+        collection = self._pending.pop(self._event_key(event), "-")
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, collection=collection, command=event.command_name)
+        if failed:
+            MONGO_FAILURES.inc(collection=collection, command=event.command_name)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+
+def render_latest() -> str:
+    return REGISTRY.render()
@@ -46,6 +46,20 @@ def _resolve_path(path: str, context: dict[str, Any]) -> str:
     return str(cur)
 
 
+def has_placeholders(text: Any) -> bool:
+    """
+    True if replace_placeholders() could change text: {{...}} / {...}
+    placeholders or bare scoped tokens like customer.full_name.
+    """
+    if not isinstance(text, str) or not text:
+        return False
+    return bool(
+        _DOUBLE_BRACE_RE.search(text)
+        or _SINGLE_BRACE_RE.search(text)
+        or _BARE_SCOPED_TOKEN_RE.search(text)
+    )
+
+
 def replace_placeholders(text: str, context: dict[str, Any]) -> str:
     """
     Replaces placeholders in both formats:
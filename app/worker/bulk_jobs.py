@@ -0,0 +1,340 @@
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+from app.worker.lanes import LANE_BATCH
+from app.worker.render_jobs import (
+    STATUS_COMPLETED,
+    STATUS_DEAD_LETTER,
+    STATUS_PENDING,
+    STATUS_RETRYING,
+)
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+# Children rendering at once per campaign; the next batch is dispatched as
+# children finish, so a 50k-customer campaign never floods the queue
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "50"))
+# Throughput is measured over this recent window (falls back to the whole run)
+BULK_THROUGHPUT_WINDOW_SECONDS = float(os.getenv("BULK_THROUGHPUT_WINDOW_SECONDS", "600"))
+BULK_INSERT_CHUNK = 1000
+# Customers whose static voiceover segments a child synthesizes before
+# rendering: its own plus upcoming siblings', so later children find them in
+# the TTS cache. Only composed tracks have any (TTS_COMPOSE_SEGMENTS)
+BULK_TTS_BATCH = int(os.getenv("BULK_TTS_BATCH", "16"))
+
+# bulk_tasks.status lifecycle: running -> completed
+BULK_RUNNING = "running"
+BULK_COMPLETED = "completed"
+
+# ---------------------------------------------------------
+# SETUP
+# ---------------------------------------------------------
+
+def ensure_bulk_indexes(database):
+    """create_index is a no-op when the index already exists."""
+    database.bulk_task_customers.create_index(
+        [("bulk_task_id", ASCENDING), ("customer_id", ASCENDING)], unique=True
+    )
+    database.bulk_task_customers.create_index(
+        [("bulk_task_id", ASCENDING), ("video_task_id", ASCENDING), ("counted", ASCENDING)]
+    )
+    database.video_tasks.create_index([("bulk_task_id", ASCENDING), ("completed_at", ASCENDING)])
+
+
+def create_bulk_task(database, company_id: str, template_id: str, customer_ids: list,
+                     customer_category: str | None = None) -> str:
+    """
+    Records a campaign and one bulk_task_customers row per customer. Rows
+    start without a video_task_id; dispatch_next_batch() fans them out.
+    """
+    ensure_bulk_indexes(database)
+    now = datetime.utcnow()
+    result = database.bulk_tasks.insert_one({
+        "template_id": template_id,
+        "company_id": company_id,
+        "customer_category": customer_category,
+        "total_customers": len(customer_ids),
+        "completed_count": 0,
+        "failed_count": 0,
+        "status": BULK_RUNNING,
+        "created_at": now,
+        "started_at": now,
+        "updated_at": now,
+    })
+    bulk_task_id = str(result.inserted_id)
+
+    for i in range(0, len(customer_ids), BULK_INSERT_CHUNK):
+        rows = [
+            {"bulk_task_id": bulk_task_id, "customer_id": str(cid), "video_task_id": None, "counted": False}
+            for cid in customer_ids[i:i + BULK_INSERT_CHUNK]
+        ]
+        try:
+            database.bulk_task_customers.insert_many(rows, ordered=False)
+        except BulkWriteError:
+            # duplicate customer ids in the input; the unique index keeps one row
+            pass
+
+    _maybe_finish(database, bulk_task_id)
+    return bulk_task_id
+
+# ---------------------------------------------------------
+# FAN-OUT
+# ---------------------------------------------------------
+
+def _upsert_child(database, bulk: dict, row: dict):
+    """Creates the child video task; safe to repeat after a crash."""
+    now = datetime.utcnow()
+    database.video_tasks.update_one(
+        {"_id": row["video_task_id"]},
+        {"$setOnInsert": {
+            "company_id": bulk["company_id"],
+            "template_id": bulk["template_id"],
+            "customer_id": row["customer_id"],
+            "bulk_task_id": str(bulk["_id"]),
+            "status": STATUS_PENDING,
+            "lane": LANE_BATCH,
+            "attempts": 0,
+            "output_url": None,
+            "created_at": now,
+            "updated_at": now,
+        }},
+        upsert=True,
+    )
+
+
+def dispatch_next_batch(database, bulk_task_id: str, enqueue) -> int:
+    """
+    Tops the campaign up to BULK_BATCH_SIZE children in flight. Each row is
+    bound to its video task with a conditional update before the task is
+    created, so concurrent dispatchers never render a customer twice.
+    Returns the number of children queued.
+    """
+    bulk = database.bulk_tasks.find_one({"_id": ObjectId(bulk_task_id)})
+    if not bulk or bulk.get("status") != BULK_RUNNING:
+        return 0
+
+    in_flight = database.bulk_task_customers.count_documents({
+        "bulk_task_id": bulk_task_id, "video_task_id": {"$ne": None}, "counted": False,
+    })
+    slots = BULK_BATCH_SIZE - in_flight
+    if slots <= 0:
+        return 0
+
+    queued = 0
+    rows = database.bulk_task_customers.find(
+        {"bulk_task_id": bulk_task_id, "video_task_id": None}
+    ).sort("_id", ASCENDING).limit(slots)
+    for row in list(rows):
+        video_task_id = ObjectId()
+        bound = database.bulk_task_customers.update_one(
+            {"_id": row["_id"], "video_task_id": None},
+            {"$set": {"video_task_id": video_task_id}},
+        )
+        if bound.modified_count != 1:
+            continue
+        row["video_task_id"] = video_task_id
+        _upsert_child(database, bulk, row)
+        enqueue(str(video_task_id))
+        queued += 1
+    return queued
+
+
+def prewarm_bulk_voiceovers(database, task: dict, template: dict, customer: dict,
+                            company: dict | None) -> int:
+    """
+    Synthesizes the static voiceover segments (composed tracks only: the
+    parts without customer placeholders) of this child and of up to
+    BULK_TTS_BATCH - 1 siblings not yet rendered, in one pass, so children
+    find them in the TTS cache. Customer-specific text is left to each
+    child: it is shared with no sibling. Rows are claimed with a
+    conditional update, so concurrent children never prewarm a customer
+    twice. Returns the number of customers claimed. Best-effort: on failure
+    each child synthesizes its own segments as before.
+    """
+    from app.services.render_context import normalize_customer, voiceover_requests
+
+    bulk_task_id = task.get("bulk_task_id")
+    tpl_json = (template or {}).get("template_json") or {}
+    if not bulk_task_id or BULK_TTS_BATCH <= 1:
+        return 0
+    requests = voiceover_requests(tpl_json, customer=customer, company=company)
+    if not any(request["static_segments"] for request in requests):
+        # no voiceover track, or none composed: nothing repeats across customers
+        return 0
+
+    candidates = [task["customer_id"]] + [
+        row["customer_id"]
+        for row in database.bulk_task_customers.find(
+            {"bulk_task_id": bulk_task_id, "counted": False, "tts_prewarmed": {"$ne": True},
+             "customer_id": {"$ne": task["customer_id"]}},
+            {"customer_id": 1},
+        ).sort("_id", ASCENDING).limit(BULK_TTS_BATCH - 1)
+    ]
+    claimed = []
+    for customer_id in candidates:
+        result = database.bulk_task_customers.update_one(
+            {"bulk_task_id": bulk_task_id, "customer_id": customer_id, "tts_prewarmed": {"$ne": True}},
+            {"$set": {"tts_prewarmed": True}},
+        )
+        if result.modified_count == 1:
+            claimed.append(customer_id)
+    if not claimed:
+        return 0
+
+    from app.services.kokoro_tts import synthesize_deduplicated_cached
+
+    siblings = database.customers.find({"_id": {"$in": [ObjectId(cid) for cid in claimed]}})
+    items = []
+    for sibling in siblings:
+        for request in voiceover_requests(tpl_json, customer=normalize_customer(sibling), company=company):
+            for text in request["static_segments"]:
+                items.append((text, request["voice"], request["speed"]))
+    if items:
+        synthesize_deduplicated_cached(items)
+    return len(claimed)
+
+
+def record_child_result(database, task: dict, enqueue=None):
+    """
+    Called once a child video task reached completed or dead_letter. The
+    per-row "counted" flag makes the $inc happen at most once per customer
+    even when a delivery is repeated.
+    """
+    bulk_task_id = task.get("bulk_task_id")
+    if not bulk_task_id:
+        return
+
+    status = task.get("status")
+    counted = database.bulk_task_customers.update_one(
+        {"bulk_task_id": bulk_task_id, "video_task_id": task["_id"], "counted": False},
+        {"$set": {"counted": True, "status": status}},
+    )
+    if counted.modified_count == 1:
+        field = "completed_count" if status == STATUS_COMPLETED else "failed_count"
+        database.bulk_tasks.update_one(
+            {"_id": ObjectId(bulk_task_id)},
+            {"$inc": {field: 1}, "$set": {"updated_at": datetime.utcnow()}},
+        )
+
+    if not _maybe_finish(database, bulk_task_id) and enqueue is not None:
+        dispatch_next_batch(database, bulk_task_id, enqueue)
+
+
+def _maybe_finish(database, bulk_task_id: str) -> bool:
+    bulk = database.bulk_tasks.find_one({"_id": ObjectId(bulk_task_id)})
+    if not bulk:
+        return True
+    done = bulk.get("completed_count", 0) + bulk.get("failed_count", 0)
+    if done < bulk.get("total_customers", 0):
+        return False
+    database.bulk_tasks.update_one(
+        {"_id": bulk["_id"], "status": BULK_RUNNING},
+        {"$set": {"status": BULK_COMPLETED, "finished_at": datetime.utcnow(), "updated_at": datetime.utcnow()}},
+    )
+    return True
+
+# ---------------------------------------------------------
+# RESUME
+# ---------------------------------------------------------
+
+def resume_bulk_task(database, bulk_task_id: str, enqueue) -> dict:
+    """
+    Continues a campaign after an API or worker crash:
+      - children that finished but were never counted are counted now;
+      - counters are rebuilt from the rows, the source of truth;
+      - rows bound to a missing video task get it re-created;
+      - unfinished children are re-queued (claim_task skips duplicates);
+      - the remaining customers are dispatched as usual.
+    Finished customers are never rendered again.
+    """
+    bulk = database.bulk_tasks.find_one({"_id": ObjectId(bulk_task_id)})
+    if not bulk:
+        raise ValueError(f"Bulk task {bulk_task_id} not found")
+
+    requeued = 0
+    for row in list(database.bulk_task_customers.find({
+        "bulk_task_id": bulk_task_id, "video_task_id": {"$ne": None}, "counted": False,
+    })):
+        child = database.video_tasks.find_one({"_id": row["video_task_id"]})
+        if child is None:
+            _upsert_child(database, bulk, row)
+            child = {"status": STATUS_PENDING}
+        status = child.get("status")
+        if status in (STATUS_COMPLETED, STATUS_DEAD_LETTER):
+            database.bulk_task_customers.update_one(
+                {"_id": row["_id"]}, {"$set": {"counted": True, "status": status}}
+            )
+        elif status in (STATUS_PENDING, STATUS_RETRYING):
+            enqueue(str(row["video_task_id"]))
+            requeued += 1
+
+    completed = database.bulk_task_customers.count_documents(
+        {"bulk_task_id": bulk_task_id, "counted": True, "status": STATUS_COMPLETED}
+    )
+    failed = database.bulk_task_customers.count_documents(
+        {"bulk_task_id": bulk_task_id, "counted": True, "status": {"$ne": STATUS_COMPLETED}}
+    )
+    database.bulk_tasks.update_one(
+        {"_id": bulk["_id"]},
+        {"$set": {"completed_count": completed, "failed_count": failed, "updated_at": datetime.utcnow()}},
+    )
+
+    dispatched = 0
+    if not _maybe_finish(database, bulk_task_id):
+        database.bulk_tasks.update_one({"_id": bulk["_id"]}, {"$set": {"status": BULK_RUNNING}})
+        dispatched = dispatch_next_batch(database, bulk_task_id, enqueue)
+    return {"requeued": requeued, "dispatched": dispatched}
+
+# ---------------------------------------------------------
+# PROGRESS
+# ---------------------------------------------------------
+
+def bulk_task_progress(database, bulk: dict, now: datetime | None = None) -> dict:
+    """Counters plus renders/minute and an ETA for the remaining customers."""
+    now = now or datetime.utcnow()
+    bulk_task_id = str(bulk["_id"])
+    total = bulk.get("total_customers", 0)
+    completed = bulk.get("completed_count", 0)
+    failed = bulk.get("failed_count", 0)
+    remaining = max(0, total - completed - failed)
+
+    since = now - timedelta(seconds=BULK_THROUGHPUT_WINDOW_SECONDS)
+    started_at = bulk.get("started_at") or bulk.get("created_at") or now
+    window_start = max(since, started_at)
+    recent = database.video_tasks.count_documents({
+        "bulk_task_id": bulk_task_id,
+        "status": STATUS_COMPLETED,
+        "completed_at": {"$gte": window_start},
+    })
+    minutes = (now - window_start).total_seconds() / 60.0
+    if recent == 0:
+        # nothing in the window (stalled or just resumed): use the whole run
+        recent = completed
+        minutes = ((bulk.get("finished_at") or now) - started_at).total_seconds() / 60.0
+
+    renders_per_minute = recent / minutes if minutes > 0 else 0.0
+    eta_seconds = None
+    if remaining == 0:
+        eta_seconds = 0
+    elif renders_per_minute > 0:
+        eta_seconds = round(remaining / renders_per_minute * 60)
+
+    return {
+        "bulk_task_id": bulk_task_id,
+        "template_id": bulk.get("template_id"),
+        "customer_category": bulk.get("customer_category"),
+        "status": bulk.get("status"),
+        "total_customers": total,
+        "completed_count": completed,
+        "failed_count": failed,
+        "remaining": remaining,
+        "renders_per_minute": round(renders_per_minute, 2),
+        "eta_seconds": eta_seconds,
+        "started_at": bulk.get("started_at"),
+        "finished_at": bulk.get("finished_at"),
+    }
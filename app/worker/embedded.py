@@ -0,0 +1,135 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from app.services.render_cost import allocated_threads, current_threads
+from app.utils.metrics import REGISTRY
+from app.worker.render_jobs import (
+    CLAIMABLE_STATUSES,
+    STATUS_PROCESSING,
+    STATUS_RETRYING,
+    owner_is_gone,
+    render_task,
+)
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+# Render processes of the embedded runner (RENDER_QUEUE_BACKEND=embedded)
+EMBEDDED_WORKERS = max(1, int(os.getenv("EMBEDDED_WORKERS", str(os.cpu_count() or 2))))
+
+# ---------------------------------------------------------
+# CHILD PROCESS
+# ---------------------------------------------------------
+
+def _render_in_child(task: dict, threads: int | None = None) -> dict:
+    """
+    Runs in a pool process. Only the render happens here; claiming and the
+    status transitions stay in the parent. Metrics recorded while rendering
+    are shipped back with the result because /metrics is served by the
+    parent. threads is the core share the parent's scheduler granted.
+    """
+    from app.db.connection import get_sync_db
+
+    REGISTRY.drain()
+    try:
+        with allocated_threads(threads):
+            output = render_task(task, get_sync_db())
+        return {"output": output, "metrics": REGISTRY.drain()}
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}", "metrics": REGISTRY.drain()}
+
+# ---------------------------------------------------------
+# RUNNER
+# ---------------------------------------------------------
+
+class EmbeddedRunner:
+    """
+    Single-node job runner: the API process schedules renders from the
+    durable video_tasks collection and executes them on a local process
+    pool, so no Redis or Celery worker is needed.
+    """
+
+    def __init__(self, workers: int = EMBEDDED_WORKERS):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: children must not inherit the parent's Mongo clients
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def _reset_pool(self, broken):
+        with self._lock:
+            if self._pool is broken:
+                self._pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def render(self, task: dict, database=None) -> str:
+        """render callable for run_render_job; blocks the calling thread."""
+        pool = self._get_pool()
+        try:
+            result = pool.submit(_render_in_child, task, current_threads()).result()
+        except BrokenProcessPool:
+            # a render process died (OOM kill, segfault): start a fresh pool,
+            # the task itself goes through the normal retry path
+            self._reset_pool(pool)
+            raise RuntimeError("Render process crashed")
+
+        REGISTRY.merge(result.get("metrics"))
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result["output"]
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def recover_tasks(database, enqueue) -> int:
+    """
+    Re-queues work that was pending when the process stopped. A
+    "processing" task goes back to retrying (its attempt still counts) only
+    when it was orphaned: its lease expired, or its owner was a process of
+    this host that is gone. Other API processes (uvicorn --workers) and
+    lease workers may still be rendering the rest; those get a delivery at
+    their lease expiry, which claim_task skips while the owner heartbeats.
+    """
+    now = datetime.utcnow()
+    count = 0
+    for task in database.video_tasks.find(
+        {"status": STATUS_PROCESSING}, {"lease_owner": 1, "lease_expires_at": 1, "started_at": 1}
+    ):
+        expires = task.get("lease_expires_at")
+        if isinstance(expires, datetime) and expires >= now and not owner_is_gone(
+            task.get("lease_owner"), task.get("started_at")
+        ):
+            enqueue(str(task["_id"]), countdown=(expires - now).total_seconds())
+            count += 1
+            continue
+        database.video_tasks.update_one(
+            # unchanged since we read it: nobody reclaimed it meanwhile
+            {"_id": task["_id"], "status": STATUS_PROCESSING, "lease_owner": task.get("lease_owner")},
+            {
+                "$set": {"status": STATUS_RETRYING, "error": "Interrupted by restart", "updated_at": now},
+                "$unset": {"lease_owner": "", "lease_expires_at": ""},
+            },
+        )
+
+    for task in database.video_tasks.find({"status": {"$in": CLAIMABLE_STATUSES}}, {"next_attempt_at": 1}):
+        due = task.get("next_attempt_at")
+        countdown = (due - now).total_seconds() if isinstance(due, datetime) else 0
+        enqueue(str(task["_id"]), countdown=max(0.0, countdown))
+        count += 1
+    return count
@@ -0,0 +1,240 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from app.services.render_cost import allocated_threads, threads_for_cost
+from app.utils.metrics import QUEUE_WAIT_SECONDS
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+LANE_INTERACTIVE = "interactive"   # preview / download routes, a user is waiting
+LANE_BATCH = "batch"               # /tasks/generate and bulk campaigns
+LANES = (LANE_INTERACTIVE, LANE_BATCH)
+
+# Concurrent renders per process; ffmpeg is multi-threaded, so this is a
+# count of jobs, not of threads
+RENDER_SLOTS = max(1, int(os.getenv("RENDER_SLOTS", str(os.cpu_count() or 2))))
+# Slots batch work may never take, so a preview click always finds a free one
+RENDER_INTERACTIVE_RESERVED = min(
+    RENDER_SLOTS - 1 if RENDER_SLOTS > 1 else 0,
+    int(os.getenv("RENDER_INTERACTIVE_RESERVED", str(max(1, RENDER_SLOTS // 4)))),
+)
+
+
+def _parse_weights(raw: str) -> dict:
+    weights = {LANE_INTERACTIVE: 4, LANE_BATCH: 1}
+    for part in raw.split(","):
+        if "=" in part:
+            lane, value = part.split("=", 1)
+            if lane.strip() in weights:
+                weights[lane.strip()] = max(1, int(value))
+    return weights
+
+
+# When both lanes wait for a shared slot, interactive gets 4 of every 5
+RENDER_LANE_WEIGHTS = _parse_weights(os.getenv("RENDER_LANE_WEIGHTS", ""))
+# Cores renders are packed onto; each job holds as many as its ffmpeg threads
+RENDER_CORES = max(1, int(os.getenv("RENDER_CORES", str(os.cpu_count() or 2))))
+# Shortest-job-first would starve a long batch render behind a steady stream
+# of short ones; after this wait it goes first and is not backfilled around
+RENDER_SJF_MAX_WAIT_SECONDS = float(os.getenv("RENDER_SJF_MAX_WAIT_SECONDS", "600"))
+
+# ---------------------------------------------------------
+# SCHEDULER
+# ---------------------------------------------------------
+
+class Grant:
+    """One render's claim on the scheduler: a slot plus `cores` cores."""
+
+    __slots__ = ("lane", "cost", "cores", "threads", "enqueued_at")
+
+    def __init__(self, lane: str, cost: float | None):
+        self.lane = lane
+        self.cost = cost
+        self.cores = 0
+        # ffmpeg -threads for the job; None (cost unknown) keeps ffmpeg's default
+        self.threads = None
+        self.enqueued_at = time.monotonic()
+
+
+class LaneScheduler:
+    """
+    Hands out render slots to lanes and packs the renders onto cores.
+
+    - a job with a known cost asks for threads_for_cost(cost) cores, one
+      without asks for one core and keeps ffmpeg's default threading;
+    - batch never holds more than slots - reserved_interactive slots, nor
+      more than cores - reserved_interactive cores;
+    - interactive is FIFO and, when cores are short, runs on what is free
+      rather than waiting;
+    - batch is shortest-job-first by cost, first-fit: a job that does not
+      fit the free cores lets a smaller one start instead, unless it has
+      waited longer than sjf_max_wait;
+    - a free slot goes to a waiting lane by smooth weighted round-robin.
+    """
+
+    def __init__(self, slots: int = RENDER_SLOTS, reserved_interactive: int = RENDER_INTERACTIVE_RESERVED,
+                 weights: dict | None = None, cores: int | None = None,
+                 sjf_max_wait: float = RENDER_SJF_MAX_WAIT_SECONDS, threads_for=threads_for_cost):
+        self.slots = slots
+        self.reserved_interactive = reserved_interactive
+        self.weights = weights or dict(RENDER_LANE_WEIGHTS)
+        # without a cost every job takes one core, so never pack tighter than slots
+        self.cores = cores or max(slots, RENDER_CORES)
+        self.sjf_max_wait = sjf_max_wait
+        self.threads_for = threads_for
+        self._cond = threading.Condition()
+        self._running = {lane: [] for lane in LANES}
+        self._waiting = {lane: deque() for lane in LANES}
+        self._current = {lane: 0 for lane in LANES}
+        self._granted = set()
+
+    def _limit(self, lane: str) -> int:
+        if lane == LANE_BATCH:
+            return self.slots - self.reserved_interactive
+        return self.slots
+
+    def _core_limit(self, lane: str) -> int:
+        if lane == LANE_BATCH:
+            return max(1, self.cores - self.reserved_interactive)
+        return self.cores
+
+    def _cores_used(self, lane: str | None = None) -> int:
+        lanes = LANES if lane is None else (lane,)
+        return sum(grant.cores for name in lanes for grant in self._running[name])
+
+    def _wanted_cores(self, grant: Grant) -> int:
+        if grant.cost is None:
+            return 1
+        return max(1, min(self.threads_for(grant.cost), self._core_limit(grant.lane)))
+
+    def _starving(self, grant: Grant, now: float) -> bool:
+        return now - grant.enqueued_at >= self.sjf_max_wait
+
+    def _next_fit(self, lane: str, now: float):
+        """The waiting job of lane to start next and its core count, or None."""
+        waiting = self._waiting[lane]
+        if not waiting or len(self._running[lane]) >= self._limit(lane):
+            return None
+        free = min(
+            self.cores - self._cores_used(),
+            self._core_limit(lane) - self._cores_used(lane),
+        )
+        if free < 1:
+            return None
+
+        if lane == LANE_INTERACTIVE:
+            grant = waiting[0]
+            return grant, min(self._wanted_cores(grant), free)
+
+        def sjf_key(grant):
+            # starving jobs first (oldest first), then cheapest; unknown cost last
+            if self._starving(grant, now):
+                return (0, grant.enqueued_at)
+            return (1, grant.cost if grant.cost is not None else float("inf"), grant.enqueued_at)
+
+        for grant in sorted(waiting, key=sjf_key):
+            wanted = self._wanted_cores(grant)
+            if wanted <= free:
+                return grant, wanted
+            if self._starving(grant, now):
+                # hold the cores it needs instead of backfilling around it
+                return None
+        return None
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while sum(len(running) for running in self._running.values()) < self.slots:
+            ready = {}
+            for lane in LANES:
+                fit = self._next_fit(lane, now)
+                if fit is not None:
+                    ready[lane] = fit
+            if not ready:
+                return
+            total = sum(self.weights[lane] for lane in ready)
+            for lane in ready:
+                self._current[lane] += self.weights[lane]
+            lane = max(ready, key=lambda name: self._current[name])
+            self._current[lane] -= total
+
+            grant, cores = ready[lane]
+            self._waiting[lane].remove(grant)
+            grant.cores = cores
+            grant.threads = cores if grant.cost is not None else None
+            self._running[lane].append(grant)
+            self._granted.add(grant)
+            self._cond.notify_all()
+
+    def acquire(self, lane: str, cost: float | None = None) -> Grant:
+        if lane not in self._running:
+            raise ValueError(f"Unknown render lane: {lane}")
+        grant = Grant(lane, cost)
+        started = time.perf_counter()
+        with self._cond:
+            self._waiting[lane].append(grant)
+            self._dispatch()
+            while grant not in self._granted:
+                # re-dispatch on wake-up too: a batch job may have started starving
+                self._cond.wait(timeout=self.sjf_max_wait if self.sjf_max_wait > 0 else None)
+                self._dispatch()
+            self._granted.discard(grant)
+        QUEUE_WAIT_SECONDS.observe(time.perf_counter() - started, lane=lane, stage="slot")
+        return grant
+
+    def release(self, lane: str, grant: Grant | None = None):
+        with self._cond:
+            running = self._running[lane]
+            running.remove(grant if grant is not None else running[0])
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, lane: str, cost: float | None = None):
+        grant = self.acquire(lane, cost)
+        try:
+            with allocated_threads(grant.threads):
+                yield grant
+        finally:
+            self.release(lane, grant)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                lane: {
+                    "waiting": len(self._waiting[lane]),
+                    "running": len(self._running[lane]),
+                    "max_slots": self._limit(lane),
+                    "weight": self.weights[lane],
+                    "cores_used": self._cores_used(lane),
+                    "max_cores": self._core_limit(lane),
+                }
+                for lane in LANES
+            }
+
+# ---------------------------------------------------------
+# PUBLIC API
+# ---------------------------------------------------------
+
+scheduler = LaneScheduler()
+
+
+def render_slot(lane: str, cost: float | None = None):
+    """Context manager holding one render slot of the given lane."""
+    return scheduler.slot(lane, cost)
+
+
+def run_in_lane_sync(lane: str, fn, *args, cost: float | None = None, **kwargs):
+    with scheduler.slot(lane, cost):
+        return fn(*args, **kwargs)
+
+
+async def run_in_lane(lane: str, fn, *args, cost: float | None = None, **kwargs):
+    """
+    run_in_threadpool, but the render waits for a slot of its lane first.
+    cost (estimate_render_cost()["cost"]) sizes the render's core share.
+    """
+    from fastapi.concurrency import run_in_threadpool
+    return await run_in_threadpool(run_in_lane_sync, lane, fn, *args, cost=cost, **kwargs)
@@ -0,0 +1,99 @@
+"""
+Brokerless render worker: polls video_tasks and claims work with leases.
+
+Run one per machine (or several) against the shared MongoDB:
+
+    RENDER_QUEUE_BACKEND=mongo python -m app.worker.lease_worker
+
+The API then only inserts pending tasks; nothing is sent to a broker.
+"""
+import os
+import signal
+import threading
+
+from app.worker.lanes import RENDER_INTERACTIVE_RESERVED, RENDER_SLOTS
+from app.worker.render_jobs import (
+    claim_next_task,
+    default_owner,
+    ensure_task_indexes,
+    execute_claimed_task,
+)
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+# Tasks run in the batch lane; a thread beyond its slots would claim a task
+# and then sit in render_slot, keeping the lease (by heartbeat) away from
+# nodes with free capacity
+LEASE_WORKER_THREADS = int(os.getenv(
+    "LEASE_WORKER_THREADS", str(RENDER_SLOTS - RENDER_INTERACTIVE_RESERVED)
+))
+LEASE_POLL_SECONDS = float(os.getenv("LEASE_POLL_SECONDS", "2"))
+
+
+def _no_enqueue(task_id: str, countdown: float = 0, **kwargs):
+    # Retries and bulk fan-out are picked up by polling: fail_task sets
+    # next_attempt_at and new children are inserted as pending
+    pass
+
+
+class LeaseWorker:
+    def __init__(self, database, render=None, threads: int = LEASE_WORKER_THREADS,
+                 poll_interval: float = LEASE_POLL_SECONDS):
+        self.database = database
+        self.render = render
+        self.threads = max(1, threads)
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def run_once(self, owner: str | None = None) -> bool:
+        """Claims and executes one task; False when nothing was claimable."""
+        task = claim_next_task(self.database, owner or default_owner())
+        if task is None:
+            return False
+        execute_claimed_task(task, self.database, enqueue=_no_enqueue, render=self.render)
+        return True
+
+    def _loop(self):
+        owner = default_owner()
+        while not self._stop.is_set():
+            try:
+                if self.run_once(owner):
+                    continue
+            except Exception as e:
+                print(f"[lease-worker] {owner}: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def start(self):
+        ensure_task_indexes(self.database)
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._loop, name=f"lease-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float | None = None):
+        """Stops claiming; tasks already rendering run to completion."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+
+def main():
+    from app.db.connection import get_sync_db
+
+    worker = LeaseWorker(get_sync_db())
+    worker.start()
+    print(f"[lease-worker] {worker.threads} thread(s) polling video_tasks")
+
+    stopped = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopped.set())
+    stopped.wait()
+    print("[lease-worker] stopping; waiting for running renders")
+    worker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import os
+import heapq
+import itertools
+import threading
+import time
+
+from app.utils.metrics import REGISTRY
+from app.worker.lanes import LANE_BATCH, RENDER_SLOTS, RENDER_INTERACTIVE_RESERVED, scheduler
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+# "celery"   Redis broker, separate worker processes
+# "embedded" single node: the API process schedules from video_tasks and
+#            renders on a local process pool (app/worker/embedded.py)
+# "mongo"    no broker: lease workers on any number of machines poll
+#            video_tasks (app/worker/lease_worker.py)
+# "memory"   in-process threads, for development and tests
+RENDER_QUEUE_BACKEND = os.getenv("RENDER_QUEUE_BACKEND", "celery").lower()
+
+# ---------------------------------------------------------
+# BROKERS
+# ---------------------------------------------------------
+
+class InMemoryBroker:
+    """
+    Stand-in broker holding render messages in process. Messages carry an
+    ETA so retries with backoff behave like Celery countdowns.
+
+    Tests call run_pending() to deliver due messages synchronously; the API
+    in "memory" mode calls start() to consume them on background threads.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopped = False
+
+    def enqueue(self, task_id: str, countdown: float = 0, lane: str = LANE_BATCH):
+        with self._cond:
+            heapq.heappush(self._heap, (self._clock() + max(0.0, countdown), next(self._seq), task_id))
+            self._cond.notify()
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def pop_ready(self):
+        with self._cond:
+            if self._heap and self._heap[0][0] <= self._clock():
+                return heapq.heappop(self._heap)[2]
+            return None
+
+    def run_pending(self, handler) -> int:
+        """Delivers every message that is due; returns how many ran."""
+        count = 0
+        while True:
+            task_id = self.pop_ready()
+            if task_id is None:
+                return count
+            handler(task_id)
+            count += 1
+
+    def start(self, handler, workers: int = 1):
+        if self._threads:
+            return
+        self._stopped = False
+        for i in range(max(1, workers)):
+            thread = threading.Thread(target=self._consume, args=(handler,), name=f"render-queue-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def _consume(self, handler):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._heap and self._heap[0][0] <= self._clock():
+                        break
+                    timeout = self._heap[0][0] - self._clock() if self._heap else None
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+                task_id = heapq.heappop(self._heap)[2]
+            try:
+                handler(task_id)
+            except Exception as e:
+                print(f"[render-queue] handler crashed for {task_id}: {e}")
+
+
+class CeleryBroker:
+    """Each lane is its own Celery queue, so workers can be dedicated per lane."""
+
+    def enqueue(self, task_id: str, countdown: float = 0, lane: str = LANE_BATCH):
+        from app.worker.video_worker import render_video_task
+        render_video_task.apply_async(args=[task_id], countdown=countdown or None, queue=lane)
+
+    def depth(self) -> int | None:
+        return None
+
+class MongoBroker:
+    """
+    The pending video_tasks document is the message; lease workers claim it
+    with find_one_and_update, so enqueueing has nothing to send.
+    """
+
+    def enqueue(self, task_id: str, countdown: float = 0, lane: str = LANE_BATCH):
+        pass
+
+    def depth(self) -> int | None:
+        from app.db.connection import get_sync_db
+        from app.worker.render_jobs import CLAIMABLE_STATUSES
+        return get_sync_db().video_tasks.count_documents({"status": {"$in": CLAIMABLE_STATUSES}})
+
+# ---------------------------------------------------------
+# PUBLIC API
+# ---------------------------------------------------------
+
+_broker = None
+_broker_lock = threading.Lock()
+_reaper = None
+
+
+def _reap_expired_leases(enqueue, interval: float):
+    from app.db.connection import get_sync_db
+    from app.worker.render_jobs import requeue_expired_leases
+
+    while True:
+        time.sleep(interval)
+        try:
+            count = requeue_expired_leases(get_sync_db(), enqueue)
+            if count:
+                print(f"[render-queue] Re-queued {count} task(s) whose worker stopped heartbeating")
+        except Exception as e:
+            print(f"[render-queue] Lease reaper failed: {e}")
+
+
+def start_lease_reaper(enqueue):
+    """
+    Periodically re-queues tasks whose worker died mid-render. Needed by
+    every broker backend ("mongo" lease workers reclaim by polling); each
+    API process runs one, and the conditional update lets only one of them
+    enqueue a given task.
+    """
+    global _reaper
+    from app.worker.render_jobs import RENDER_LEASE_SECONDS
+
+    with _broker_lock:
+        if _reaper is None:
+            _reaper = threading.Thread(
+                target=_reap_expired_leases, args=(enqueue, RENDER_LEASE_SECONDS / 2),
+                name="lease-reaper", daemon=True,
+            )
+            _reaper.start()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            if RENDER_QUEUE_BACKEND in ("memory", "embedded"):
+                from app.db.connection import get_sync_db
+                from app.worker.embedded import EmbeddedRunner, recover_tasks
+                from app.worker.render_jobs import run_render_job
+
+                render = EmbeddedRunner().render if RENDER_QUEUE_BACKEND == "embedded" else None
+                broker = InMemoryBroker()
+                # one consumer per slot batch may use; the lane scheduler
+                # still keeps RENDER_INTERACTIVE_RESERVED slots for previews
+                broker.start(
+                    lambda task_id: run_render_job(task_id, enqueue=broker.enqueue, render=render),
+                    workers=RENDER_SLOTS - RENDER_INTERACTIVE_RESERVED,
+                )
+                # the broker is not durable; rebuild it from video_tasks
+                recovered = recover_tasks(get_sync_db(), broker.enqueue)
+                if recovered:
+                    print(f"[render-queue] Re-queued {recovered} unfinished task(s)")
+                _broker = broker
+            elif RENDER_QUEUE_BACKEND == "mongo":
+                _broker = MongoBroker()
+            else:
+                _broker = CeleryBroker()
+        return _broker
+
+
+def start_local_queue():
+    """
+    Starts the in-process consumers (embedded/memory) and, for every
+    broker backend, the lease reaper at API startup.
+    """
+    if RENDER_QUEUE_BACKEND == "mongo":
+        return
+    start_lease_reaper(get_broker().enqueue)
+
+
+def enqueue_render(task_id: str, countdown: float = 0, lane: str = LANE_BATCH):
+    """Queues a video task for rendering and returns immediately."""
+    get_broker().enqueue(task_id, countdown=countdown, lane=lane)
+
+
+def lane_stats() -> dict:
+    """Per-lane render slots in this process plus the broker backlog."""
+    stats = scheduler.snapshot()
+    stats[LANE_BATCH]["queued"] = get_broker().depth()
+    return stats
+
+
+def _lane_gauge(field):
+    return lambda: {(lane,): stats[field] for lane, stats in scheduler.snapshot().items()}
+
+
+REGISTRY.gauge("autovid_render_lane_waiting", "Renders waiting for a slot, per lane.", ("lane",),
+               callback=_lane_gauge("waiting"))
+REGISTRY.gauge("autovid_render_lane_running", "Renders holding a slot, per lane.", ("lane",),
+               callback=_lane_gauge("running"))
+REGISTRY.gauge("autovid_render_lane_cores", "Cores held by running renders, per lane.", ("lane",),
+               callback=_lane_gauge("cores_used"))
+REGISTRY.gauge(
+    "autovid_render_queue_depth",
+    "Messages in the in-process broker (unknown for Celery).",
+    ("lane",),
+    callback=lambda: {(LANE_BATCH,): _broker.depth() if _broker is not None else 0},
+)
@@ -0,0 +1,455 @@
+import os
+import socket
+import asyncio
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+
+from app.utils.metrics import QUEUE_WAIT_SECONDS
+
+# ---------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media")
+RENDER_MAX_ATTEMPTS = int(os.getenv("RENDER_MAX_ATTEMPTS", "3"))
+RENDER_RETRY_BASE_SECONDS = float(os.getenv("RENDER_RETRY_BASE_SECONDS", "10"))
+RENDER_RETRY_MAX_SECONDS = float(os.getenv("RENDER_RETRY_MAX_SECONDS", "600"))
+# A claimed task belongs to its worker until lease_expires_at; heartbeats
+# extend it every third of the lease, so a dead worker's task is reclaimed
+# within one lease period
+RENDER_LEASE_SECONDS = float(os.getenv("RENDER_LEASE_SECONDS", "60"))
+
+# video_tasks.status lifecycle:
+#   pending -> processing -> completed
+#                         -> retrying -> processing ...
+#                         -> dead_letter (after RENDER_MAX_ATTEMPTS)
+#   processing with an expired lease is claimable again (worker died)
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_RETRYING = "retrying"
+STATUS_COMPLETED = "completed"
+STATUS_DEAD_LETTER = "dead_letter"
+CLAIMABLE_STATUSES = [STATUS_PENDING, STATUS_RETRYING]
+
+# ---------------------------------------------------------
+# STATE TRANSITIONS
+# ---------------------------------------------------------
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff: base, 2*base, 4*base ... capped."""
+    delay = RENDER_RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1))
+    return min(delay, RENDER_RETRY_MAX_SECONDS)
+
+
+def default_owner() -> str:
+    """Lease owner id: unique per worker thread across hosts."""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+_PROCESS_STARTED_AT = datetime.utcnow()
+
+
+def owner_is_gone(owner: str | None, claimed_at=None) -> bool:
+    """
+    True when a default_owner() id names a process of this host that is no
+    longer running. Owners on other hosts are never known to be gone.
+    """
+    host_pid, _, _ = (owner or "").rpartition(":")
+    host, _, pid = host_pid.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        # an earlier process with our pid, e.g. pid 1 of a restarted container
+        return isinstance(claimed_at, datetime) and claimed_at < _PROCESS_STARTED_AT
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        # exists under another user
+        return False
+    return False
+
+
+def ensure_task_indexes(database):
+    """Indexes behind the claim queries; create_index is idempotent."""
+    database.video_tasks.create_index(
+        [("status", ASCENDING), ("next_attempt_at", ASCENDING), ("created_at", ASCENDING)],
+        name="claim_ready",
+    )
+    database.video_tasks.create_index(
+        [("status", ASCENDING), ("lease_expires_at", ASCENDING)],
+        name="claim_expired_lease",
+    )
+
+
+def _claimable(now: datetime) -> dict:
+    """Due (retry backoff elapsed) or abandoned (lease expired)."""
+    return {"$or": [
+        {"status": {"$in": CLAIMABLE_STATUSES}, "next_attempt_at": {"$not": {"$gt": now}}},
+        {"status": STATUS_PROCESSING, "lease_expires_at": {"$lt": now}},
+    ]}
+
+
+def _claim_update(now: datetime, owner: str) -> dict:
+    return {
+        "$set": {
+            "status": STATUS_PROCESSING,
+            "lease_owner": owner,
+            "lease_expires_at": now + timedelta(seconds=RENDER_LEASE_SECONDS),
+            "started_at": now,
+            "updated_at": now,
+        },
+        "$inc": {"attempts": 1},
+    }
+
+
+def claim_task(database, task_id: str, owner: str | None = None):
+    """
+    Atomically leases one task: pending, retrying once its backoff elapsed,
+    or processing whose lease expired. Returns the claimed document, or None
+    when another worker holds it, it finished or its retry is not due yet,
+    which makes duplicate queue messages harmless.
+    """
+    now = datetime.utcnow()
+    return database.video_tasks.find_one_and_update(
+        {"_id": ObjectId(task_id), **_claimable(now)},
+        _claim_update(now, owner or default_owner()),
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def claim_next_task(database, owner: str | None = None):
+    """
+    Brokerless claim for lease workers: the oldest task that is due (retry
+    backoff elapsed) or whose lease expired.
+    """
+    now = datetime.utcnow()
+    return database.video_tasks.find_one_and_update(
+        _claimable(now),
+        _claim_update(now, owner or default_owner()),
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def requeue_expired_leases(database, enqueue) -> int:
+    """
+    Moves processing tasks whose lease expired (their worker died) back to
+    retrying and enqueues them. Lease workers reclaim such tasks through
+    claim_next_task; a broker only delivers what was enqueued, so Celery
+    and the embedded runner rely on this instead.
+    """
+    now = datetime.utcnow()
+    count = 0
+    for task in database.video_tasks.find(
+        {"status": STATUS_PROCESSING, "lease_expires_at": {"$lt": now}}, {"_id": 1}
+    ):
+        # conditional: one reaper per API process may race for the same task
+        result = database.video_tasks.update_one(
+            {"_id": task["_id"], "status": STATUS_PROCESSING, "lease_expires_at": {"$lt": now}},
+            {
+                "$set": {
+                    "status": STATUS_RETRYING,
+                    "error": "Worker stopped heartbeating",
+                    "next_attempt_at": now,
+                    "updated_at": now,
+                },
+                "$unset": {"lease_owner": "", "lease_expires_at": ""},
+            },
+        )
+        if result.modified_count:
+            enqueue(str(task["_id"]))
+            count += 1
+    return count
+
+
+def retry_wait(database, task_id: str) -> float:
+    """Seconds until a retrying task's backoff elapses; 0 when it is due or not retrying."""
+    task = database.video_tasks.find_one(
+        {"_id": ObjectId(task_id), "status": STATUS_RETRYING}, {"next_attempt_at": 1}
+    )
+    due = (task or {}).get("next_attempt_at")
+    if not isinstance(due, datetime):
+        return 0.0
+    return max(0.0, (due - datetime.utcnow()).total_seconds())
+
+
+def heartbeat(database, task: dict) -> bool:
+    """Extends the lease; False means another worker has taken the task."""
+    now = datetime.utcnow()
+    result = database.video_tasks.update_one(
+        {"_id": task["_id"], "status": STATUS_PROCESSING, "lease_owner": task["lease_owner"]},
+        {"$set": {"lease_expires_at": now + timedelta(seconds=RENDER_LEASE_SECONDS), "updated_at": now}},
+    )
+    return result.matched_count == 1
+
+
+class LeaseHeartbeat:
+    """Keeps a task's lease alive from a background thread while it renders."""
+
+    def __init__(self, database, task: dict, interval: float | None = None):
+        self.database = database
+        self.task = task
+        self.interval = interval if interval is not None else RENDER_LEASE_SECONDS / 3
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not heartbeat(self.database, self.task):
+                    self.lost = True
+                    print(f"[render] Lost lease on task {self.task['_id']}")
+                    return
+            except Exception as e:
+                # transient Mongo error: keep trying until the lease runs out
+                print(f"[render] Heartbeat failed for task {self.task['_id']}: {e}")
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        return False
+
+
+def _owned(task: dict) -> dict:
+    """Filter matching the task only while this worker still holds it."""
+    query = {"_id": task["_id"]}
+    if task.get("lease_owner"):
+        query.update({"status": STATUS_PROCESSING, "lease_owner": task["lease_owner"]})
+    return query
+
+
+_RELEASE_LEASE = {"lease_owner": "", "lease_expires_at": ""}
+
+
+def complete_task(database, task: dict, output_path: str) -> bool:
+    result = database.video_tasks.update_one(
+        _owned(task),
+        {
+            "$set": {
+                "status": STATUS_COMPLETED,
+                "progress": 100,
+                "output_video_url": output_path,
+                "error": None,
+                "completed_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow(),
+            },
+            "$unset": _RELEASE_LEASE,
+        },
+    )
+    return result.matched_count == 1
+
+
+def fail_task(database, task: dict, error: str) -> float | None:
+    """
+    Records a failed attempt. Returns the backoff delay when the task should
+    be retried, or None once it has been moved to the dead-letter state.
+    """
+    attempts = int(task.get("attempts") or 1)
+    now = datetime.utcnow()
+    if attempts < RENDER_MAX_ATTEMPTS:
+        delay = retry_delay(attempts)
+        database.video_tasks.update_one(
+            _owned(task),
+            {
+                "$set": {
+                    "status": STATUS_RETRYING,
+                    "error": error,
+                    "next_attempt_at": now + timedelta(seconds=delay),
+                    "updated_at": now,
+                },
+                "$unset": _RELEASE_LEASE,
+            },
+        )
+        return delay
+
+    database.video_tasks.update_one(
+        _owned(task),
+        {
+            "$set": {
+                "status": STATUS_DEAD_LETTER,
+                "error": error,
+                "dead_lettered_at": now,
+                "updated_at": now,
+            },
+            "$unset": _RELEASE_LEASE,
+        },
+    )
+    return None
+
+# ---------------------------------------------------------
+# RENDER
+# ---------------------------------------------------------
+
+def load_render_inputs(task: dict, database) -> tuple[dict, dict, dict, str | None]:
+    """The template, normalized customer and company, and company id of a task."""
+    from app.services.render_context import normalize_company, normalize_customer
+
+    template = database.templates.find_one({"_id": ObjectId(str(task["template_id"]))})
+    if not template:
+        raise ValueError(f"Template {task['template_id']} not found")
+    customer = database.customers.find_one({"_id": ObjectId(str(task["customer_id"]))})
+    if not customer:
+        raise ValueError(f"Customer {task['customer_id']} not found")
+
+    company = None
+    company_id = customer.get("linked_company_id") or template.get("company_id")
+    if company_id:
+        company = database.companies.find_one({"_id": ObjectId(str(company_id))})
+
+    return template, normalize_customer(customer), normalize_company(company), company_id
+
+
+def prepare_task(task: dict, database):
+    """
+    Work a task does before it takes a render slot: a bulk child synthesizes
+    the static voiceover segments of upcoming siblings. Best-effort.
+    """
+    if not task.get("bulk_task_id"):
+        return
+    from app.worker.bulk_jobs import prewarm_bulk_voiceovers
+
+    try:
+        template, customer, company, _ = load_render_inputs(task, database)
+        prewarm_bulk_voiceovers(database, task, template, customer, company)
+    except Exception as e:
+        print(f"[render] Prewarming voiceovers failed for bulk task {task['bulk_task_id']}: {e}")
+
+
+def render_task(task: dict, database) -> str:
+    """Renders the template of a video task for its customer."""
+    from app.services.render_context import apply_dynamic_audio_to_template
+    from app.services.smart_render import render_preview_smart
+    from app.services.tts_executor import inline_tts
+
+    template, customer, company, company_id = load_render_inputs(task, database)
+
+    # Voiceover TTS is async; the worker has no running loop, so give it one.
+    # Workers are off the API event loop already: synthesize in-process
+    tpl_json = template.get("template_json", {}) or {}
+    with inline_tts():
+        asyncio.run(apply_dynamic_audio_to_template(
+            tpl_json,
+            customer=customer,
+            company=company,
+            company_id=str(template.get("company_id") or company_id or ""),
+        ))
+    template["template_json"] = tpl_json
+
+    os.makedirs(MEDIA_ROOT, exist_ok=True)
+    output_path = os.path.join(MEDIA_ROOT, f"{task['_id']}.mp4")
+    render_preview_smart(template, {"customer": customer, "company": company}, output_path)
+    return output_path
+
+
+def task_render_cost(database, task: dict) -> float | None:
+    """Scheduling cost of a task's template; None when it cannot be estimated."""
+    from app.services.render_cost import estimate_render_cost
+
+    try:
+        template = database.templates.find_one(
+            {"_id": ObjectId(str(task["template_id"]))},
+            {"template_json": 1, "duration": 1, "trim": 1},
+        )
+    except Exception as e:
+        print(f"[render] Could not estimate cost of task {task.get('_id')}: {e}")
+        return None
+    if not template:
+        return None
+    return estimate_render_cost(template)["cost"]
+
+
+def run_render_job(task_id: str, database=None, enqueue=None, render=None, owner=None):
+    """
+    Executes one queue delivery for a video task: claim, render, then mark it
+    completed, schedule a retry through enqueue(task_id, countdown), or move
+    it to the dead-letter state.
+    """
+    if database is None:
+        from app.db.connection import get_sync_db
+        database = get_sync_db()
+
+    task = claim_task(database, task_id, owner)
+    if task is None:
+        wait = retry_wait(database, task_id)
+        if wait > 0 and enqueue is not None:
+            # delivered before its backoff elapsed (clock skew between the
+            # broker and Mongo): the retry message must not be lost
+            print(f"[render] Task {task_id} is not due for {wait:.1f}s; requeued")
+            enqueue(task_id, countdown=wait)
+            return None
+        print(f"[render] Task {task_id} already claimed, finished or not due; skipping")
+        return None
+    return execute_claimed_task(task, database, enqueue=enqueue, render=render)
+
+
+def execute_claimed_task(task: dict, database, enqueue=None, render=None, prepare=None):
+    """
+    Renders a task this worker holds the lease on and records the outcome.
+    prepare(task, database) runs before the render slot is taken; it
+    defaults to prepare_task along with the default render.
+    """
+    from app.worker.lanes import LANE_BATCH, render_slot
+
+    if render is None:
+        render, prepare = render_task, prepare or prepare_task
+    task_id = str(task["_id"])
+
+    if int(task.get("attempts") or 0) > RENDER_MAX_ATTEMPTS:
+        # reclaimed after its worker died on every attempt (e.g. OOM-killed)
+        fail_task(database, task, task.get("error") or "Worker lost the task too many times")
+        print(f"[render] Task {task_id} moved to dead letter after {task['attempts'] - 1} lost attempts")
+        _finish_bulk_child(database, {**task, "status": STATUS_DEAD_LETTER}, enqueue)
+        return None
+
+    lane = task.get("lane") or LANE_BATCH
+    queued_since = task.get("next_attempt_at") or task.get("created_at")
+    if isinstance(queued_since, datetime):
+        wait = (task["started_at"] - queued_since).total_seconds()
+        QUEUE_WAIT_SECONDS.observe(max(0.0, wait), lane=lane, stage="broker")
+
+    try:
+        # the heartbeat starts first: preparing and waiting for a slot must
+        # not expire the lease
+        with LeaseHeartbeat(database, task):
+            if prepare is not None:
+                prepare(task, database)
+            with render_slot(lane, task_render_cost(database, task)):
+                output = render(task, database)
+    except Exception as e:
+        traceback.print_exc()
+        delay = fail_task(database, task, str(e))
+        if delay is not None and enqueue is not None:
+            print(f"[render] Task {task_id} failed (attempt {task.get('attempts')}); retrying in {delay:.0f}s")
+            enqueue(task_id, countdown=delay)
+        elif delay is None:
+            print(f"[render] Task {task_id} moved to dead letter: {e}")
+            _finish_bulk_child(database, {**task, "status": STATUS_DEAD_LETTER}, enqueue)
+        return None
+
+    if not complete_task(database, task, output):
+        print(f"[render] Task {task_id} finished after its lease was taken over; result discarded")
+        return None
+    _finish_bulk_child(database, {**task, "status": STATUS_COMPLETED}, enqueue)
+    return output
+
+
+def _finish_bulk_child(database, task: dict, enqueue):
+    if not task.get("bulk_task_id"):
+        return
+    from app.worker.bulk_jobs import record_child_result
+    try:
+        record_child_result(database, task, enqueue=enqueue)
+    except Exception as e:
+        # the child itself is done; resume_bulk_task recounts if this is lost
+        print(f"[render] Could not update bulk task {task['bulk_task_id']}: {e}")
@@ -1,40 +1,28 @@
+import os
 from celery import Celery
-from datetime import datetime
-from bson import ObjectId
-from app.services.video_renderer import render_video
-from app.db.connection import db
+from app.worker.lanes import LANE_BATCH
+from app.worker.render_jobs import run_render_job
 
 celery_app = Celery(
     "video_worker",
-    broker="redis://localhost:6379/0"
+    broker=os.getenv("REDIS_BROKER", "redis://localhost:6379/0")
 )
+# A message is only acknowledged once the render finished, so a worker crash
+# redelivers it; claim_task makes the redelivery idempotent. A redelivery
+# that arrives while the dead worker's lease is still running is skipped;
+# the API's lease reaper (app/worker/queue.py) re-queues the task once that
+# lease expires.
+celery_app.conf.task_acks_late = True
+celery_app.conf.worker_prefetch_multiplier = 1
+# Renders are routed to one queue per lane (see app/worker/lanes.py); run
+# `celery -A app.worker.video_worker worker -Q interactive,batch` or give
+# each lane its own workers
+celery_app.conf.task_default_queue = LANE_BATCH
 
 @celery_app.task
 def render_video_task(task_id: str):
-    try:
-        db.video_tasks.update_one(
-            {"_id": ObjectId(task_id)},
-            {"$set": {"status": "processing", "updated_at": datetime.utcnow()}}
-        )
+    run_render_job(task_id, enqueue=_enqueue_retry)
 
-        output = render_video(task_id)
 
-        db.video_tasks.update_one(
-            {"_id": ObjectId(task_id)},
-            {"$set": {
-                "status": "completed",
-                "progress": 100,
-                "output_video_url": output,
-                "updated_at": datetime.utcnow()
-            }}
-        )
-
-    except Exception as e:
-        db.video_tasks.update_one(
-            {"_id": ObjectId(task_id)},
-            {"$set": {
-                "status": "failed",
-                "error": str(e),
-                "updated_at": datetime.utcnow()
-            }}
-        )
+def _enqueue_retry(task_id: str, countdown: float = 0):
+    render_video_task.apply_async(args=[task_id], countdown=countdown)
@@ -0,0 +1,86 @@
+"""
+Measures API cold start: importing app.main with the TTS stack loaded
+lazily (now) against importing it eagerly, as every API process did when
+app.main pulled in torch, numpy and Kokoro through the voiceover route.
+
+    python bench_import_time.py [--runs 5] [--json]
+
+Each run is a fresh interpreter; reported are the median import seconds
+and the resident memory right after the import. The eager case imports
+app.services.kokoro_tts after app.main, which is what the old import chain
+did. Needs the API's dependencies (and torch/kokoro for the eager case).
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = """
+import sys, time, json
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import app.main
+for module in {extra!r}:
+    __import__(module)
+seconds = time.perf_counter() - started
+from app.utils.metrics import process_rss_bytes
+print(json.dumps({{
+    "seconds": seconds,
+    "rss_bytes": process_rss_bytes(),
+    "torch_loaded": "torch" in sys.modules,
+}}))
+"""
+
+CASES = {
+    "lazy (now)": [],
+    "eager (before)": ["app.services.kokoro_tts"],
+}
+
+
+def measure(extra: list[str], runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-c", CHILD.format(root=ROOT, extra=extra)],
+            cwd=ROOT, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            return {"error": (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+        samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    rss = [s["rss_bytes"] for s in samples if s["rss_bytes"] is not None]
+    return {
+        "median_seconds": round(statistics.median(s["seconds"] for s in samples), 3),
+        "min_seconds": round(min(s["seconds"] for s in samples), 3),
+        "rss_mb": round(statistics.median(rss) / 1024 / 1024, 1) if rss else None,
+        "torch_loaded": samples[-1]["torch_loaded"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = {name: measure(extra, args.runs) for name, extra in CASES.items()}
+    if args.json:
+        print(json.dumps({"runs": args.runs, "results": results}, indent=2))
+        return
+
+    header = f"{'import':<16}{'median':>9}{'min':>9}{'RSS':>10}  torch"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        if "error" in r:
+            print(f"{name:<16}  failed: {r['error']}")
+            continue
+        rss = f"{r['rss_mb']:.1f}MB" if r["rss_mb"] is not None else "n/a"
+        print(f"{name:<16}{r['median_seconds']:>8.3f}s{r['min_seconds']:>8.3f}s{rss:>10}  {r['torch_loaded']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Compares ffmpeg's default threading against cost-based core packing on a
+mixed batch campaign, run through the real render scheduler.
+
+    python bench_render_scheduling.py [--cores 16] [--jobs 200] [--overhead 0.05] [--json]
+    python bench_render_scheduling.py --measure [--cores 4] [--jobs 12] [--json]
+
+--measure runs real render_preview calls on lavfi-generated media (needs
+ffmpeg): the scheduler decides what starts when and each render gets the
+-threads its grant carries, so the timings are wall clock on this machine.
+
+Without it nothing renders and the numbers are modelled: each job's work
+(core-seconds) comes from its estimated cost, and on n threads it can keep
+at most Amdahl's-law speedup(n) cores busy. When the running jobs could
+keep more cores busy than there are, the cores stay fully used (one job's
+serial phases leave cores to the others) and are shared in proportion,
+less --overhead for context switches and cache thrash.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.render_cost import estimate_render_cost, threads_for_cost
+from app.worker.lanes import LANE_BATCH, Grant, LaneScheduler
+
+# Core-seconds per cost unit: a 60s 1080p template with four video layers
+# (~150k units) takes ~2 core-minutes
+SECONDS_PER_COST_UNIT = 0.0008
+# Process start, probing, muxing
+SERIAL_SECONDS = 0.5
+PARALLEL_FRACTION = 0.9
+
+# Media the measured templates point at, relative to the media root
+MEASURE_MEDIA = {
+    "clip.mp4": ["-f", "lavfi", "-i", "testsrc2=size=540x960:rate=30:duration=20",
+                 "-c:v", "libx264", "-pix_fmt", "yuv420p"],
+    "logo.png": ["-f", "lavfi", "-i", "testsrc2=size=200x200", "-frames:v", "1"],
+    "music.mp3": ["-f", "lavfi", "-i", "sine=frequency=220:duration=20"],
+}
+
+
+def _template(duration, videos=0, images=0, texts=0, audio=0, size=(1080, 1920)):
+    width, height = size
+    details = {
+        "video": {"src": "clip.mp4", "width": width, "height": height, "volume": 0},
+        "image": {"src": "logo.png", "width": 200, "height": 200},
+        "text": {"text": "Hi {{customer.name}}", "fontSize": 48, "left": 40, "top": 80, "color": "#ffffff"},
+        "audio": {"src": "music.mp3", "volume": 100},
+    }
+    items = {}
+    for kind, count in (("video", videos), ("image", images), ("text", texts), ("audio", audio)):
+        for i in range(count):
+            items[f"{kind}{i}"] = {
+                "type": kind,
+                "details": dict(details[kind]),
+                "display": {"from": 0, "to": duration * 1000},
+            }
+    return {
+        "duration": duration,
+        "template_json": {"design": {
+            "size": {"width": width, "height": height},
+            "fps": 30,
+            "trackItemIds": [tid for tid, item in items.items() if item["type"] != "text"],
+            "trackItemsMap": items,
+            "tracks": [{"type": "text", "items": [tid for tid, item in items.items() if item["type"] == "text"]}],
+        }},
+    }
+
+
+# (weight, template): mostly short image-based promos, some long video edits
+WORKLOAD = [
+    (50, _template(5, images=1, texts=2)),
+    (25, _template(15, images=2, texts=3, audio=1)),
+    (15, _template(30, videos=1, images=1, texts=3, audio=2)),
+    (10, _template(60, videos=4, images=1, texts=2, audio=2)),
+]
+# The same mix, shorter and smaller, for real renders
+MEASURE_WORKLOAD = [
+    (50, _template(2, images=1, texts=2, size=(540, 960))),
+    (25, _template(5, images=2, texts=3, audio=1, size=(540, 960))),
+    (15, _template(10, videos=1, images=1, texts=3, audio=2, size=(540, 960))),
+    (10, _template(20, videos=4, images=1, texts=2, audio=2, size=(540, 960))),
+]
+
+
+def make_jobs(count: int, seed: int, workload=WORKLOAD) -> list[dict]:
+    rng = random.Random(seed)
+    weights = [weight for weight, _ in workload]
+    return [rng.choices([template for _, template in workload], weights)[0] for _ in range(count)]
+
+
+def speedup(cores: float) -> float:
+    return 1 / ((1 - PARALLEL_FRACTION) + PARALLEL_FRACTION / max(cores, 1e-9))
+
+
+def _scheduler(cores: int, sjf: bool) -> LaneScheduler:
+    return LaneScheduler(
+        slots=cores,
+        reserved_interactive=0,
+        cores=cores,
+        # a day: no job starves within a benchmark (a real wait needs a finite timeout)
+        sjf_max_wait=86400 if sjf else 0,
+        # size threads for the benchmarked machine
+        threads_for=lambda cost: threads_for_cost(cost, min(8, cores)),
+    )
+
+
+def _summary(costs: list[float], finished: list[float], makespan: float) -> dict:
+    latencies = sorted(finished)
+    short = sorted(done for done, cost in zip(finished, costs) if cost <= min(costs) * 1.01)
+    return {
+        "makespan_s": round(makespan, 1),
+        "renders_per_min": round(len(finished) / makespan * 60, 2),
+        "mean_completion_s": round(sum(latencies) / len(latencies), 1),
+        "p95_completion_s": round(latencies[max(0, int(len(latencies) * 0.95) - 1)], 1),
+        "short_job_mean_completion_s": round(sum(short) / len(short), 1) if short else None,
+    }
+
+
+def simulate(costs: list[float], cores: int, use_cost: bool, sjf: bool, overhead: float) -> dict:
+    scheduler = _scheduler(cores, sjf)
+    # the whole campaign is queued at t=0 (a bulk task dispatching a batch)
+    grants = [Grant(LANE_BATCH, cost if use_cost else None) for cost in costs]
+    cost_of = dict(zip(grants, costs))
+    with scheduler._cond:
+        scheduler._waiting[LANE_BATCH].extend(grants)
+        scheduler._dispatch()
+
+    # core-seconds left per job, and how many cores it can keep busy
+    work = {}
+    busy = {}
+    now = 0.0
+    finished = {}
+    while len(finished) < len(grants):
+        running = list(scheduler._running[LANE_BATCH])
+        for grant in running:
+            if grant not in work:
+                # ffmpeg without -threads starts one thread per core
+                threads = grant.threads or cores
+                cost = cost_of[grant]
+                work[grant] = SERIAL_SECONDS + cost * SECONDS_PER_COST_UNIT
+                alone = SERIAL_SECONDS + cost * SECONDS_PER_COST_UNIT / speedup(threads)
+                busy[grant] = work[grant] / alone
+
+        demand = sum(busy[grant] for grant in running)
+        scale = 1.0 if demand <= cores else cores / demand * (1 - overhead)
+        step = min(work[grant] / (busy[grant] * scale) for grant in running)
+        now += step
+        for grant in running:
+            work[grant] -= step * busy[grant] * scale
+            if work[grant] <= 1e-9:
+                finished[grant] = now
+                scheduler.release(LANE_BATCH, grant)
+
+    return _summary(costs, [finished[grant] for grant in grants], now)
+
+
+def make_media(media_root: str):
+    for name, args in MEASURE_MEDIA.items():
+        subprocess.run(["ffmpeg", "-y", "-v", "error", *args, os.path.join(media_root, name)], check=True)
+
+
+def measure(templates: list[dict], cores: int, use_cost: bool, sjf: bool, out_dir: str) -> dict:
+    from app.services.video_renderer import render_preview
+
+    scheduler = _scheduler(cores, sjf)
+    costs = [estimate_render_cost(template)["cost"] for template in templates]
+    started = time.perf_counter()
+
+    def run(index):
+        cost = costs[index] if use_cost else None
+        with scheduler.slot(LANE_BATCH, cost):
+            render_preview(templates[index], {"customer": {"name": f"Customer {index}"}, "company": {}},
+                           os.path.join(out_dir, f"job_{index:03d}.mp4"))
+        return time.perf_counter() - started
+
+    # every job is queued at once, like a bulk task dispatching a batch
+    with ThreadPoolExecutor(max_workers=len(templates)) as pool:
+        finished = list(pool.map(run, range(len(templates))))
+    return _summary(costs, finished, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cores", type=int, help="cores to schedule onto (default: 16, or this machine's with --measure)")
+    parser.add_argument("--jobs", type=int, help="renders in the campaign (default: 200, or 12 with --measure)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--overhead", type=float, default=0.0,
+                        help="modelled share of oversubscribed cores lost to switching (0-1)")
+    parser.add_argument("--measure", action="store_true", help="time real renders instead of modelling them")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    policies = {
+        "default_threads_fifo": dict(use_cost=False, sjf=False),
+        "packed_fifo": dict(use_cost=True, sjf=False),
+        "packed_sjf": dict(use_cost=True, sjf=True),
+    }
+    if args.measure:
+        cores = args.cores or os.cpu_count() or 2
+        jobs = args.jobs or 12
+        templates = make_jobs(jobs, args.seed, MEASURE_WORKLOAD)
+        # before video_renderer reads its media root
+        media_root = tempfile.mkdtemp(prefix="render_bench_")
+        os.environ["MEDIA_ROOT"] = media_root
+        make_media(media_root)
+        results = {}
+        for name, policy in policies.items():
+            out_dir = tempfile.mkdtemp(prefix=f"{name}_", dir=media_root)
+            results[name] = measure(templates, cores, out_dir=out_dir, **policy)
+        mode = "measured"
+    else:
+        cores = args.cores or 16
+        jobs = args.jobs or 200
+        templates = make_jobs(jobs, args.seed)
+        costs = [estimate_render_cost(template)["cost"] for template in templates]
+        results = {
+            name: simulate(costs, cores, overhead=args.overhead, **policy)
+            for name, policy in policies.items()
+        }
+        mode = "modelled"
+
+    costs = [estimate_render_cost(template)["cost"] for template in templates]
+    if args.json:
+        print(json.dumps({
+            "mode": mode,
+            "cores": cores,
+            "jobs": jobs,
+            "overhead": args.overhead if mode == "modelled" else None,
+            "results": results,
+        }, indent=2))
+        return
+
+    print(f"{jobs} renders on {cores} cores, {mode}"
+          f"{f' (overhead {args.overhead:.0%})' if mode == 'modelled' else ''} "
+          f"(threads per job: {sorted({threads_for_cost(c, min(8, cores)) for c in costs})})")
+    header = f"{'policy':<22}{'makespan':>10}{'renders/min':>13}{'mean done':>11}{'p95 done':>10}{'short mean':>12}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<22}{r['makespan_s']:>9.1f}s{r['renders_per_min']:>13.2f}"
+              f"{r['mean_completion_s']:>10.1f}s{r['p95_completion_s']:>9.1f}s"
+              f"{r['short_job_mean_completion_s']:>11.1f}s")
+    if mode == "modelled":
+        print("\nModelled from estimated costs, not timed: run with --measure for real renders.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+TTS throughput and latency suite: Kokoro synthesis, WAV and MP3 encoding,
+and the end-to-end library path, by voice, speed and text length. Results
+are written as JSON so runs can be compared over time.
+
+    python bench_tts.py [--voices af_heart,bf_emma] [--speeds 0.8,1.0,1.3]
+                        [--lengths short,medium,long] [--runs 3]
+                        [--e2e] [--out results.json] [--compare old.json]
+
+Per case (median of --runs):
+  rtf                 synthesis seconds / audio seconds (< 1: faster than real time)
+  chars_per_s         characters synthesized per second
+  first_chunk_s       time to the first chunk of synthesize_stream
+  wav_s, mp3_s        encode_wav_bytes and try_convert_wav_to_mp3
+  e2e_s               synthesize_and_store_media with a cold cache (--e2e)
+  peak_rss_mb         peak RSS of this process so far (it only grows)
+
+The chunk memo is off, so repeated runs do real inference. --e2e writes
+into a temporary media root and needs MongoDB for the TTS cache index.
+--compare prints the rtf change per case against an earlier JSON result.
+Needs kokoro and torch installed.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_RATE = 24000
+PASSAGE = (
+    "Hello Asha, and welcome to Acme's anniversary sale. "
+    "Everything in the store is half price until Sunday, and members get free delivery on every order. "
+    "Our new autumn collection arrived this morning, with jackets, boots and knitwear in twelve colours. "
+    "If you visit the Pune store, ask for a fitting; our team will set aside your sizes. "
+    "Gift cards bought this week carry an extra ten percent of credit. "
+    "Thank you for being with us for three years; we look forward to seeing you soon. "
+)
+# approximate characters; texts are cut at a sentence end
+LENGTHS = {"short": 60, "medium": 300, "long": 1500}
+
+
+def make_text(chars: int) -> str:
+    text = ""
+    while len(text) < chars:
+        text += PASSAGE
+    cut = text.rfind(". ", 0, chars + 1)
+    return text[:cut + 1] if cut > 0 else text[:chars]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def first_chunk_seconds(kokoro_tts, text: str, voice: str, speed: float) -> float:
+    started = time.perf_counter()
+    stream = kokoro_tts.synthesize_stream(text, voice, speed)
+    next(stream)
+    elapsed = time.perf_counter() - started
+    stream.close()
+    return elapsed
+
+
+def run_case(kokoro_tts, text: str, voice: str, speed: float, runs: int, e2e) -> dict:
+    samples = []
+    for _ in range(runs):
+        audio, synth_s = timed(kokoro_tts.synthesize_audio_numpy, text, voice, speed)
+        wav, wav_s = timed(kokoro_tts.encode_wav_bytes, audio)
+        _, mp3_s = timed(kokoro_tts.try_convert_wav_to_mp3, wav)
+        sample = {
+            "synth_s": synth_s,
+            "audio_s": len(audio) / SAMPLE_RATE,
+            "first_chunk_s": first_chunk_seconds(kokoro_tts, text, voice, speed),
+            "wav_s": wav_s,
+            "mp3_s": mp3_s,
+        }
+        if e2e is not None:
+            sample["e2e_s"] = e2e(text, voice, speed)
+        samples.append(sample)
+
+    def median(field):
+        return statistics.median(s[field] for s in samples)
+
+    result = {
+        "voice": voice,
+        "speed": speed,
+        "chars": len(text),
+        "audio_s": round(median("audio_s"), 3),
+        "synth_s": round(median("synth_s"), 4),
+        "rtf": round(median("synth_s") / median("audio_s"), 4),
+        "chars_per_s": round(len(text) / median("synth_s"), 1),
+        "first_chunk_s": round(median("first_chunk_s"), 4),
+        "wav_s": round(median("wav_s"), 4),
+        "mp3_s": round(median("mp3_s"), 4),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if e2e is not None:
+        result["e2e_s"] = round(median("e2e_s"), 4)
+    return result
+
+
+def make_e2e():
+    """synthesize_and_store_media with every lookup a miss, in this process."""
+    from app.services import tts
+    from app.services.tts_executor import inline_tts
+
+    tts.safe_lookup_tts = lambda key: None
+
+    async def store(text, voice, speed):
+        with inline_tts():
+            return await tts.synthesize_and_store_media(
+                company_id="bench", voisetext=text, voice=voice, speed=speed,
+            )
+
+    def e2e(text, voice, speed):
+        started = time.perf_counter()
+        asyncio.run(store(text, voice, speed))
+        return time.perf_counter() - started
+
+    return e2e
+
+
+def environment(kokoro_tts) -> dict:
+    import torch
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "commit": commit,
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "device": kokoro_tts.get_model()[1],
+        "torch_threads": torch.get_num_threads(),
+        "profile": {name: os.getenv(name) for name in (
+            "TTS_INTRA_OP_THREADS", "TTS_INTER_OP_THREADS", "TTS_INFERENCE_MODE", "TTS_QUANTIZE", "TTS_COMPILE",
+        ) if os.getenv(name)},
+    }
+
+
+def compare(results: list[dict], path: str):
+    with open(path) as f:
+        old = {(r["voice"], r["speed"], r["length"]): r for r in json.load(f)["results"]}
+    print(f"\nrtf against {path}")
+    for r in results:
+        before = old.get((r["voice"], r["speed"], r["length"]))
+        if before is None:
+            continue
+        change = (r["rtf"] - before["rtf"]) / before["rtf"] * 100
+        print(f"  {r['voice']:<12}{r['speed']:>5}  {r['length']:<8}{before['rtf']:>8.3f} -> {r['rtf']:<8.3f}{change:+.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--voices", default="af_heart,bf_emma")
+    parser.add_argument("--speeds", default="0.8,1.0,1.3")
+    parser.add_argument("--lengths", default="short,medium,long")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--e2e", action="store_true", help="also time synthesize_and_store_media")
+    parser.add_argument("--out", help="JSON path (default: tts_bench_<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier JSON result to compare rtf against")
+    args = parser.parse_args()
+
+    media_root = None
+    if args.e2e:
+        # before app modules read their media roots
+        media_root = tempfile.mkdtemp(prefix="tts_bench_")
+        os.environ["MEDIA_ROOT"] = media_root
+        os.environ["LOCAL_MEDIA_ROOT"] = media_root
+
+    from app.services import kokoro_tts
+
+    kokoro_tts.TTS_CHUNK_MEMO_BYTES = 0
+    voices = [v.strip() for v in args.voices.split(",") if v.strip()]
+    speeds = [float(s) for s in args.speeds.split(",")]
+    lengths = [name.strip() for name in args.lengths.split(",") if name.strip()]
+    e2e = make_e2e() if args.e2e else None
+
+    # model, pipelines and voice packs load outside the timings
+    kokoro_tts.warmup_voices(",".join(voices))
+    for voice in voices:
+        kokoro_tts.synthesize_audio_numpy("Warm up.", voice, 1.0)
+
+    results = []
+    header = f"{'voice':<12}{'speed':>6}  {'length':<8}{'chars':>6}{'rtf':>8}{'chars/s':>9}{'first':>8}{'mp3':>8}{'rss':>9}"
+    print(header)
+    print("-" * len(header))
+    for voice in voices:
+        for speed in speeds:
+            for length in lengths:
+                text = make_text(LENGTHS[length])
+                result = {"length": length, **run_case(kokoro_tts, text, voice, speed, args.runs, e2e)}
+                results.append(result)
+                print(f"{voice:<12}{speed:>6}  {length:<8}{result['chars']:>6}{result['rtf']:>8.3f}"
+                      f"{result['chars_per_s']:>9.1f}{result['first_chunk_s']:>7.3f}s{result['mp3_s']:>7.3f}s"
+                      f"{result['peak_rss_mb']:>7.1f}MB")
+
+    out = args.out or f"tts_bench_{datetime.utcnow():%Y%m%d-%H%M%S}.json"
+    with open(out, "w") as f:
+        json.dump({"environment": environment(kokoro_tts), "runs": args.runs, "results": results}, f, indent=2)
+    print(f"\nwrote {out}")
+    if media_root:
+        print(f"e2e files in {media_root}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
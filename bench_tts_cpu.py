@@ -0,0 +1,143 @@
+"""
+Compares Kokoro CPU inference profiles by real-time factor, with a quality
+sanity check against the float32 baseline.
+
+    python bench_tts_cpu.py [--threads 4] [--runs 3] [--json]
+
+RTF is synthesis seconds over audio seconds (below 1 is faster than real
+time). Each profile runs in its own process, since thread counts and
+quantization are process-wide. The first synthesis of a process loads the
+model (and compiles it) and is not timed. Quality: audio length within
+10% of the baseline and a cosine similarity of the average magnitude
+spectrum of at least 0.9; quantization moves predicted durations, so
+sample-by-sample comparison would fail even when the speech is fine.
+Needs kokoro and torch installed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_RATE = 24000
+TEXT = (
+    "Hello Asha, and welcome to Acme's anniversary sale. "
+    "Everything in the store is half price until Sunday, and members get free delivery. "
+    "Thanks for being with us for three years."
+)
+
+# name -> environment of the profile's process
+PROFILES = {
+    "baseline_no_grad": {"TTS_INFERENCE_MODE": "0"},
+    "inference_mode": {},
+    "int8_linear": {"TTS_QUANTIZE": "int8"},
+    "torch_compile": {"TTS_COMPILE": "compile"},
+    "torchscript_decoder": {"TTS_COMPILE": "script"},
+    "int8_compile": {"TTS_QUANTIZE": "int8", "TTS_COMPILE": "compile"},
+}
+MIN_SPECTRAL_SIMILARITY = 0.9
+MAX_LENGTH_DRIFT = 0.1
+
+
+def run_child(args):
+    # the profile comes from the environment, read when kokoro_tts is imported
+    from app.services import kokoro_tts
+
+    kokoro_tts.TTS_CHUNK_MEMO_BYTES = 0
+    kokoro_tts.synthesize_audio_numpy("Warm up.", args.voice, 1.0)
+    timings = []
+    audio = None
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        audio = kokoro_tts.synthesize_audio_numpy(TEXT, args.voice, 1.0)
+        timings.append(time.perf_counter() - started)
+    np.save(args.out, audio)
+    import torch
+    print(json.dumps({
+        "seconds": min(timings),
+        "audio_seconds": len(audio) / SAMPLE_RATE,
+        "threads": torch.get_num_threads(),
+    }))
+
+
+def spectrum(audio: np.ndarray, frame: int = 1024) -> np.ndarray:
+    frames = len(audio) // frame
+    if frames == 0:
+        return np.zeros(frame // 2 + 1)
+    windows = audio[:frames * frame].reshape(frames, frame) * np.hanning(frame)
+    return np.abs(np.fft.rfft(windows, axis=1)).mean(axis=0)
+
+
+def quality(audio: np.ndarray, reference: np.ndarray) -> dict:
+    a, b = spectrum(audio), spectrum(reference)
+    similarity = float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b) or 1.0))
+    drift = abs(len(audio) - len(reference)) / len(reference)
+    ok = bool(np.isfinite(audio).all() and similarity >= MIN_SPECTRAL_SIMILARITY and drift <= MAX_LENGTH_DRIFT)
+    return {"spectral_similarity": round(similarity, 4), "length_drift": round(drift, 4), "ok": ok}
+
+
+def run_profile(name: str, env: dict, args, workdir: str) -> dict:
+    out = os.path.join(workdir, f"{name}.npy")
+    child_env = {**os.environ, **env}
+    if args.threads:
+        child_env["TTS_INTRA_OP_THREADS"] = str(args.threads)
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", "--out", out,
+         "--runs", str(args.runs), "--voice", args.voice],
+        env=child_env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return {"error": (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["rtf"] = round(result["seconds"] / result["audio_seconds"], 4)
+    result["audio"] = out
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads (0: torch default)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--voice", default="af_heart")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = {name: run_profile(name, env, args, workdir) for name, env in PROFILES.items()}
+        baseline = results["baseline_no_grad"]
+        reference = np.load(baseline["audio"]) if "audio" in baseline else None
+        for name, result in results.items():
+            path = result.pop("audio", None)
+            if path and reference is not None:
+                result.update(quality(np.load(path), reference))
+                result["speedup"] = round(baseline["rtf"] / result["rtf"], 2)
+
+    if args.json:
+        print(json.dumps({"text_chars": len(TEXT), "results": results}, indent=2))
+        return
+
+    header = f"{'profile':<22}{'threads':>8}{'RTF':>9}{'speedup':>9}{'similarity':>12}{'drift':>8}  quality"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        if "error" in r:
+            print(f"{name:<22}  failed: {r['error']}")
+            continue
+        print(f"{name:<22}{r['threads']:>8}{r['rtf']:>9.3f}{r.get('speedup', 0):>8.2f}x"
+              f"{r.get('spectral_similarity', 0):>12.4f}{r.get('length_drift', 0):>8.3f}"
+              f"  {'ok' if r.get('ok') else 'CHECK'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Measures Kokoro throughput on a personalized campaign: the per-text path
+against synthesize_deduplicated, in characters per second on this machine.
+
+    python bench_tts_dedupe.py [--customers 50] [--voice af_heart] [--json]
+
+Needs kokoro and torch installed (the model is downloaded on first use).
+The TTS cache is not involved: both paths synthesize every text. The
+per-text baseline runs with the chunk memo disabled. Chunks run through the
+model one at a time on both paths; the deduplicated path saves only the
+chunks that repeat across texts, so the speedup depends on TTS_SPLIT_PATTERN
+(Kokoro's default splits at new lines only).
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import kokoro_tts
+
+NAMES = ["Anna", "Ben", "Chloe", "Dev", "Elif", "Farid", "Grace", "Hiro", "Ines", "Jonas"]
+CITIES = ["Austin", "Berlin", "Chennai", "Dublin", "Lagos", "Lima", "Oslo", "Seoul"]
+SCRIPT = (
+    "Hi {name}! Welcome to Acme. "
+    "We picked three offers for our customers in {city}. "
+    "Your membership renews next month, and nothing changes for you. "
+    "Thanks for being with us, {name}."
+)
+
+
+def make_texts(count: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    return [SCRIPT.format(name=rng.choice(NAMES), city=rng.choice(CITIES)) for _ in range(count)]
+
+
+def per_text(texts: list[str], voice: str, speed: float) -> float:
+    kokoro_tts.TTS_CHUNK_MEMO_BYTES = 0
+    kokoro_tts._chunk_memo.clear()
+    started = time.perf_counter()
+    for text in texts:
+        kokoro_tts.synthesize_audio_numpy(text, voice, speed)
+    return time.perf_counter() - started
+
+
+def deduplicated(texts: list[str], voice: str, speed: float, memo_bytes: int) -> float:
+    kokoro_tts.TTS_CHUNK_MEMO_BYTES = memo_bytes
+    kokoro_tts._chunk_memo.clear()
+    started = time.perf_counter()
+    kokoro_tts.synthesize_deduplicated([(text, voice, speed) for text in texts])
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--customers", type=int, default=50)
+    parser.add_argument("--voice", default="af_heart")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    texts = make_texts(args.customers, args.seed)
+    chars = sum(len(text) for text in texts)
+    memo_bytes = kokoro_tts.TTS_CHUNK_MEMO_BYTES
+
+    # load the model, pipeline and voice pack outside the timings
+    kokoro_tts.synthesize_audio_numpy("Warm up.", args.voice, args.speed)
+
+    timings = {
+        "per_text": per_text(texts, args.voice, args.speed),
+        "deduplicated": deduplicated(texts, args.voice, args.speed, memo_bytes),
+    }
+    results = {
+        name: {"seconds": round(seconds, 2), "chars_per_s": round(chars / seconds, 1)}
+        for name, seconds in timings.items()
+    }
+    speedup = round(timings["per_text"] / timings["deduplicated"], 2)
+    if args.json:
+        print(json.dumps({
+            "customers": args.customers,
+            "chars": chars,
+            "device": kokoro_tts.get_model()[1],
+            "results": results,
+            "speedup": speedup,
+        }, indent=2))
+        return
+
+    print(f"{args.customers} voiceovers, {chars} chars, voice {args.voice} on {kokoro_tts.get_model()[1]}")
+    header = f"{'path':<14}{'seconds':>10}{'chars/s':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<14}{r['seconds']:>10.2f}{r['chars_per_s']:>10.1f}")
+    print(f"speedup x{speedup}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import os
+import sys
+import types
+from datetime import datetime, timedelta
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+mongomock = pytest.importorskip("mongomock")
+
+from bson import ObjectId
+
+from app.worker import bulk_jobs, render_jobs
+from app.worker.queue import InMemoryBroker
+
+
+@pytest.fixture
+def database():
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture
+def broker():
+    return InMemoryBroker(clock=lambda: 0.0)
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(bulk_jobs, "BULK_BATCH_SIZE", 3)
+
+
+def _handler(database, broker, render):
+    return lambda task_id: render_jobs.run_render_job(
+        task_id, database=database, enqueue=broker.enqueue, render=render
+    )
+
+
+def _start(database, broker, n=10):
+    customer_ids = [f"cust{i}" for i in range(n)]
+    bulk_task_id = bulk_jobs.create_bulk_task(database, "co1", "tpl1", customer_ids)
+    bulk_jobs.dispatch_next_batch(database, bulk_task_id, broker.enqueue)
+    return bulk_task_id
+
+
+def test_campaign_fans_out_in_batches_and_completes(database, broker):
+    bulk_task_id = _start(database, broker)
+    assert broker.depth() == 3
+    assert database.video_tasks.count_documents({}) == 3
+
+    rendered = []
+    broker.run_pending(_handler(database, broker, lambda task, db: rendered.append(task["customer_id"]) or "out.mp4"))
+
+    bulk = database.bulk_tasks.find_one()
+    assert bulk["status"] == bulk_jobs.BULK_COMPLETED
+    assert bulk["completed_count"] == 10
+    assert sorted(rendered) == sorted(f"cust{i}" for i in range(10))
+    assert database.video_tasks.count_documents({"bulk_task_id": bulk_task_id}) == 10
+
+
+def test_dead_lettered_children_count_as_failed(database, broker, monkeypatch):
+    monkeypatch.setattr(render_jobs, "RENDER_MAX_ATTEMPTS", 1)
+
+    def render(task, db):
+        if task["customer_id"] == "cust1":
+            raise RuntimeError("bad logo")
+        return "out.mp4"
+
+    _start(database, broker, n=4)
+    broker.run_pending(_handler(database, broker, render))
+
+    bulk = database.bulk_tasks.find_one()
+    assert bulk["completed_count"] == 3
+    assert bulk["failed_count"] == 1
+    assert bulk["status"] == bulk_jobs.BULK_COMPLETED
+
+
+def test_resume_after_crash_skips_finished_customers(database, broker):
+    bulk_task_id = _start(database, broker)
+    handler = _handler(database, broker, lambda task, db: "out.mp4")
+
+    # finish the first batch, then "crash": the broker loses its messages
+    for _ in range(3):
+        handler(broker.pop_ready())
+    lost = InMemoryBroker(clock=lambda: 0.0)
+
+    rendered = []
+    result = bulk_jobs.resume_bulk_task(database, bulk_task_id, lost.enqueue)
+    assert result["requeued"] == 3
+    lost.run_pending(_handler(database, lost, lambda task, db: rendered.append(task["customer_id"]) or "out.mp4"))
+
+    bulk = database.bulk_tasks.find_one()
+    assert bulk["completed_count"] == 10
+    assert bulk["status"] == bulk_jobs.BULK_COMPLETED
+    assert len(rendered) == 7
+    assert database.video_tasks.count_documents({"attempts": {"$gt": 1}}) == 0
+
+
+def test_repeated_result_is_counted_once(database, broker):
+    _start(database, broker, n=5)
+    handler = _handler(database, broker, lambda task, db: "out.mp4")
+    handler(broker.pop_ready())
+
+    child = database.video_tasks.find_one({"status": "completed"})
+    bulk_jobs.record_child_result(database, child)
+    assert database.bulk_tasks.find_one()["completed_count"] == 1
+
+
+def test_progress_reports_throughput_and_eta(database):
+    now = datetime.utcnow()
+    bulk_task_id = bulk_jobs.create_bulk_task(database, "co1", "tpl1", [f"c{i}" for i in range(30)])
+    database.bulk_tasks.update_one({}, {"$set": {"started_at": now - timedelta(minutes=5), "completed_count": 10}})
+    database.video_tasks.insert_many([
+        {"bulk_task_id": bulk_task_id, "status": "completed", "completed_at": now - timedelta(minutes=1)}
+        for _ in range(10)
+    ])
+
+    progress = bulk_jobs.bulk_task_progress(database, database.bulk_tasks.find_one(), now=now)
+    assert progress["remaining"] == 20
+    assert progress["renders_per_minute"] == pytest.approx(2.0)
+    assert progress["eta_seconds"] == 600
+
+
+def _voiceover_template(compose):
+    return {"template_json": {"design": {"trackItemsMap": {"vo": {
+        "type": "audio",
+        "voice": "af_heart",
+        "metadata": {"isCustomerField": True, "fieldPath": "voiceover", "dataType": "audio",
+                     "composeSegments": compose},
+        "details": {"voisetext": "Hi {{full_name}}, welcome to our store. Offers end on Sunday."},
+    }}}}}
+
+
+def test_prewarm_synthesizes_only_segments_shared_by_customers(database, monkeypatch):
+    synthesized = []
+    monkeypatch.setitem(sys.modules, "app.services.kokoro_tts", types.SimpleNamespace(
+        synthesize_deduplicated_cached=lambda items: synthesized.extend(items),
+    ))
+    customer_ids = [str(database.customers.insert_one({"full_name": name}).inserted_id)
+                    for name in ("Asha", "Ravi", "Mei")]
+    bulk_task_id = bulk_jobs.create_bulk_task(database, "co1", "tpl1", customer_ids)
+    task = {"bulk_task_id": bulk_task_id, "customer_id": customer_ids[0]}
+    customer = {"full_name": "Asha"}
+
+    # uncomposed: every customer's text is their own, nothing to prewarm
+    assert bulk_jobs.prewarm_bulk_voiceovers(database, task, _voiceover_template(False), customer, {}) == 0
+    assert synthesized == []
+
+    assert bulk_jobs.prewarm_bulk_voiceovers(database, task, _voiceover_template(True), customer, {}) == 3
+    assert {text for text, _, _ in synthesized} == {"welcome to our store. Offers end on Sunday."}
+
+
+def test_prepare_runs_before_the_render_slot(database, broker, monkeypatch):
+    from app.worker import lanes
+
+    events = []
+    monkeypatch.setattr(render_jobs, "prepare_task", lambda task, db: events.append("prepare"))
+    monkeypatch.setattr(render_jobs, "render_task", lambda task, db: events.append("render") or "out.mp4")
+    slot = lanes.render_slot
+
+    def render_slot(lane, cost=None):
+        events.append("slot")
+        return slot(lane, cost)
+
+    monkeypatch.setattr(lanes, "render_slot", render_slot)
+    _start(database, broker, n=1)
+    broker.run_pending(lambda task_id: render_jobs.run_render_job(
+        task_id, database=database, enqueue=broker.enqueue,
+    ))
+    assert events == ["prepare", "slot", "render"]
@@ -0,0 +1,138 @@
+import os
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+mongomock = pytest.importorskip("mongomock")
+
+from app.worker import render_jobs
+from app.worker.lease_worker import LeaseWorker
+
+
+@pytest.fixture
+def database():
+    return mongomock.MongoClient().db
+
+
+def _insert_tasks(database, n):
+    now = datetime.utcnow()
+    database.video_tasks.insert_many([
+        {"status": "pending", "attempts": 0, "template_id": "t", "customer_id": f"c{i}",
+         "created_at": now + timedelta(milliseconds=i)}
+        for i in range(n)
+    ])
+
+
+def test_workers_render_each_task_exactly_once(database):
+    _insert_tasks(database, 40)
+    rendered = Counter()
+    lock = threading.Lock()
+
+    def render(task, db):
+        with lock:
+            rendered[task["customer_id"]] += 1
+        return f"{task['_id']}.mp4"
+
+    workers = [LeaseWorker(database, render=render, threads=2, poll_interval=0.01) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    try:
+        deadline = datetime.utcnow() + timedelta(seconds=10)
+        while database.video_tasks.count_documents({"status": "completed"}) < 40:
+            assert datetime.utcnow() < deadline, "workers did not drain the queue"
+            threading.Event().wait(0.02)
+    finally:
+        for worker in workers:
+            worker.stop(timeout=5)
+
+    assert len(rendered) == 40
+    assert set(rendered.values()) == {1}
+    done = database.video_tasks.find_one()
+    assert "lease_owner" not in done and "lease_expires_at" not in done
+    index_names = {ix["name"] for ix in database.video_tasks.list_indexes()}
+    assert {"claim_ready", "claim_expired_lease"} <= index_names
+
+
+def test_expired_lease_is_reclaimed(database):
+    _insert_tasks(database, 1)
+    task = render_jobs.claim_next_task(database, owner="dead-worker")
+    assert task["lease_owner"] == "dead-worker"
+
+    # live lease: nobody else can take it
+    assert render_jobs.claim_next_task(database, owner="w2") is None
+
+    database.video_tasks.update_one(
+        {"_id": task["_id"]}, {"$set": {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+    )
+    reclaimed = render_jobs.claim_next_task(database, owner="w2")
+    assert reclaimed["_id"] == task["_id"]
+    assert reclaimed["lease_owner"] == "w2"
+    assert reclaimed["attempts"] == 2
+
+    # the original worker comes back: its heartbeat and result are rejected
+    assert not render_jobs.heartbeat(database, task)
+    assert not render_jobs.complete_task(database, task, "late.mp4")
+    assert render_jobs.complete_task(database, reclaimed, "out.mp4")
+    assert database.video_tasks.find_one()["output_video_url"] == "out.mp4"
+
+
+def test_heartbeat_extends_lease(database, monkeypatch):
+    monkeypatch.setattr(render_jobs, "RENDER_LEASE_SECONDS", 30)
+    _insert_tasks(database, 1)
+    task = render_jobs.claim_next_task(database, owner="w1")
+    first = task["lease_expires_at"]
+
+    threading.Event().wait(0.01)
+    assert render_jobs.heartbeat(database, task)
+    assert database.video_tasks.find_one()["lease_expires_at"] > first
+
+
+def test_retry_backoff_is_respected_by_polling(database):
+    _insert_tasks(database, 1)
+    database.video_tasks.update_one({}, {"$set": {
+        "status": "retrying", "attempts": 1, "next_attempt_at": datetime.utcnow() + timedelta(minutes=5),
+    }})
+    assert render_jobs.claim_next_task(database, owner="w1") is None
+
+    database.video_tasks.update_one({}, {"$set": {"next_attempt_at": datetime.utcnow() - timedelta(seconds=1)}})
+    assert render_jobs.claim_next_task(database, owner="w1") is not None
+
+
+def test_task_that_keeps_killing_workers_is_dead_lettered(database, monkeypatch):
+    monkeypatch.setattr(render_jobs, "RENDER_MAX_ATTEMPTS", 2)
+    _insert_tasks(database, 1)
+    database.video_tasks.update_one({}, {"$set": {
+        "status": "processing", "attempts": 2, "lease_owner": "oom-killed",
+        "lease_expires_at": datetime.utcnow() - timedelta(seconds=1),
+    }})
+
+    calls = []
+    assert LeaseWorker(database, render=lambda task, db: calls.append(1)).run_once("w1")
+    assert calls == []
+    assert database.video_tasks.find_one()["status"] == "dead_letter"
+
+
+def test_expired_leases_are_requeued_once(database):
+    _insert_tasks(database, 2)
+    dead = render_jobs.claim_next_task(database, owner="dead-worker")
+    live = render_jobs.claim_next_task(database, owner="live-worker")
+    database.video_tasks.update_one(
+        {"_id": dead["_id"]}, {"$set": {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+    )
+
+    enqueued = []
+    assert render_jobs.requeue_expired_leases(database, enqueued.append) == 1
+    assert enqueued == [str(dead["_id"])]
+    task = database.video_tasks.find_one({"_id": dead["_id"]})
+    assert task["status"] == "retrying" and "lease_owner" not in task
+    assert database.video_tasks.find_one({"_id": live["_id"]})["lease_owner"] == "live-worker"
+
+    # a second reaper (another API process) finds nothing left to do
+    assert render_jobs.requeue_expired_leases(database, enqueued.append) == 0
+    assert render_jobs.claim_task(database, str(dead["_id"]), owner="w2")["attempts"] == 2
@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils import metrics
+from app.utils.metrics import Registry
+
+
+def test_histogram_exposition_is_cumulative():
+    registry = Registry()
+    hist = registry.histogram("render_seconds", "Render time.", ("profile",), buckets=(1, 5))
+    hist.observe(0.5, profile="smart")
+    hist.observe(3, profile="smart")
+    hist.observe(30, profile="smart")
+
+    text = registry.render()
+    assert "# TYPE render_seconds histogram" in text
+    assert 'render_seconds_bucket{profile="smart",le="1"} 1' in text
+    assert 'render_seconds_bucket{profile="smart",le="5"} 2' in text
+    assert 'render_seconds_bucket{profile="smart",le="+Inf"} 3' in text
+    assert 'render_seconds_count{profile="smart"} 3' in text
+    assert 'render_seconds_sum{profile="smart"} 33.5' in text
+
+
+def test_labels_must_match():
+    registry = Registry()
+    counter = registry.counter("exits_total", "Exits.", ("code",))
+    with pytest.raises(ValueError):
+        counter.inc(stage="render")
+
+
+def test_cache_hit_ratio_gauge():
+    for hit in (True, True, True, False):
+        metrics.record_cache("test_cache", hit)
+    assert 'autovid_cache_hit_ratio{cache="test_cache"} 0.75' in metrics.render_latest()
+
+
+def test_mongo_listener_records_collection():
+    listener = metrics.MongoCommandMetrics()
+    base = dict(connection_id=("localhost", 27017), request_id=7, command_name="find", database_name="autovid")
+    listener.started(SimpleNamespace(command={"find": "video_tasks", "filter": {}}, **base))
+    listener.succeeded(SimpleNamespace(duration_micros=2500, **base))
+
+    text = metrics.render_latest()
+    assert 'autovid_mongo_command_seconds_count{collection="video_tasks",command="find"} 1' in text
+
+
+def test_run_ffmpeg_counts_exit_codes(monkeypatch):
+    from app.services.render_helper import run_ffmpeg
+
+    monkeypatch.setattr(subprocess, "run", lambda cmd, **kw: subprocess.CompletedProcess(cmd, 1))
+    with pytest.raises(subprocess.CalledProcessError):
+        run_ffmpeg(["ffmpeg"], stage="unit")
+    run_ffmpeg(["ffmpeg"], stage="unit", check=False)
+    assert metrics.FFMPEG_EXITS.get(stage="unit", code=1) == 2
+
+
+def test_drained_child_metrics_merge_into_parent():
+    child, parent = Registry(), Registry()
+    for registry in (child, parent):
+        registry.counter("exits_total", "Exits.", ("code",))
+        registry.histogram("render_seconds", "Render time.", ("profile",), buckets=(1, 5))
+
+    child._metrics["exits_total"].inc(code=0)
+    child._metrics["render_seconds"].observe(2, profile="full")
+    parent._metrics["render_seconds"].observe(0.5, profile="full")
+
+    parent.merge(child.drain())
+    assert 'exits_total{code="0"} 1' in parent.render()
+    assert 'render_seconds_bucket{profile="full",le="5"} 2' in parent.render()
+    assert "render_seconds_count" not in child.render()
@@ -0,0 +1,121 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+mongomock = pytest.importorskip("mongomock")
+
+from app.services import output_store
+from app.services.output_store import (
+    KIND_CACHE,
+    KIND_PREVIEW,
+    KIND_TTS,
+    evict_outputs,
+    output_usage,
+    record_output,
+)
+
+
+@pytest.fixture
+def database():
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture
+def media(tmp_path, monkeypatch):
+    monkeypatch.setattr(output_store, "MEDIA_ROOT", str(tmp_path))
+    monkeypatch.setattr(output_store, "OUTPUT_EVICT_GRACE_SECONDS", 0)
+    return tmp_path
+
+
+def _file(media, name, size=100):
+    path = media / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def _age(database, media, name, days):
+    key = output_store.media_key(str(media / name))
+    database.generated_outputs.update_one(
+        {"_id": key}, {"$set": {"last_access_at": datetime.utcnow() - timedelta(days=days)}}
+    )
+
+
+def test_expired_outputs_are_deleted_by_kind_ttl(database, media, monkeypatch):
+    monkeypatch.setattr(output_store, "OUTPUT_TTL_DAYS", {KIND_PREVIEW: 7, KIND_CACHE: 30})
+    old_preview = _file(media, "a_preview.mp4")
+    old_cache = _file(media, "mezzanine_cache/mezz_1.mp4")
+    record_output(old_preview, KIND_PREVIEW, "c1", database=database)
+    record_output(old_cache, KIND_CACHE, database=database)
+    _age(database, media, "a_preview.mp4", 8)
+    _age(database, media, "mezzanine_cache/mezz_1.mp4", 8)
+
+    stats = evict_outputs(database)
+
+    assert stats["expired"] == 1
+    assert not os.path.exists(old_preview)
+    assert os.path.exists(old_cache)
+    assert database.generated_outputs.count_documents({}) == 1
+
+
+def test_company_quota_then_budget_evict_least_recently_used(database, media, monkeypatch):
+    monkeypatch.setattr(output_store, "OUTPUT_TTL_DAYS", {})
+    monkeypatch.setattr(output_store, "OUTPUT_COMPANY_QUOTA_BYTES", 250)
+    monkeypatch.setattr(output_store, "OUTPUT_DISK_BUDGET_BYTES", 350)
+    for i, days in enumerate((3, 1, 2)):
+        record_output(_file(media, f"c1_{i}.mp4"), KIND_PREVIEW, "c1", database=database)
+        _age(database, media, f"c1_{i}.mp4", days)
+    for i, days in enumerate((5, 4)):
+        record_output(_file(media, f"c2_{i}.mp4"), KIND_PREVIEW, "c2", database=database)
+        _age(database, media, f"c2_{i}.mp4", days)
+
+    stats = evict_outputs(database)
+
+    # c1 is 300 bytes over a 250 quota: its oldest file goes; then 400 bytes
+    # over a 350 budget: the oldest file overall goes
+    assert stats["over_quota"] == 1 and stats["over_budget"] == 1
+    assert sorted(os.listdir(media)) == ["c1_1.mp4", "c1_2.mp4", "c2_1.mp4"]
+    assert output_usage(database)["tracked_bytes"] == 300
+
+
+def test_uploads_are_never_deleted(database, media, monkeypatch):
+    monkeypatch.setattr(output_store, "OUTPUT_TTL_DAYS", {KIND_TTS: 1})
+    saved = _file(media, "c1/" + "a" * 32 + "_tts_" + "b" * 32 + ".mp3")
+    untracked_upload = _file(media, "c1/" + "c" * 32 + "_logo.png")
+    record_output(saved, KIND_TTS, "c1", database=database)
+    _age(database, media, "c1/" + "a" * 32 + "_tts_" + "b" * 32 + ".mp3", 3)
+    # the user added this TTS file to their media library
+    database.media.insert_one({"file_url": "c1/" + "a" * 32 + "_tts_" + "b" * 32 + ".mp3"})
+
+    evict_outputs(database)
+
+    assert os.path.exists(saved) and os.path.exists(untracked_upload)
+    assert database.generated_outputs.count_documents({}) == 0
+
+
+def test_existing_generated_files_are_adopted(database, media):
+    template_id = "6" * 24
+    database.templates.insert_one({"_id": ObjectId(template_id), "company_id": "c9"})
+    _file(media, f"{template_id}_preview.mp4")
+    _file(media, f"{template_id}_download_{'f' * 16}.jpg")
+    _file(media, "font_cache/abc.ttf")
+    _file(media, "c9/" + "a" * 32 + "_tts_" + "b" * 32 + ".mp3")
+    _file(media, "c9/" + "c" * 32 + "_upload.mp4")
+    _file(media, "0123456789abcdef01234567.mp4")  # a task deliverable
+
+    assert output_store.adopt_untracked_outputs(database) == 4
+    assert output_store.adopt_untracked_outputs(database) == 0
+    usage = output_usage(database)
+    assert usage["by_kind"] == {
+        "preview": {"bytes": 100, "files": 1},
+        "download": {"bytes": 100, "files": 1},
+        "cache": {"bytes": 100, "files": 1},
+        "tts": {"bytes": 100, "files": 1},
+    }
+    assert {c["company_id"] for c in usage["companies"]} == {"c9"}
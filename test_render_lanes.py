@@ -0,0 +1,155 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.worker.lanes import LANE_BATCH, LANE_INTERACTIVE, LaneScheduler
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return
+        time.sleep(0.005)
+    raise AssertionError("condition not reached")
+
+
+def _acquire_async(scheduler, lane, order):
+    def run():
+        scheduler.acquire(lane)
+        order.append(lane)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_batch_cannot_take_reserved_slots():
+    scheduler = LaneScheduler(slots=4, reserved_interactive=1)
+    order = []
+    for _ in range(5):
+        _acquire_async(scheduler, LANE_BATCH, order)
+
+    _wait_for(lambda: scheduler.snapshot()[LANE_BATCH]["waiting"] == 2)
+    assert scheduler.snapshot()[LANE_BATCH]["running"] == 3
+
+    # the preview click gets the reserved slot immediately
+    scheduler.acquire(LANE_INTERACTIVE)
+    stats = scheduler.snapshot()
+    assert stats[LANE_INTERACTIVE]["running"] == 1
+    assert stats[LANE_BATCH]["waiting"] == 2
+
+
+def test_free_slots_are_shared_by_weight():
+    scheduler = LaneScheduler(slots=1, reserved_interactive=0,
+                              weights={LANE_INTERACTIVE: 3, LANE_BATCH: 1})
+    scheduler.acquire(LANE_BATCH)
+
+    order = []
+    for lane in [LANE_BATCH] * 4 + [LANE_INTERACTIVE] * 4:
+        _acquire_async(scheduler, lane, order)
+    _wait_for(lambda: sum(s["waiting"] for s in scheduler.snapshot().values()) == 8)
+
+    for i in range(8):
+        scheduler.release(order[-1] if order else LANE_BATCH)
+        _wait_for(lambda: len(order) == i + 1)
+
+    assert order[:4].count(LANE_INTERACTIVE) == 3
+    assert order[:4].count(LANE_BATCH) == 1
+
+
+def test_unknown_lane_is_rejected():
+    with pytest.raises(ValueError):
+        LaneScheduler(slots=2, reserved_interactive=1).acquire("urgent")
+
+
+def _video_template(duration, videos=0, images=0, texts=0, audio=0, size=(1920, 1080)):
+    items = {}
+    for kind, count in (("video", videos), ("image", images), ("text", texts), ("audio", audio)):
+        for i in range(count):
+            items[f"{kind}{i}"] = {"type": kind, "display": {"from": 0, "to": duration * 1000}}
+    return {
+        "duration": duration,
+        "template_json": {"design": {
+            "size": {"width": size[0], "height": size[1]},
+            "fps": 30,
+            "trackItemsMap": items,
+        }},
+    }
+
+
+def test_cost_grows_with_duration_layers_and_pixels():
+    from app.services.render_cost import estimate_render_cost
+
+    small = estimate_render_cost(_video_template(5, images=1, texts=2))
+    long = estimate_render_cost(_video_template(60, images=1, texts=2))
+    heavy = estimate_render_cost(_video_template(60, videos=4, images=1, texts=2, audio=2))
+    hd = estimate_render_cost(_video_template(60, videos=4, images=1, texts=2, audio=2, size=(1280, 720)))
+
+    assert long["cost"] == pytest.approx(small["cost"] * 12, rel=1e-3)
+    assert heavy["cost"] > long["cost"] * 3
+    assert hd["cost"] < heavy["cost"]
+    assert heavy["layers"] == 7 and heavy["audio_tracks"] == 2
+    # template_json alone estimates the same as the full document
+    assert estimate_render_cost(_video_template(5, images=1)["template_json"] | {"duration": 5})["cost"] == \
+        estimate_render_cost(_video_template(5, images=1))["cost"]
+
+
+def test_batch_is_shortest_job_first():
+    scheduler = LaneScheduler(slots=1, reserved_interactive=0, cores=8)
+    scheduler.acquire(LANE_BATCH)
+
+    order = []
+    for cost in (30000, 1000, 90000, 5000):
+        def run(cost=cost):
+            scheduler.acquire(LANE_BATCH, cost)
+            order.append(cost)
+        threading.Thread(target=run, daemon=True).start()
+    _wait_for(lambda: scheduler.snapshot()[LANE_BATCH]["waiting"] == 4)
+
+    for i in range(4):
+        scheduler.release(LANE_BATCH)
+        _wait_for(lambda: len(order) == i + 1)
+    assert order == [1000, 5000, 30000, 90000]
+
+
+def test_jobs_are_packed_onto_cores_with_threads_by_cost():
+    scheduler = LaneScheduler(slots=8, reserved_interactive=0, cores=8,
+                              threads_for=lambda cost: int(cost))
+    big = scheduler.acquire(LANE_BATCH, 6)
+    assert (big.cores, big.threads) == (6, 6)
+
+    # 3 cores do not fit next to the big job; the 2-core job backfills
+    order = []
+    for cost in (3, 2):
+        threading.Thread(target=lambda c=cost: order.append(scheduler.acquire(LANE_BATCH, c)),
+                         daemon=True).start()
+    _wait_for(lambda: len(order) == 1)
+    assert order[0].threads == 2
+    assert scheduler.snapshot()[LANE_BATCH]["cores_used"] == 8
+
+    scheduler.release(LANE_BATCH, big)
+    _wait_for(lambda: len(order) == 2)
+    assert order[1].threads == 3
+
+
+def test_starving_batch_job_is_not_backfilled():
+    scheduler = LaneScheduler(slots=8, reserved_interactive=0, cores=8, sjf_max_wait=0,
+                              threads_for=lambda cost: int(cost))
+    big = scheduler.acquire(LANE_BATCH, 6)
+    order = []
+    for waiting, cost in enumerate((3, 2), start=1):
+        threading.Thread(target=lambda c=cost: order.append(scheduler.acquire(LANE_BATCH, c)),
+                         daemon=True).start()
+        _wait_for(lambda: scheduler.snapshot()[LANE_BATCH]["waiting"] == waiting)
+    time.sleep(0.05)
+    assert order == []
+
+    scheduler.release(LANE_BATCH, big)
+    _wait_for(lambda: len(order) == 2)
+    assert sorted(grant.threads for grant in order) == [2, 3]
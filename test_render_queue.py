@@ -0,0 +1,232 @@
+import os
+import sys
+import socket
+import subprocess
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+mongomock = pytest.importorskip("mongomock")
+
+from app.worker import render_jobs
+from app.worker.queue import InMemoryBroker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def database():
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def broker(clock):
+    return InMemoryBroker(clock=clock)
+
+
+def _new_task(database):
+    result = database.video_tasks.insert_one({
+        "template_id": "t1",
+        "customer_id": "c1",
+        "status": "pending",
+        "attempts": 0,
+        "created_at": datetime.utcnow(),
+    })
+    return str(result.inserted_id)
+
+
+def _advance(clock, database, now):
+    """Moves the broker clock, and the retry backoffs in Mongo with it."""
+    shift = timedelta(seconds=now - clock.now)
+    for task in database.video_tasks.find({"next_attempt_at": {"$exists": True}}):
+        database.video_tasks.update_one(
+            {"_id": task["_id"]}, {"$set": {"next_attempt_at": task["next_attempt_at"] - shift}}
+        )
+    clock.now = now
+
+
+def _handler(database, broker, render):
+    return lambda task_id: render_jobs.run_render_job(
+        task_id, database=database, enqueue=broker.enqueue, render=render
+    )
+
+
+def test_enqueue_returns_before_rendering(database, broker):
+    task_id = _new_task(database)
+    calls = []
+
+    broker.enqueue(task_id)
+    assert broker.depth() == 1
+    assert calls == []
+    assert database.video_tasks.find_one()["status"] == "pending"
+
+    broker.run_pending(_handler(database, broker, lambda task, db: calls.append(task["_id"]) or "out.mp4"))
+    task = database.video_tasks.find_one()
+    assert task["status"] == "completed"
+    assert task["output_video_url"] == "out.mp4"
+    assert task["attempts"] == 1
+    assert len(calls) == 1
+
+
+def test_duplicate_delivery_renders_once(database, broker):
+    task_id = _new_task(database)
+    calls = []
+    broker.enqueue(task_id)
+    broker.enqueue(task_id)
+
+    ran = broker.run_pending(_handler(database, broker, lambda task, db: calls.append(1) or "out.mp4"))
+    assert ran == 2
+    assert len(calls) == 1
+    assert database.video_tasks.find_one()["attempts"] == 1
+
+
+def test_failures_retry_with_backoff_then_dead_letter(database, broker, clock, monkeypatch):
+    monkeypatch.setattr(render_jobs, "RENDER_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(render_jobs, "RENDER_RETRY_BASE_SECONDS", 10)
+    task_id = _new_task(database)
+
+    def boom(task, db):
+        raise RuntimeError("ffmpeg exploded")
+
+    handler = _handler(database, broker, boom)
+    broker.enqueue(task_id)
+
+    assert broker.run_pending(handler) == 1
+    task = database.video_tasks.find_one()
+    assert task["status"] == "retrying"
+    assert task["error"] == "ffmpeg exploded"
+
+    # first retry is not due before the 10s backoff
+    _advance(clock, database, 9)
+    assert broker.run_pending(handler) == 0
+    _advance(clock, database, 10)
+    assert broker.run_pending(handler) == 1
+    assert database.video_tasks.find_one()["status"] == "retrying"
+
+    # second retry backs off 20s
+    _advance(clock, database, 29)
+    assert broker.run_pending(handler) == 0
+    _advance(clock, database, 30)
+    assert broker.run_pending(handler) == 1
+
+    task = database.video_tasks.find_one()
+    assert task["status"] == "dead_letter"
+    assert task["attempts"] == 3
+    assert broker.depth() == 0
+
+
+def test_early_delivery_does_not_skip_the_backoff(database, broker, clock):
+    task_id = _new_task(database)
+    outcomes = [RuntimeError("transient"), "out.mp4"]
+
+    def flaky(task, db):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    handler = _handler(database, broker, flaky)
+    broker.enqueue(task_id)
+    broker.run_pending(handler)
+
+    # a redelivered copy arrives while the retry is still backing off
+    broker.enqueue(task_id)
+    assert broker.run_pending(handler) == 1
+    task = database.video_tasks.find_one()
+    assert task["status"] == "retrying"
+    assert task["attempts"] == 1
+    # ... and is put back for when it is due, next to the retry message
+    assert broker.depth() == 2
+
+    _advance(clock, database, render_jobs.retry_delay(1))
+    assert broker.run_pending(handler) == 2
+    task = database.video_tasks.find_one()
+    assert task["status"] == "completed"
+    assert task["attempts"] == 2
+
+
+def test_retry_after_failure_can_succeed(database, broker, clock):
+    task_id = _new_task(database)
+    outcomes = [RuntimeError("transient"), "out.mp4"]
+
+    def flaky(task, db):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    handler = _handler(database, broker, flaky)
+    broker.enqueue(task_id)
+    broker.run_pending(handler)
+    _advance(clock, database, render_jobs.retry_delay(1))
+    broker.run_pending(handler)
+
+    task = database.video_tasks.find_one()
+    assert task["status"] == "completed"
+    assert task["attempts"] == 2
+
+
+def test_recover_requeues_unfinished_tasks(database, broker, clock):
+    from app.worker.embedded import recover_tasks
+
+    pending = _new_task(database)
+    orphaned = _new_task(database)
+    done = _new_task(database)
+    database.video_tasks.update_one({"_id": ObjectId(orphaned)}, {"$set": {"status": "processing", "attempts": 1}})
+    database.video_tasks.update_one({"_id": ObjectId(done)}, {"$set": {"status": "completed"}})
+
+    assert recover_tasks(database, broker.enqueue) == 2
+    rendered = []
+    broker.run_pending(_handler(database, broker, lambda task, db: rendered.append(str(task["_id"])) or "out.mp4"))
+
+    assert sorted(rendered) == sorted([pending, orphaned])
+    assert database.video_tasks.count_documents({"status": "completed"}) == 3
+
+
+def test_recover_leaves_tasks_other_processes_are_rendering(database, broker, clock):
+    from app.worker.embedded import recover_tasks
+
+    gone = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    host = socket.gethostname()
+    now = datetime.utcnow()
+    leases = {
+        "sibling": (f"{host}:{os.getppid()}:1", now + timedelta(seconds=30)),
+        "other_node": ("render-2:4242:1", now + timedelta(seconds=30)),
+        "expired": ("render-2:4242:2", now - timedelta(seconds=1)),
+        "dead_process": (f"{host}:{gone.stdout.strip()}:1", now + timedelta(seconds=30)),
+    }
+    ids = {}
+    for name, (owner, expires) in leases.items():
+        ids[name] = _new_task(database)
+        database.video_tasks.update_one({"_id": ObjectId(ids[name])}, {"$set": {
+            "status": "processing", "attempts": 1, "lease_owner": owner, "lease_expires_at": expires,
+        }})
+
+    assert recover_tasks(database, broker.enqueue) == 4
+    status = {name: database.video_tasks.find_one({"_id": ObjectId(i)})["status"] for name, i in ids.items()}
+    assert status == {
+        "sibling": "processing", "other_node": "processing", "expired": "retrying", "dead_process": "retrying",
+    }
+
+    # orphans render now; live leases are only looked at again once they expire
+    rendered = []
+    handler = _handler(database, broker, lambda task, db: rendered.append(str(task["_id"])) or "out.mp4")
+    broker.run_pending(handler)
+    assert sorted(rendered) == sorted([ids["expired"], ids["dead_process"]])
+    assert broker.depth() == 2
@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+import asyncio
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.single_flight import SingleFlight, atomic_output, render_identity, render_once
+
+
+def test_concurrent_requests_share_one_render(tmp_path):
+    output = str(tmp_path / "preview.mp4")
+    calls = []
+    seen_partial = []
+
+    def fake_render(template, out_path):
+        calls.append(out_path)
+        assert out_path != output
+        with open(out_path, "wb") as f:
+            f.write(b"half")
+            time.sleep(0.05)
+            # nobody may observe the final path before the render finished
+            seen_partial.append(os.path.exists(output))
+            f.write(b"-done")
+
+    async def burst():
+        key = render_identity("public_video", "tpl", "cust")
+        return await asyncio.gather(*[
+            render_once(key, output, fake_render, {"t": 1}) for _ in range(20)
+        ])
+
+    results = asyncio.run(burst())
+    assert results == [output] * 20
+    assert len(calls) == 1
+    assert seen_partial == [False]
+    with open(output, "rb") as f:
+        assert f.read() == b"half-done"
+    assert os.listdir(tmp_path) == ["preview.mp4"]
+
+
+def test_followers_receive_the_leaders_error():
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("ffmpeg exited 1")
+
+    async def burst():
+        return await asyncio.gather(*[flight.do("k", failing) for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(burst())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flight.inflight() == 0
+
+
+def test_atomic_output_discards_failed_render(tmp_path):
+    output = str(tmp_path / "out.jpg")
+    with open(output, "w") as f:
+        f.write("previous")
+
+    with pytest.raises(RuntimeError):
+        with atomic_output(output) as tmp:
+            assert tmp.endswith(".jpg")
+            with open(tmp, "w") as f:
+                f.write("partial")
+            raise RuntimeError("render failed")
+
+    assert os.listdir(tmp_path) == ["out.jpg"]
+    with open(output) as f:
+        assert f.read() == "previous"
+
+
+def test_prepare_runs_once_inside_the_flight(tmp_path):
+    output = str(tmp_path / "preview.mp4")
+    template = {"voiceover": None}
+    prepared = []
+
+    async def add_voiceover():
+        prepared.append(1)
+        await asyncio.sleep(0.01)
+        template["voiceover"] = "hello_asha.flac"
+
+    def fake_render(template, out_path):
+        with open(out_path, "w") as f:
+            f.write(template["voiceover"])
+
+    async def burst():
+        key = render_identity("customer_preview", "tpl", "cust")
+        return await asyncio.gather(*[
+            render_once(key, output, fake_render, template, reuse=False, cost=0, prepare=add_voiceover)
+            for _ in range(5)
+        ])
+
+    assert asyncio.run(burst()) == [output] * 5
+    assert prepared == [1]
+    with open(output) as f:
+        assert f.read() == "hello_asha.flac"
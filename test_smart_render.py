@@ -0,0 +1,331 @@
+import os
+import json
+import math
+import array
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import smart_render, video_renderer
+from app.services.smart_render import NotEligible, align_windows, check_eligibility, dynamic_windows
+
+
+@pytest.fixture(autouse=True)
+def gop_one_second(monkeypatch):
+    monkeypatch.setattr(smart_render, "MEZZANINE_GOP_SECONDS", 1.0)
+    monkeypatch.setattr(smart_render, "SMART_RENDER_MAX_DYNAMIC_RATIO", 0.5)
+
+
+def _template(items: dict, duration=4.0, fps=25):
+    """Visuals and audio in dict order, text on the text track."""
+    return {
+        "duration": duration,
+        "template_json": {
+            "design": {
+                "size": {"width": 320, "height": 180},
+                "fps": fps,
+                "trackItemIds": [tid for tid, item in items.items() if item["type"] != "text"],
+                "trackItemsMap": items,
+                "tracks": [{"type": "text", "items": [tid for tid, item in items.items() if item["type"] == "text"]}],
+            }
+        },
+    }
+
+
+def _background(src="clip.mp4", duration=4.0):
+    return {
+        "type": "video",
+        "details": {"src": src, "width": 320, "height": 180, "volume": 0},
+        "display": {"from": 0, "to": duration * 1000},
+    }
+
+
+def _name_text(start_ms, end_ms):
+    return {
+        "type": "text",
+        "details": {"text": "Hi {{customer.name}}", "fontSize": 24, "left": 10, "top": 10, "color": "#ffffff"},
+        "display": {"from": start_ms, "to": end_ms},
+    }
+
+
+def _logo(start_ms, end_ms):
+    return {
+        "type": "image",
+        "details": {"src": "{{company.logo}}", "width": 64, "height": 64},
+        "display": {"from": start_ms, "to": end_ms},
+    }
+
+# ---------------------------------------------------------
+# ELIGIBILITY
+# ---------------------------------------------------------
+
+def test_eligible_template_plans_aligned_windows():
+    plan = check_eligibility(_template({"bg": _background(), "name": _name_text(1200, 1700)}))
+    assert plan["gop_frames"] == 25
+    assert plan["windows"] == [(1.0, 2.0)]
+
+
+def test_static_layer_above_dynamic_layer_is_not_eligible():
+    sticker = {"type": "image", "details": {"src": "sticker.png"}, "display": {"from": 500, "to": 1500}}
+    with pytest.raises(NotEligible, match="drawn above"):
+        check_eligibility(_template({"bg": _background(), "logo": _logo(0, 1000), "sticker": sticker}))
+
+    # static text is painted after every visual
+    caption = {"type": "text", "details": {"text": "Sale"}, "display": {"from": 0, "to": 4000}}
+    with pytest.raises(NotEligible, match="drawn above"):
+        check_eligibility(_template({"bg": _background(), "logo": _logo(0, 1000), "caption": caption}))
+
+    # above it, but never on screen at the same time
+    sticker["display"] = {"from": 2000, "to": 3000}
+    check_eligibility(_template({"bg": _background(), "logo": _logo(0, 1000), "sticker": sticker}))
+
+
+def test_dynamic_video_with_audio_is_not_eligible():
+    clip = {
+        "type": "video",
+        "details": {"src": "{{customer.video}}", "volume": 100},
+        "display": {"from": 0, "to": 1000},
+    }
+    with pytest.raises(NotEligible, match="carries audio"):
+        check_eligibility(_template({"bg": _background(), "clip": clip}))
+
+    clip["details"]["volume"] = 0
+    check_eligibility(_template({"bg": _background(), "clip": clip}))
+
+
+def test_template_under_two_gops_is_not_eligible():
+    items = {"bg": _background(duration=1.5), "name": _name_text(0, 500)}
+    with pytest.raises(NotEligible, match="two mezzanine GOPs"):
+        check_eligibility(_template(items, duration=1.5))
+    check_eligibility(_template({"bg": _background(duration=2.0), "name": _name_text(0, 500)}, duration=2.0))
+
+
+def test_dynamic_ratio_limit_counts_aligned_windows():
+    # exactly half the timeline is still worth it
+    check_eligibility(_template({"bg": _background(), "name": _name_text(0, 2000)}))
+    # 2.1s of text re-encodes three whole GOPs of four
+    with pytest.raises(NotEligible, match="dynamic layers cover 3.0s of 4.0s"):
+        check_eligibility(_template({"bg": _background(), "name": _name_text(0, 2100)}))
+
+# ---------------------------------------------------------
+# WINDOWS
+# ---------------------------------------------------------
+
+def test_align_windows_expands_to_keyframes_and_merges():
+    assert align_windows([(1.2, 1.7)], 1.0, 4.0) == [(1.0, 2.0)]
+    # already on the grid: no extra GOP on either side
+    assert align_windows([(1.0, 2.0)], 1.0, 4.0) == [(1.0, 2.0)]
+    # windows that become adjacent after alignment are joined
+    assert align_windows([(0.2, 0.8), (1.1, 1.5), (3.2, 3.4)], 1.0, 4.0) == [(0.0, 2.0), (3.0, 4.0)]
+    # the last window ends at the template end, not past it
+    assert align_windows([(3.5, 3.9)], 1.0, 3.7) == [(3.0, 3.7)]
+    assert align_windows([(0.5, 0.7)], 0.48, 4.0) == [(0.48, 0.96)]
+
+
+def test_dynamic_windows_merge_overlaps_and_skip_static_layers():
+    design = _template({
+        "bg": _background(),
+        "logo": _logo(500, 1500),
+        "name": _name_text(1200, 2200),
+        "late": _name_text(3000, 3500),
+    })["template_json"]["design"]
+    assert dynamic_windows(design, 4.0) == [(0.5, 2.2), (3.0, 3.5)]
+
+# ---------------------------------------------------------
+# SEGMENTS
+# ---------------------------------------------------------
+
+def test_mezzanine_drops_dynamic_layers_and_keeps_ducking():
+    greeting = {
+        "type": "audio",
+        "details": {"src": "{{customer.greeting}}", "volume": 100},
+        "display": {"from": 1000, "to": 2000},
+    }
+    full = _template({"bg": _background(), "greeting": greeting, "name": _name_text(1200, 1700)})
+    static = smart_render._static_template(full, full["template_json"]["design"])
+    design = static["template_json"]["design"]
+    assert list(design["trackItemsMap"]) == ["bg"]
+    assert design["trackItemIds"] == ["bg"]
+    assert design["tracks"][0]["items"] == []
+    # the full render lowers the background under the voiceover
+    assert static["duck_video_audio"] is True
+
+    plain = _template({"bg": _background(), "name": _name_text(1200, 1700)})
+    assert smart_render._static_template(plain, plain["template_json"]["design"])["duck_video_audio"] is False
+    assert smart_render.mezzanine_key(static, 25, 25) != smart_render.mezzanine_key(
+        {**static, "duck_video_audio": False}, 25, 25
+    )
+
+
+def test_renderer_follows_the_ducking_flag(monkeypatch, tmp_path):
+    commands = []
+
+    def fake_run_ffmpeg(cmd, stage, **kwargs):
+        commands.append(cmd)
+        open(cmd[-1], "wb").close()
+
+    monkeypatch.setattr(video_renderer, "run_ffmpeg", fake_run_ffmpeg)
+    monkeypatch.setattr(video_renderer, "has_audio_stream", lambda src: True)
+    monkeypatch.setattr(video_renderer, "AUDIO_BED_CACHE", False)
+    background = _background()
+    background["details"]["volume"] = 100
+    template = _template({"bg": background})
+
+    for duck, expected in ((None, False), (True, True), (False, False)):
+        if duck is not None:
+            template["duck_video_audio"] = duck
+        video_renderer.render_preview(template, {"customer": {}, "company": {}}, str(tmp_path / "out.mp4"))
+        filters = commands[-1][commands[-1].index("-filter_complex") + 1]
+        assert ("volume=0.400" in filters) is expected
+
+
+def test_segments_tile_the_timeline_on_keyframes(monkeypatch, tmp_path):
+    music = {"type": "audio", "details": {"src": "music.mp3", "volume": 100}, "display": {"from": 0, "to": 6000}}
+    plan = check_eligibility(_template(
+        {"bg": _background(duration=6.0), "music": music, "name": _name_text(1200, 1700), "late": _name_text(4100, 4400)},
+        duration=6.0,
+    ))
+    assert plan["windows"] == [(1.0, 2.0), (4.0, 5.0)]
+
+    segments = []
+    commands = []
+
+    def fake_render_preview(template, context, output_path, **kwargs):
+        window = template["template_json"]["design"]["trackItemsMap"]["__mezzanine__"]["trim"]
+        segments.append(("encode", window["from"] / 1000, window["to"] / 1000))
+        assert kwargs["audio"] is False
+        assert kwargs["extra_output_args"] == smart_render.encoder_args(plan["fps"], plan["gop_frames"])
+        open(output_path, "wb").close()
+
+    def fake_run_ffmpeg(cmd, stage, **kwargs):
+        commands.append((stage, cmd))
+        if stage == "segment_copy":
+            start = float(cmd[cmd.index("-ss") + 1])
+            segments.append(("copy", start, round(start + float(cmd[cmd.index("-t") + 1]), 3)))
+        open(cmd[-1], "wb").close()
+
+    monkeypatch.setattr(smart_render, "get_or_build_mezzanine", lambda plan: "mezz.mp4")
+    monkeypatch.setattr(smart_render, "render_preview", fake_render_preview)
+    monkeypatch.setattr(smart_render, "run_ffmpeg", fake_run_ffmpeg)
+    monkeypatch.setattr(smart_render, "has_audio_stream", lambda src: True)
+    out = str(tmp_path / "out.mp4")
+    smart_render.smart_render(plan, {"customer": {"name": "Asha"}, "company": {}}, out)
+
+    assert segments == [
+        ("copy", 0.0, 1.0), ("encode", 1.0, 2.0), ("copy", 2.0, 4.0), ("encode", 4.0, 5.0), ("copy", 5.0, 6.0),
+    ]
+    copy_cmd = next(cmd for stage, cmd in commands if stage == "segment_copy")
+    assert copy_cmd[copy_cmd.index("-c:v") + 1] == "copy"
+    assert "h264_mp4toannexb" in copy_cmd
+
+    # the static mix is laid back in untouched, for exactly the template length
+    stage, concat_cmd = commands[-1]
+    assert stage == "smart_concat"
+    assert concat_cmd[concat_cmd.index("1:a") - 1:][:4] == ["-map", "1:a", "-c:a", "copy"]
+    assert concat_cmd[concat_cmd.index("-t") + 1] == "6.0"
+    assert os.path.exists(out)
+
+
+def test_failed_smart_render_is_counted_and_falls_back(monkeypatch):
+    template = _template({"bg": _background(), "name": _name_text(1200, 1700)})
+    full = []
+
+    def broken(plan, context, output_path):
+        raise RuntimeError("concat failed")
+
+    monkeypatch.setattr(smart_render, "smart_render", broken)
+    monkeypatch.setattr(smart_render, "render_preview", lambda *args: full.append(args) or args[2])
+    failed = smart_render.SMART_RENDER_FALLBACKS.get(reason="failed")
+    not_eligible = smart_render.SMART_RENDER_FALLBACKS.get(reason="not_eligible")
+
+    assert smart_render.render_preview_smart(template, None, "out.mp4") == "out.mp4"
+    short = _template({"bg": _background(duration=1.5), "name": _name_text(0, 500)}, duration=1.5)
+    assert smart_render.render_preview_smart(short, None, "out.mp4") == "out.mp4"
+    assert len(full) == 2
+    assert smart_render.SMART_RENDER_FALLBACKS.get(reason="failed") == failed + 1
+    assert smart_render.SMART_RENDER_FALLBACKS.get(reason="not_eligible") == not_eligible + 1
+
+# ---------------------------------------------------------
+# FFMPEG
+# ---------------------------------------------------------
+
+def _probe(path: str) -> dict:
+    probe = subprocess.run(
+        ["ffprobe", "-v", "error", "-count_frames",
+         "-show_entries", "stream=codec_type,duration,nb_read_frames", "-of", "json", path],
+        capture_output=True, text=True, check=True,
+    )
+    return {s["codec_type"]: s for s in json.loads(probe.stdout)["streams"]}
+
+
+def _tone_onset(path: str, frequency: float, rate: int = 8000, frame: int = 160) -> float:
+    """Seconds until the tone first reaches half its peak level (Goertzel per 20ms)."""
+    pcm = subprocess.run(
+        ["ffmpeg", "-v", "error", "-i", path, "-map", "0:a", "-ac", "1", "-ar", str(rate), "-f", "s16le", "-"],
+        capture_output=True, check=True,
+    ).stdout
+    samples = array.array("h", pcm)
+    coeff = 2 * math.cos(2 * math.pi * frequency / rate)
+    levels = []
+    for i in range(0, len(samples) - frame, frame):
+        s1 = s2 = 0.0
+        for x in samples[i:i + frame]:
+            s1, s2 = x + coeff * s1 - s2, s1
+        levels.append(s1 * s1 + s2 * s2 - coeff * s1 * s2)
+    peak = max(levels)
+    return next(i for i, level in enumerate(levels) if level >= peak / 4) * frame / rate
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg") or not shutil.which("ffprobe"), reason="ffmpeg not installed")
+def test_smart_render_matches_full_encode(tmp_path, monkeypatch):
+    for cmd in (
+        ["-f", "lavfi", "-i", "testsrc=size=320x180:rate=25:duration=4",
+         "-c:v", "libx264", "-pix_fmt", "yuv420p", "clip.mp4"],
+        ["-f", "lavfi", "-i", "sine=frequency=220:duration=4", "music.mp3"],
+        ["-f", "lavfi", "-i", "sine=frequency=660:duration=1", "hello_asha.mp3"],
+        ["-f", "lavfi", "-i", "color=c=red:s=64x64", "-frames:v", "1", "logo.png"],
+    ):
+        subprocess.run(["ffmpeg", "-y", "-v", "error", *cmd[:-1], str(tmp_path / cmd[-1])], check=True)
+
+    for module in (video_renderer, smart_render):
+        monkeypatch.setattr(module, "MEDIA_ROOT", str(tmp_path))
+    monkeypatch.setattr(smart_render, "MEZZANINE_DIR", str(tmp_path / "mezzanine_cache"))
+    monkeypatch.setattr(video_renderer, "AUDIO_BED_CACHE", False)
+    # no MongoDB here: output bookkeeping is not under test
+    monkeypatch.setattr(smart_render, "record_output", lambda *args, **kwargs: None)
+    monkeypatch.setattr(smart_render, "touch_output", lambda *args, **kwargs: None)
+
+    template = _template({
+        "bg": _background(),
+        "music": {"type": "audio", "details": {"src": "music.mp3", "volume": 100}, "display": {"from": 0, "to": 4000}},
+        "greeting": {
+            "type": "audio",
+            "details": {"src": "{{customer.greeting}}", "volume": 100},
+            "display": {"from": 1000, "to": 2000},
+        },
+        # an overlay rather than text: drawtext options vary across ffmpeg builds
+        "logo": _logo(1200, 1700),
+    })
+    context = {"customer": {"greeting": "hello_asha.mp3"}, "company": {"logo": "logo.png"}}
+    plan = check_eligibility(template)
+    assert plan["windows"] == [(1.0, 2.0)]
+
+    full_out = str(tmp_path / "full.mp4")
+    smart_out = str(tmp_path / "smart.mp4")
+    video_renderer.render_preview(template, context, full_out)
+    # called directly: render_preview_smart would hide a failure behind the full encode
+    smart_render.smart_render(plan, context, smart_out)
+
+    full, smart = _probe(full_out), _probe(smart_out)
+    assert int(smart["video"]["nb_read_frames"]) == int(full["video"]["nb_read_frames"]) == 100
+    assert float(smart["video"]["duration"]) == pytest.approx(float(full["video"]["duration"]), abs=0.05)
+    assert float(smart["audio"]["duration"]) == pytest.approx(float(full["audio"]["duration"]), abs=0.05)
+    assert float(smart["audio"]["duration"]) == pytest.approx(4.0, abs=0.1)
+    # the remixed voiceover starts where the full encode puts it
+    assert _tone_onset(smart_out, 660) == pytest.approx(_tone_onset(full_out, 660), abs=0.02)
+    assert _tone_onset(smart_out, 660) == pytest.approx(1.0, abs=0.05)
@@ -0,0 +1,70 @@
+import os
+import sys
+import asyncio
+import hashlib
+from io import BytesIO
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import storage
+from app.services.storage import save_upload_file, stream_upload
+
+
+@pytest.fixture(autouse=True)
+def media_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "LOCAL_MEDIA_ROOT", str(tmp_path))
+    monkeypatch.setattr(storage, "UPLOAD_CHUNK_BYTES", 1024)
+    return tmp_path
+
+
+def _upload(data: bytes, size=None) -> UploadFile:
+    return UploadFile(filename="clip.mp4", file=BytesIO(data), size=size)
+
+
+class _CountingFile(BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.largest_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.largest_read = max(self.largest_read, len(chunk))
+        return chunk
+
+
+def test_upload_is_streamed_in_chunks_and_hashed(media_root):
+    data = os.urandom(10_000)
+    source = _CountingFile(data)
+    stored = asyncio.run(stream_upload(UploadFile(filename="clip.mp4", file=source), "co1"))
+
+    assert stored["size"] == len(data)
+    assert stored["sha256"] == hashlib.sha256(data).hexdigest()
+    assert (media_root / stored["path"]).read_bytes() == data
+    assert source.largest_read == 1024
+    assert os.listdir(media_root / "co1") == [os.path.basename(stored["path"])]
+
+
+def test_save_upload_file_keeps_its_tuple(media_root):
+    path, size = asyncio.run(save_upload_file(_upload(b"abc"), "co1"))
+    assert path.startswith("co1/") and path.endswith("_clip.mp4")
+    assert size == 3
+
+
+def test_oversized_upload_is_refused_and_leaves_nothing(media_root):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(stream_upload(_upload(os.urandom(5000)), "co1", max_bytes=4096))
+    assert exc.value.status_code == 413
+    assert os.listdir(media_root / "co1") == []
+
+
+def test_declared_size_is_refused_before_reading(media_root):
+    source = _CountingFile(b"x" * 10)
+    upload = UploadFile(filename="clip.mp4", file=source, size=10_000)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(stream_upload(upload, "co1", max_bytes=4096))
+    assert exc.value.status_code == 413
+    assert source.largest_read == 0
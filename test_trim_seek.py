@@ -0,0 +1,133 @@
+import os
+import re
+import json
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import video_renderer
+from app.services.render_helper import item_seek_window, seek_input_args
+
+
+def _template(clip_src, music_src, duration=6.0):
+    """Base clip shown 1s-5s from 40s into the source, music trimmed from 12s."""
+    return {
+        "duration": duration,
+        "template_json": {
+            "design": {
+                "size": {"width": 320, "height": 180},
+                "fps": 25,
+                "trackItemIds": ["clip", "music"],
+                "trackItemsMap": {
+                    "clip": {
+                        "type": "video",
+                        "details": {"src": clip_src, "width": 320, "height": 180},
+                        "display": {"from": 1000, "to": 5000},
+                        "trim": {"from": 40000, "to": 44000},
+                    },
+                    "music": {
+                        "type": "audio",
+                        "details": {"src": music_src, "volume": 100},
+                        "display": {"from": 0, "to": 6000},
+                        "trim": {"from": 12000},
+                    },
+                },
+                "tracks": [],
+            }
+        },
+    }
+
+
+def _capture_cmd(monkeypatch, tmp_path, template, has_audio=True):
+    captured = {}
+
+    def fake_run(cmd, check=True, **kwargs):
+        captured["cmd"] = cmd
+        open(cmd[-1], "wb").close()
+        return subprocess.CompletedProcess(cmd, 0)
+
+    monkeypatch.setattr(video_renderer, "AUDIO_BED_CACHE", False)
+    monkeypatch.setattr(video_renderer, "has_audio_stream", lambda src: has_audio)
+    monkeypatch.setattr(video_renderer.subprocess, "run", fake_run)
+    video_renderer.render_preview(template, {"customer": {}, "company": {}}, str(tmp_path / "out.mp4"))
+    return captured["cmd"]
+
+
+def test_seek_window_uses_trim_and_display():
+    item = {"display": {"from": 1000, "to": 5000}, "trim": {"from": 40000, "to": 60000}}
+    assert item_seek_window(item, 10) == (40.0, 4.0)
+
+    # trim shorter than the display window limits the decoded range
+    item = {"display": {"from": 0, "to": 5000}, "trim": {"from": 2000, "to": 3500}}
+    assert item_seek_window(item, 10) == (2.0, 1.5)
+
+    # no trim: decode from the start for the display window only
+    item = {"display": {"from": 3000}}
+    assert item_seek_window(item, 10) == (0.0, 7.0)
+
+    assert seek_input_args(0.0, 7.0) == ["-t", "7.000"]
+    assert seek_input_args(40.0, 4.0) == ["-ss", "40.000", "-t", "4.000"]
+
+
+def test_render_seeks_inputs_without_moving_the_timeline(monkeypatch, tmp_path):
+    cmd = _capture_cmd(monkeypatch, tmp_path, _template("media/clip.mp4", "media/music.mp3"))
+    filters = cmd[cmd.index("-filter_complex") + 1]
+
+    clip_i = cmd.index("media/clip.mp4")
+    assert cmd[clip_i - 5:clip_i] == ["-ss", "40.000", "-t", "4.000", "-i"]
+    music_i = cmd.index("media/music.mp3")
+    assert cmd[music_i - 5:music_i] == ["-ss", "12.000", "-t", "6.000", "-i"]
+
+    # Picture still lands on the timeline at display.from
+    assert "setpts=PTS-STARTPTS+1.0/TB" in filters
+    assert "enable='between(t,1.0,5.0)'" in filters
+
+    # Audio no longer trims from the source start; placement is unchanged
+    assert "[0:a]atrim=start=0.0:duration=4.0" in filters
+    assert "adelay=1000|1000" in filters
+    assert "[1:a]atrim=start=0.0:duration=6.0" in filters
+    assert "adelay=0|0" in filters
+
+    # The absolute source range equals what atrim selected before seeking
+    for src, trim_from, pattern in (
+        ("media/clip.mp4", 40.0, r"\[0:a\]atrim=start=([\d.]+)"),
+        ("media/music.mp3", 12.0, r"\[1:a\]atrim=start=([\d.]+)"),
+    ):
+        i = cmd.index(src)
+        ss = float(cmd[i - 4]) if cmd[i - 5] == "-ss" else 0.0
+        atrim_start = float(re.search(pattern, filters).group(1))
+        assert ss + atrim_start == pytest.approx(trim_from)
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg") or not shutil.which("ffprobe"), reason="ffmpeg not installed")
+def test_rendered_duration_matches_template(tmp_path, monkeypatch):
+    clip = str(tmp_path / "clip.mp4")
+    music = str(tmp_path / "music.mp3")
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", "testsrc=size=320x180:rate=25:duration=50",
+        "-f", "lavfi", "-i", "sine=frequency=440:duration=50",
+        "-shortest", "-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "aac", clip,
+    ], check=True)
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", "sine=frequency=220:duration=30", music,
+    ], check=True)
+
+    monkeypatch.setattr(video_renderer, "MEDIA_ROOT", str(tmp_path))
+    monkeypatch.setattr(video_renderer, "AUDIO_BED_CACHE", False)
+    out = str(tmp_path / "out.mp4")
+    video_renderer.render_preview(_template("clip.mp4", "music.mp3"), {"customer": {}, "company": {}}, out)
+
+    probe = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "stream=codec_type,duration", "-of", "json", out],
+        capture_output=True, text=True, check=True,
+    )
+    streams = {s["codec_type"]: float(s["duration"]) for s in json.loads(probe.stdout)["streams"]}
+    assert streams["video"] == pytest.approx(6.0, abs=0.1)
+    assert streams["audio"] == pytest.approx(6.0, abs=0.1)
@@ -0,0 +1,109 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+mongomock = pytest.importorskip("mongomock")
+
+from app.services import tts_cache
+from app.services.tts_cache import evict_tts_cache, lookup_tts, store_tts, tts_cache_key
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(tts_cache, "MEDIA_ROOT", str(tmp_path))
+    monkeypatch.setattr(tts_cache, "TTS_CACHE_DIR", str(tmp_path / "tts_cache"))
+    return mongomock.MongoClient().db
+
+
+def test_key_covers_text_voice_speed_and_model(monkeypatch):
+    key = tts_cache_key("Hello Asha", "af_heart", 1.0)
+    assert key == tts_cache_key("Hello Asha", "af_heart", 1.0000001)
+    assert key != tts_cache_key("Hello Ravi", "af_heart", 1.0)
+    assert key != tts_cache_key("Hello Asha", "bf_emma", 1.0)
+    assert key != tts_cache_key("Hello Asha", "af_heart", 1.25)
+    assert key == tts_cache_key("Hello Asha", "af_heart", 1.0, "mp3")
+    assert key != tts_cache_key("Hello Asha", "af_heart", 1.0, "flac")
+    monkeypatch.setattr(tts_cache, "TTS_MODEL_VERSION", "kokoro-next")
+    assert key != tts_cache_key("Hello Asha", "af_heart", 1.0)
+
+
+def test_stored_audio_is_returned_without_synthesis(database, tmp_path):
+    key = tts_cache_key("Hello Asha", "af_heart", 1.0)
+    assert lookup_tts(key, database) is None
+
+    stored = store_tts(key, b"ID3audio", "mp3", voice="af_heart", speed=1.0, chars=10, database=database)
+    assert stored == {"file_url": f"tts_cache/{key}.mp3", "size": 8, "ext": "mp3"}
+    assert lookup_tts(key, database) == stored
+    assert database.tts_cache.find_one({"_id": key})["hits"] == 1
+
+    # a file deleted behind the cache's back is a miss, not a broken render
+    os.remove(tmp_path / stored["file_url"])
+    assert lookup_tts(key, database) is None
+    assert database.tts_cache.count_documents({}) == 0
+
+
+def test_eviction_keeps_recently_used_entries_within_budget(database, tmp_path, monkeypatch):
+    monkeypatch.setattr(tts_cache, "TTS_CACHE_BUDGET_BYTES", 250)
+    keys = [tts_cache_key(f"line {i}", "af_heart", 1.0) for i in range(3)]
+    for i, key in enumerate(keys):
+        store_tts(key, b"x" * 100, "mp3", voice="af_heart", speed=1.0, chars=6, database=database)
+        database.tts_cache.update_one(
+            {"_id": key}, {"$set": {"last_access_at": datetime.utcnow() - timedelta(hours=10 - i)}}
+        )
+    lookup_tts(keys[0], database)  # used just now
+
+    assert evict_tts_cache(database) == 1
+    assert lookup_tts(keys[1], database) is None
+    assert lookup_tts(keys[0], database) is not None
+    assert lookup_tts(keys[2], database) is not None
+
+
+def test_eviction_spares_entries_inside_the_grace_window(database, monkeypatch):
+    monkeypatch.setattr(tts_cache, "TTS_CACHE_BUDGET_BYTES", 150)
+    monkeypatch.setattr(tts_cache, "OUTPUT_EVICT_GRACE_SECONDS", 600)
+    old, fresh = tts_cache_key("old line", "af_heart", 1.0), tts_cache_key("fresh line", "af_heart", 1.0)
+    for key, age in ((old, timedelta(hours=1)), (fresh, timedelta(minutes=5))):
+        store_tts(key, b"x" * 100, "mp3", voice="af_heart", speed=1.0, chars=6, database=database)
+        database.tts_cache.update_one({"_id": key}, {"$set": {"last_access_at": datetime.utcnow() - age}})
+
+    # over budget either way, but a render may be about to read the fresh one
+    assert evict_tts_cache(database) == 1
+    assert lookup_tts(old, database) is None
+    assert evict_tts_cache(database) == 0
+    assert lookup_tts(fresh, database) is not None
+
+
+def test_entry_that_cannot_be_deleted_is_skipped(database, monkeypatch):
+    monkeypatch.setattr(tts_cache, "TTS_CACHE_BUDGET_BYTES", 0)
+    key = tts_cache_key("busy line", "af_heart", 1.0)
+    store_tts(key, b"x" * 100, "mp3", voice="af_heart", speed=1.0, chars=6, database=database)
+    database.tts_cache.update_one({"_id": key}, {"$set": {"last_access_at": datetime.utcnow() - timedelta(hours=1)}})
+
+    def in_use(path):
+        raise PermissionError(32, "file is being used by another process")
+
+    monkeypatch.setattr(tts_cache.os, "remove", in_use)
+    assert evict_tts_cache(database) == 0
+    assert database.tts_cache.count_documents({"_id": key}) == 1
+
+
+def test_quantized_model_has_its_own_version(monkeypatch):
+    monkeypatch.delenv("TTS_QUANTIZE", raising=False)
+    plain = tts_cache._model_version()
+    monkeypatch.setenv("TTS_QUANTIZE", "int8")
+    assert tts_cache._model_version() == f"{plain}+int8"
+
+
+def test_split_pattern_has_its_own_version(monkeypatch):
+    monkeypatch.delenv("TTS_QUANTIZE", raising=False)
+    monkeypatch.delenv("TTS_SPLIT_PATTERN", raising=False)
+    plain = tts_cache._model_version()
+    monkeypatch.setenv("TTS_SPLIT_PATTERN", tts_cache.KOKORO_SPLIT_PATTERN)
+    assert tts_cache._model_version() == plain
+    monkeypatch.setenv("TTS_SPLIT_PATTERN", r"(?<=[.!?])\s+")
+    assert tts_cache._model_version().startswith(f"{plain}+split-")
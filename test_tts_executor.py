@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.tts_executor import TTSExecutor, inline_tts
+from app.utils.metrics import CACHE_REQUESTS, record_cache
+
+
+def _slow_pid(seconds):
+    time.sleep(seconds)
+    record_cache("tts_test", True)
+    return os.getpid()
+
+
+def _count(channel, n, fail=False):
+    for i in range(n):
+        channel.put(i)
+    if fail:
+        raise HTTPException(500, "No audio chunks produced")
+
+
+def _count_slowly(channel, n):
+    for i in range(n):
+        channel.put(i)
+        time.sleep(0.1)
+
+
+async def _collect(stream):
+    items = []
+    try:
+        async for item in stream:
+            items.append(item)
+    except HTTPException as e:
+        items.append(e.status_code)
+    return items
+
+
+def _fail():
+    raise HTTPException(400, "Text cannot be empty")
+
+
+@pytest.fixture
+def executor():
+    executor = TTSExecutor(workers=1, queue_size=1, initializer=None)
+    yield executor
+    executor.shutdown()
+
+
+def test_runs_in_pool_and_merges_child_metrics(executor):
+    before = CACHE_REQUESTS.get(cache="tts_test", result="hit")
+    pid = asyncio.run(executor.run(_slow_pid, 0))
+    assert pid != os.getpid()
+    assert CACHE_REQUESTS.get(cache="tts_test", result="hit") == before + 1
+    assert executor.in_flight == 0
+
+
+def test_full_queue_is_refused(executor):
+    async def burst():
+        return await asyncio.gather(*(executor.run(_slow_pid, 0.5) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(burst())
+    refused = [r for r in results if isinstance(r, HTTPException)]
+    assert len(refused) == 1 and refused[0].status_code == 503
+    assert executor.in_flight == 0
+
+
+def test_child_http_errors_keep_their_status(executor):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(executor.run(_fail))
+    assert exc.value.status_code == 400
+
+
+def test_inline_runs_in_this_process(executor):
+    with inline_tts():
+        assert asyncio.run(executor.run(_slow_pid, 0)) == os.getpid()
+    assert executor._pool is None
+
+
+def test_stream_yields_items_from_the_pool(executor):
+    assert asyncio.run(_collect(executor.stream(_count, 3))) == [0, 1, 2]
+    assert asyncio.run(_collect(executor.stream(_count, 2, True))) == [0, 1, 500]
+    assert executor.in_flight == 0
+
+
+def test_stream_inline(executor):
+    with inline_tts():
+        assert asyncio.run(_collect(executor.stream(_count, 2, True))) == [0, 1, 500]
+
+
+def test_disconnected_stream_holds_its_slot_until_the_child_stops(executor):
+    async def first_item():
+        stream = executor.stream(_count_slowly, 100)
+        item = await stream.__anext__()
+        await stream.aclose()
+        return item
+
+    assert asyncio.run(first_item()) == 0
+    # the child is still between puts: its request still counts
+    assert executor.in_flight == 1
+    deadline = time.monotonic() + 5
+    while executor.in_flight and time.monotonic() < deadline:
+        time.sleep(0.05)
+    # released well before the 10s the child would take to put every item
+    assert executor.in_flight == 0
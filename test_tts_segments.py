@@ -0,0 +1,91 @@
+import os
+import sys
+import asyncio
+from functools import partial
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import tts, tts_cache
+from app.services.render_context import voiceover_segments
+
+CONTEXT = {
+    "customer": {"full_name": "Asha", "city": "Pune"},
+    "company": {"company_name": "Acme"},
+}
+
+
+def test_company_placeholders_stay_static():
+    script = (
+        "Hello {{customer.full_name}}! Welcome to {{company.company_name}}'s anniversary sale. "
+        "Everything is half price this week. See you in {{customer.city}}."
+    )
+    assert voiceover_segments(script, CONTEXT) == [
+        "Hello Asha!",
+        "Welcome to Acme's anniversary sale. Everything is half price this week.",
+        "See you in Pune.",
+    ]
+
+
+def test_static_segments_match_across_customers():
+    script = "Hi {{full_name}}. Thanks for shopping with us."
+    other = {**CONTEXT, "customer": {"full_name": "Ravi"}}
+    assert voiceover_segments(script, CONTEXT)[1] == voiceover_segments(script, other)[1]
+
+
+def test_customer_clauses_are_cut_from_static_ones():
+    script = "Hi {{full_name}}, welcome to our store. We saved your sizes; thanks for shopping with us, {{full_name}}."
+    assert voiceover_segments(script, CONTEXT) == [
+        "Hi Asha,",
+        "welcome to our store. We saved your sizes; thanks for shopping with us,",
+        "Asha.",
+    ]
+
+
+def test_static_prefix_and_suffix_come_from_the_cache(tmp_path, monkeypatch):
+    mongomock = pytest.importorskip("mongomock")
+    database = mongomock.MongoClient().db
+    monkeypatch.setattr(tts_cache, "MEDIA_ROOT", str(tmp_path))
+    monkeypatch.setattr(tts_cache, "TTS_CACHE_DIR", str(tmp_path / "tts_cache"))
+    monkeypatch.setattr(tts, "lookup_tts", partial(tts_cache.lookup_tts, database=database))
+    monkeypatch.setattr(tts, "store_tts", partial(tts_cache.store_tts, database=database))
+    synthesized = []
+
+    async def synthesize(voisetext, voice, speed, ext):
+        synthesized.append(voisetext)
+        return voisetext.encode(), ext
+
+    async def run(fn, paths, ext):
+        return b"joined", ext
+
+    monkeypatch.setattr(tts.tts_executor, "synthesize", synthesize)
+    monkeypatch.setattr(tts.tts_executor, "run", run)
+
+    script = "Welcome to {{company.company_name}}, {{full_name}}. Your offer is ready, and it ends on Sunday."
+    for customer in ("Asha", "Ravi"):
+        context = {**CONTEXT, "customer": {"full_name": customer}}
+        segments = voiceover_segments(script, context)
+        asyncio.run(tts.synthesize_composed(segments=segments, voice="af_heart", speed=1.0, ext="wav"))
+
+    assert synthesized == [
+        "Welcome to Acme,",
+        "Asha.",
+        "Your offer is ready, and it ends on Sunday.",
+        "Ravi.",
+    ]
+
+
+def test_crossfade_overlaps_each_seam():
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("torch")
+    from app.services.kokoro_tts import crossfade_concat
+
+    a = np.ones(1000, dtype=np.float32)
+    b = np.zeros(1000, dtype=np.float32)
+    joined = crossfade_concat([a, b], samplerate=1000, crossfade_ms=100)
+    assert len(joined) == 1900
+    assert joined[899] == pytest.approx(1.0)
+    assert joined[1000] == pytest.approx(0.0)
+    assert 0.0 < joined[950] < 1.0
@@ -0,0 +1,52 @@
+import os
+import time
+
+import pytest
+
+from app.services import workspace
+from app.services.workspace import RenderWorkspace, sweep_stale_workspaces
+
+
+def test_workspace_removed_on_error(tmp_path):
+    with pytest.raises(RuntimeError):
+        with RenderWorkspace(root=str(tmp_path)) as ws:
+            scratch = ws.dir
+            ws.write_text("hello")
+            raise RuntimeError("ffmpeg failed")
+    assert not os.path.exists(scratch)
+
+
+def test_promote_across_directories(tmp_path, monkeypatch):
+    dest = tmp_path / "out" / "video.mp4"
+    with RenderWorkspace(root=str(tmp_path / "scratch")) as ws:
+        src = ws.path("output.mp4")
+        with open(src, "wb") as f:
+            f.write(b"data")
+
+        # simulate tmpfs -> disk, where rename raises EXDEV
+        real_replace = os.replace
+
+        def replace(a, b):
+            if a == src:
+                raise OSError(18, "Invalid cross-device link")
+            return real_replace(a, b)
+
+        monkeypatch.setattr(workspace.os, "replace", replace)
+        ws.promote(src, str(dest))
+
+    assert dest.read_bytes() == b"data"
+    assert os.listdir(dest.parent) == ["video.mp4"]
+
+
+def test_sweep_only_removes_stale_workspaces(tmp_path):
+    stale = tmp_path / "autovid_render_old"
+    fresh = tmp_path / "autovid_render_new"
+    other = tmp_path / "unrelated"
+    for d in (stale, fresh, other):
+        d.mkdir()
+    old = time.time() - 3600
+    os.utime(stale, (old, old))
+    os.utime(other, (old, old))
+
+    assert sweep_stale_workspaces(str(tmp_path), max_age=60) == 1
+    assert sorted(os.listdir(tmp_path)) == ["autovid_render_new", "unrelated"]